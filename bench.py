@@ -0,0 +1,590 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from minidb import MiniDB
+from minidb.client import Client
+from minidb.parser import ParseCache, parse
+from minidb.server import MiniDBServer
+from minidb.storage import Column, Table, _coerce_value
+
+
+BILL_COLUMNS = [
+    Column("id", "INT", primary=True),
+    Column("user_id", "INT"),
+    Column("description", "STRING"),
+    Column("amount", "FLOAT"),
+    Column("due_date", "STRING"),
+    Column("status", "STRING"),
+]
+
+
+def _bills(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "user_id": i % 50,
+            "description": f"Bill {i}",
+            "amount": round(rnd.uniform(1, 500), 2),
+            "due_date": f"2026-{i % 12 + 1:02d}-01",
+            "status": rnd.choice(["paid", "unpaid", "pending"]),
+        }
+        for i in range(n)
+    ]
+
+
+def _interpreted_match(schema: Dict[str, str], row: Dict[str, Any], where: List[Tuple[str, str, Any]]) -> bool:
+    for col, op, val in where:
+        if col not in schema:
+            raise KeyError(col)
+        left = row.get(col)
+        right = _coerce_value(val, schema[col])
+        if op == "=":
+            ok = left == right
+        elif op == ">":
+            ok = left is not None and right is not None and left > right
+        else:
+            ok = left is not None and right is not None and left < right
+        if not ok:
+            return False
+    return True
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> Tuple[float, Any]:
+    best: Optional[float] = None
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best or 0.0, out
+
+
+def bench_where(rows: int, repeat: int) -> None:
+    table = Table("bills", BILL_COLUMNS, persistence_dir=".", existing_rows=_bills(rows))
+    cases = [
+        ("status = 'paid'", [("status", "=", "paid")]),
+        ("amount > 250", [("amount", ">", 250)]),
+        ("amount > 100 AND user_id = 7", [("amount", ">", 100), ("user_id", "=", "7")]),
+    ]
+    print(f"WHERE full scan over {rows} rows (best of {repeat})")
+    for label, where in cases:
+        live = table._rows
+
+        def interpreted() -> List[int]:
+            return [i for i, r in enumerate(live) if r is not None and _interpreted_match(table.schema, r, where)]
+
+        def compiled() -> List[int]:
+            return table._matching_positions(where)
+
+        t_old, old = _time(interpreted, repeat)
+        t_new, new = _time(compiled, repeat)
+        assert old == new, label
+        print(
+            f"  {label:32s} interpreted {rows / t_old / 1e6:6.2f} Mrows/s"
+            f"  compiled {rows / t_new / 1e6:6.2f} Mrows/s  speedup {t_old / t_new:4.1f}x"
+        )
+
+
+def bench_memory(rows: int) -> None:
+    # Bytes per row a table holds, traced with tracemalloc from an empty table through
+    # insert_many: the row store, and the PRIMARY KEY index on top of it.
+    print(f"memory of {rows} bills rows (tracemalloc)")
+    for layout in ("row", "columnar"):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            table = Table("bills", BILL_COLUMNS, persistence_dir=".", layout=layout)
+            base = tracemalloc.get_traced_memory()[0]
+            source = _bills(rows)
+            table.insert_many(source)
+            del source
+            gc.collect()
+            total = tracemalloc.get_traced_memory()[0] - base
+            table._indexes = {}
+            gc.collect()
+            store = tracemalloc.get_traced_memory()[0] - base
+        finally:
+            tracemalloc.stop()
+        print(
+            f"  {layout:8s} {total / rows:6.0f} B/row  rows {store / rows:6.0f}  "
+            f"primary key index {(total - store) / rows:6.0f}"
+        )
+        del table
+
+
+def bench_join(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MiniDB(tmp, enable_auth=False)
+        db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+        db.execute("CREATE TABLE payments (id INT PRIMARY, user_id INT, bill_id INT, amount FLOAT, payment_date STRING)")
+        bills = db.catalog.get_table("bills")
+        payments = db.catalog.get_table("payments")
+        for row in _bills(rows):
+            bills.insert(row)
+        rnd = random.Random(11)
+        for i in range(rows):
+            payments.insert(
+                {"id": i, "user_id": i % 50, "bill_id": rnd.randrange(rows), "amount": 10.0, "payment_date": "2026-01-01"}
+            )
+
+        print(f"JOIN bills x payments, {rows} rows each (best of {repeat})")
+        for label, sql in [
+            ("hash join", "SELECT * FROM bills JOIN payments ON id = bill_id"),
+            ("index nested-loop", "SELECT * FROM payments JOIN bills ON bill_id = id WHERE amount > 5"),
+        ]:
+            elapsed, out = _time(lambda: db.execute(sql), repeat)
+            print(f"  {label:20s} {len(out):8d} rows  {elapsed:.3f}s")
+        db.close(checkpoint=False)
+
+
+def bench_order(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MiniDB(tmp, enable_auth=False)
+        db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+        bills = db.catalog.get_table("bills")
+        for row in _bills(rows):
+            bills.insert(row)
+
+        print(f"ORDER BY / LIMIT over {rows} rows (best of {repeat})")
+        cases = [
+            ("full sort + slice", lambda: sorted(bills.select(), key=lambda r: r["amount"], reverse=True)[:10]),
+            ("top-k heap", lambda: db.execute("SELECT * FROM bills ORDER BY amount DESC LIMIT 10")),
+            ("plain LIMIT", lambda: db.execute("SELECT * FROM bills LIMIT 10")),
+        ]
+        for label, fn in cases:
+            elapsed, _out = _time(fn, repeat)
+            print(f"  {label:20s} {elapsed * 1000:9.2f} ms")
+        db.execute("CREATE INDEX bills_amount ON bills (amount) USING BTREE")
+        elapsed, _out = _time(lambda: db.execute("SELECT * FROM bills ORDER BY amount DESC LIMIT 10"), repeat)
+        print(f"  {'btree index order':20s} {elapsed * 1000:9.2f} ms")
+        db.close(checkpoint=False)
+
+
+def bench_group(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MiniDB(tmp, enable_auth=False)
+        db.execute("CREATE TABLE payments (id INT PRIMARY, user_id INT, bill_id INT, amount FLOAT, payment_date STRING)")
+        payments = db.catalog.get_table("payments")
+        rnd = random.Random(5)
+        for i in range(rows):
+            payments.insert(
+                {"id": i, "user_id": i % 50, "bill_id": rnd.randrange(rows // 10), "amount": 10.0, "payment_date": "2026-01-01"}
+            )
+
+        def python_loop() -> Dict[int, float]:
+            totals: Dict[int, float] = {}
+            for p in db.execute("SELECT * FROM payments"):
+                totals[p["bill_id"]] = totals.get(p["bill_id"], 0.0) + p["amount"]
+            return totals
+
+        def group_by() -> Dict[int, float]:
+            out = db.execute("SELECT bill_id, SUM(amount) AS paid FROM payments GROUP BY bill_id")
+            return {r["bill_id"]: r["paid"] for r in out}
+
+        print(f"SUM(amount) per bill over {rows} payments (best of {repeat})")
+        t_old, old = _time(python_loop, repeat)
+        t_new, new = _time(group_by, repeat)
+        assert old == new
+        print(f"  select + python loop {t_old * 1000:9.2f} ms")
+        print(f"  GROUP BY             {t_new * 1000:9.2f} ms  speedup {t_old / t_new:4.1f}x")
+        db.close(checkpoint=False)
+
+
+def bench_parse(rows: int, repeat: int) -> None:
+    statements = [
+        f"SELECT * FROM bills WHERE id={i % 500};" if i % 3 else f"UPDATE bills SET status='paid' WHERE id={i % 500};"
+        for i in range(rows)
+    ]
+    cache = ParseCache()
+    print(f"parse {rows} web-demo style statements (best of {repeat})")
+    t_old, _ = _time(lambda: [parse(sql) for sql in statements], repeat)
+    t_new, _ = _time(lambda: [cache.parse(sql) for sql in statements], repeat)
+    print(f"  parse()            {rows / t_old / 1e3:8.1f} kstmt/s")
+    print(f"  ParseCache.parse() {rows / t_new / 1e3:8.1f} kstmt/s  speedup {t_old / t_new:4.1f}x  {cache.stats()}")
+
+
+def bench_prepared(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MiniDB(tmp, enable_auth=False)
+        db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+        bills = db.catalog.get_table("bills")
+        for row in _bills(500):
+            bills.insert(row)
+        ids = [i % 500 for i in range(rows)]
+        by_id = db.prepare("SELECT * FROM bills WHERE id = ?")
+
+        print(f"{rows} point lookups (best of {repeat})")
+        t_old, old = _time(lambda: [db.execute(f"SELECT * FROM bills WHERE id={i};") for i in ids], repeat)
+        t_new, new = _time(lambda: [by_id.execute((i,)) for i in ids], repeat)
+        assert old == new
+        print(f"  MiniDB.execute(sql)       {rows / t_old / 1e3:8.1f} kstmt/s")
+        print(f"  PreparedStatement.execute {rows / t_new / 1e3:8.1f} kstmt/s  speedup {t_old / t_new:4.1f}x")
+        db.close(checkpoint=False)
+
+
+def bench_insert(rows: int, repeat: int) -> None:
+    data = [(b["id"], b["user_id"], b["description"], b["amount"], b["due_date"], b["status"]) for b in _bills(rows)]
+    sql = "INSERT INTO bills (id, user_id, description, amount, due_date, status) VALUES (?, ?, ?, ?, ?, ?)"
+
+    def load(batch: bool) -> float:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = MiniDB(tmp, enable_auth=False)
+            db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+            start = time.perf_counter()
+            if batch:
+                db.executemany(sql, data)
+            else:
+                stmt = db.prepare(sql)
+                for params in data:
+                    stmt.execute(params)
+            db.checkpoint()
+            elapsed = time.perf_counter() - start
+            db.close(checkpoint=False)
+            return elapsed
+
+    print(f"load {rows} rows incl. checkpoint (best of {repeat})")
+    t_old = min(load(False) for _ in range(repeat))
+    t_new = min(load(True) for _ in range(repeat))
+    print(f"  row-at-a-time INSERT {rows / t_old / 1e3:8.1f} krows/s")
+    print(f"  executemany          {rows / t_new / 1e3:8.1f} krows/s  speedup {t_old / t_new:4.1f}x")
+
+
+def bench_copy(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/bills.csv"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("id,user_id,description,amount,due_date,status\n")
+            for b in _bills(rows):
+                f.write(f"{b['id']},{b['user_id']},{b['description']},{b['amount']},{b['due_date']},{b['status']}\n")
+
+        def load(i: int) -> float:
+            db = MiniDB(f"{tmp}/db{i}", enable_auth=False, copy_dir=tmp)
+            db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+            db.execute("CREATE INDEX bills_user_id ON bills (user_id)")
+            start = time.perf_counter()
+            assert db.execute("COPY bills FROM 'bills.csv'") == rows
+            elapsed = time.perf_counter() - start
+            db.close(checkpoint=False)
+            return elapsed
+
+        print(f"COPY {rows} CSV rows into an indexed table, incl. writing the table file (best of {repeat})")
+        best = min(load(i) for i in range(repeat))
+        print(f"  COPY FROM {best:7.2f} s  {rows / best / 1e3:8.1f} krows/s")
+
+
+def _check_indexes(table: Table) -> None:
+    # Rebuilding from the rows must reproduce the incrementally maintained indexes.
+    unique = {col: dict(index) for col, index in table._indexes.items()}
+    hashed = {col: {v: set(b) for v, b in buckets.items()} for col, buckets in table._hash_indexes.items()}
+    ordered = {col: (list(ix._keys), sorted(ix._pos)) for col, ix in table._ordered_indexes.items()}
+    table._rebuild_indexes()
+    assert unique == table._indexes, "UNIQUE index out of sync"
+    assert hashed == table._hash_indexes, "hash index out of sync"
+    assert ordered == {col: (ix._keys, sorted(ix._pos)) for col, ix in table._ordered_indexes.items()}, "btree index out of sync"
+
+
+def bench_stress(writers: int, readers: int, ops: int) -> None:
+    # Each writer owns its own id range and tracks the rows it expects; readers check that
+    # every row they see is whole. Writers also retag all their rows in one statement, so a
+    # full scan from a consistent snapshot never shows one writer's rows with two tags.
+    # Afterwards the table, its indexes and a reopened copy must match the writers'
+    # bookkeeping exactly.
+    span = 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MiniDB(tmp, enable_auth=False, checkpoint_interval=500)
+        db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+        db.execute("CREATE INDEX bills_user_id ON bills (user_id)")
+        db.execute("CREATE INDEX bills_amount ON bills (amount) USING BTREE")
+        insert = db.prepare("INSERT INTO bills (id, user_id, description, amount, due_date, status) VALUES (?, ?, ?, ?, ?, ?)")
+        update = db.prepare("UPDATE bills SET amount = ?, description = ? WHERE id = ?")
+        delete = db.prepare("DELETE FROM bills WHERE id = ?")
+        retag = db.prepare("UPDATE bills SET status = ? WHERE user_id = ?")
+        by_id = db.prepare("SELECT * FROM bills WHERE id = ?")
+        by_user = db.prepare("SELECT * FROM bills WHERE user_id = ?")
+        expected: Dict[int, Dict[str, Any]] = {}
+        errors: List[BaseException] = []
+        done = threading.Event()
+
+        def write(w: int) -> None:
+            rnd = random.Random(w)
+            mine: Dict[int, Dict[str, Any]] = {}
+            tag = f"{w}/0"
+            try:
+                for n in range(ops):
+                    action = rnd.random()
+                    if action < 0.45 or not mine:
+                        i = w * span + n
+                        row = {"id": i, "user_id": w, "description": f"Bill {i}", "amount": float(n % 500),
+                               "due_date": "2026-01-01", "status": tag}
+                        insert.execute(list(row.values()))
+                        mine[i] = row
+                    elif action < 0.75:
+                        i = rnd.choice(list(mine))
+                        amount = float(rnd.randrange(500))
+                        assert update.execute((amount, f"Bill {i} @{amount}", i)) == 1
+                        mine[i].update(amount=amount, description=f"Bill {i} @{amount}")
+                    elif action < 0.95:
+                        i = rnd.choice(list(mine))
+                        assert delete.execute((i,)) == 1
+                        del mine[i]
+                    else:
+                        tag = f"{w}/{n}"
+                        assert retag.execute((tag, w)) == len(mine)
+                        for row in mine.values():
+                            row["status"] = tag
+                expected.update(mine)
+            except BaseException as e:
+                errors.append(e)
+
+        def read(r: int) -> None:
+            rnd = random.Random(-1 - r)
+            try:
+                while not done.is_set():
+                    w = rnd.randrange(writers)
+                    for row in by_user.execute((w,)):
+                        assert row["user_id"] == w and row["description"].startswith(f"Bill {row['id']}")
+                    for row in by_id.execute((w * span + rnd.randrange(ops),)):
+                        assert row["id"] // span == row["user_id"]
+                    for row in by_user.execute_iter((w,)):
+                        break
+                    count = db.execute(f"SELECT COUNT(*) FROM bills WHERE user_id = {w}")
+                    assert count[0]["COUNT(*)"] <= ops
+                    tags: Dict[int, Set[str]] = {}
+                    for row in db.execute_iter("SELECT user_id, status FROM bills"):
+                        tags.setdefault(row["user_id"], set()).add(row["status"])
+                    assert all(len(t) == 1 for t in tags.values()), "scan saw a statement half applied"
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+        reader_threads = [threading.Thread(target=read, args=(r,)) for r in range(readers)]
+        start = time.perf_counter()
+        for t in threads + reader_threads:
+            t.start()
+        for t in threads:
+            t.join()
+        done.set()
+        for t in reader_threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+        def check(db: MiniDB) -> None:
+            rows = {r["id"]: r for r in db.execute("SELECT * FROM bills")}
+            assert rows == expected, "table does not match the writers' bookkeeping"
+            _check_indexes(db.catalog.get_table("bills"))
+
+        check(db)
+        db.close()
+        reopened = MiniDB(tmp, enable_auth=False)
+        check(reopened)
+        reopened.close(checkpoint=False)
+        print(f"{writers} writers x {ops} statements with {readers} concurrent readers")
+        print(f"  {writers * ops / elapsed / 1e3:8.1f} kwrites/s  {len(expected)} rows, indexes and reopened table consistent")
+
+
+def bench_durability(writers: int, ops: int) -> None:
+    # Concurrent single-row INSERTs (each its own commit) under every durability mode.
+    print(f"{writers} writers x {ops} INSERTs")
+    for mode in ("sync", "group", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = MiniDB(tmp, enable_auth=False, durability=mode, checkpoint_interval=writers * ops + 1)
+            db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+            insert = db.prepare("INSERT INTO bills (id, user_id, description, amount, due_date, status) VALUES (?, ?, ?, ?, ?, ?)")
+            bills = _bills(writers * ops)
+
+            def write(w: int) -> None:
+                for b in bills[w::writers]:
+                    insert.execute(list(b.values()))
+
+            threads = [threading.Thread(target=write, args=(w,)) for w in range(writers)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            syncs = db.catalog.wal.syncs
+            db.close(checkpoint=False)
+            reopened = MiniDB(tmp, enable_auth=False)
+            assert reopened.row_count("bills") == len(bills)
+            reopened.close(checkpoint=False)
+            print(f"  {mode:<6} {len(bills) / elapsed / 1e3:8.1f} kstmt/s  {syncs:6d} fsyncs")
+
+
+def bench_server(rows: int, clients: int) -> None:
+    # Point lookups through MiniDB in-process versus the same statements sent to a server on
+    # localhost by several clients at once.
+    with tempfile.TemporaryDirectory() as tmp:
+        server = MiniDBServer(tmp, enable_auth=False)
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(server.start("127.0.0.1:0"), loop).result()
+        address = server.addresses[0][:2]
+        setup = Client(address, "db")
+        setup.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+        setup.executemany(
+            "INSERT INTO bills (id, user_id, description, amount, due_date, status) VALUES (?, ?, ?, ?, ?, ?)",
+            [list(b.values()) for b in _bills(500)],
+        )
+        ids = [i % 500 for i in range(rows)]
+        db = server.open_database("db").db
+        local = db.prepare("SELECT * FROM bills WHERE id = ?")
+        t_local, expected = _time(lambda: [local.execute((i,)) for i in ids], 1)
+
+        def lookups(part: List[int], out: List[Any]) -> None:
+            with Client(address, "db") as client:
+                by_id = client.prepare("SELECT * FROM bills WHERE id = ?")
+                out.extend(by_id.execute((i,)) for i in part)
+
+        results: List[List[Any]] = [[] for _ in range(clients)]
+        threads = [
+            threading.Thread(target=lookups, args=(ids[c::clients], results[c])) for c in range(clients)
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        t_remote = time.perf_counter() - start
+        assert sum(len(r) for r in results) == rows
+        assert results[0] == expected[::clients]
+
+        setup.close()
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        print(f"{rows} point lookups")
+        print(f"  in-process PreparedStatement {rows / t_local / 1e3:8.1f} kstmt/s")
+        print(f"  {clients} clients over TCP       {rows / t_remote / 1e3:8.1f} kstmt/s")
+
+
+def _crash_during_writes(path: str, first: int, rows: int) -> None:
+    # Runs in a child process: logs `rows` inserts, leaves half a record at the end of the
+    # WAL and a stray staged file, as a crash in the middle of a write and of a checkpoint
+    # would, then dies without closing anything.
+    db = MiniDB(path, enable_auth=False, checkpoint_interval=10**9)
+    insert = db.prepare("INSERT INTO bills (id, user_id, description, amount, due_date, status) VALUES (?, ?, ?, ?, ?, ?)")
+    for b in _bills(rows):
+        insert.execute([first + b["id"]] + [b[c.name] for c in BILL_COLUMNS[1:]])
+    with open(os.path.join(path, "minidb.wal"), "a", encoding="utf-8") as f:
+        f.write('{"table":"bills","op":"insert","row":{"id":')
+    with open(os.path.join(path, "bills.rows.json.tmp"), "w", encoding="utf-8") as f:
+        f.write("[")
+    os._exit(0)
+
+
+def bench_recovery(rows: int, crashes: int) -> None:
+    # Every round reopens the database after the previous crash, so it starts with a
+    # recovery, adds rows and crashes again. Nothing committed before any of the crashes may
+    # be missing afterwards.
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MiniDB(tmp, enable_auth=False)
+        db.execute("CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING)")
+        db.close()
+        print(f"{crashes} crashes, each after {rows} logged inserts and a torn WAL record")
+        for n in range(crashes):
+            child = multiprocessing.Process(target=_crash_during_writes, args=(tmp, n * rows, rows))
+            child.start()
+            child.join()
+            start = time.perf_counter()
+            db = MiniDB(tmp, enable_auth=False, lazy_load=False)
+            elapsed = time.perf_counter() - start
+            count = db.row_count("bills")
+            r = db.recovery
+            db.close(checkpoint=False)
+            assert count == (n + 1) * rows, f"expected {(n + 1) * rows} rows after crash {n + 1}, found {count}"
+            assert r["wal_truncated_bytes"] and r["removed_files"] == ["bills.rows.json.tmp"]
+            print(
+                f"  crash {n + 1}: open {elapsed * 1e3:7.1f} ms  replayed {r['replayed']:6d}  "
+                f"cut {r['wal_truncated_bytes']} torn bytes  {count} rows"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MiniDB microbenchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p_where = sub.add_parser("where", help="compiled vs interpreted WHERE evaluation")
+    p_where.add_argument("--rows", type=int, default=200_000)
+    p_where.add_argument("--repeat", type=int, default=5)
+    p_memory = sub.add_parser("memory", help="bytes per row of the row and columnar layouts")
+    p_memory.add_argument("--rows", type=int, default=200_000)
+    p_join = sub.add_parser("join", help="JOIN of bills and payments")
+    p_join.add_argument("--rows", type=int, default=100_000)
+    p_join.add_argument("--repeat", type=int, default=3)
+    p_order = sub.add_parser("order", help="ORDER BY ... LIMIT strategies")
+    p_order.add_argument("--rows", type=int, default=200_000)
+    p_order.add_argument("--repeat", type=int, default=5)
+    p_group = sub.add_parser("group", help="GROUP BY aggregation vs a Python loop")
+    p_group.add_argument("--rows", type=int, default=200_000)
+    p_group.add_argument("--repeat", type=int, default=3)
+    p_parse = sub.add_parser("parse", help="parse cache vs plain parsing")
+    p_parse.add_argument("--rows", type=int, default=50_000)
+    p_parse.add_argument("--repeat", type=int, default=3)
+    p_prepared = sub.add_parser("prepared", help="prepared statements vs execute(sql)")
+    p_prepared.add_argument("--rows", type=int, default=50_000)
+    p_prepared.add_argument("--repeat", type=int, default=3)
+    p_insert = sub.add_parser("insert", help="executemany vs row-at-a-time INSERT")
+    p_insert.add_argument("--rows", type=int, default=20_000)
+    p_insert.add_argument("--repeat", type=int, default=3)
+    p_copy = sub.add_parser("copy", help="COPY FROM a CSV file")
+    p_copy.add_argument("--rows", type=int, default=1_000_000)
+    p_copy.add_argument("--repeat", type=int, default=1)
+    p_stress = sub.add_parser("stress", help="concurrent execute() from many threads, then check invariants")
+    p_stress.add_argument("--writers", type=int, default=8)
+    p_stress.add_argument("--readers", type=int, default=8)
+    p_stress.add_argument("--ops", type=int, default=2_000)
+    p_durability = sub.add_parser("durability", help="concurrent commits under sync/group/async durability")
+    p_durability.add_argument("--writers", type=int, default=8)
+    p_durability.add_argument("--ops", type=int, default=500)
+    p_server = sub.add_parser("server", help="point lookups through minidb.server vs in-process")
+    p_server.add_argument("--rows", type=int, default=20_000)
+    p_server.add_argument("--clients", type=int, default=4)
+    p_recovery = sub.add_parser("recovery", help="repeated crashes mid-write, then reopen and check nothing is lost")
+    p_recovery.add_argument("--rows", type=int, default=5_000)
+    p_recovery.add_argument("--crashes", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.bench == "where":
+        bench_where(args.rows, args.repeat)
+    elif args.bench == "memory":
+        bench_memory(args.rows)
+    elif args.bench == "join":
+        bench_join(args.rows, args.repeat)
+    elif args.bench == "order":
+        bench_order(args.rows, args.repeat)
+    elif args.bench == "group":
+        bench_group(args.rows, args.repeat)
+    elif args.bench == "parse":
+        bench_parse(args.rows, args.repeat)
+    elif args.bench == "prepared":
+        bench_prepared(args.rows, args.repeat)
+    elif args.bench == "insert":
+        bench_insert(args.rows, args.repeat)
+    elif args.bench == "copy":
+        bench_copy(args.rows, args.repeat)
+    elif args.bench == "stress":
+        bench_stress(args.writers, args.readers, args.ops)
+    elif args.bench == "durability":
+        bench_durability(args.writers, args.ops)
+    elif args.bench == "server":
+        bench_server(args.rows, args.clients)
+    elif args.bench == "recovery":
+        bench_recovery(args.rows, args.crashes)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
-from .db import MiniDB
+from .db import MiniDB, PreparedStatement
 
-__all__ = ["MiniDB"]
+__all__ = ["MiniDB", "PreparedStatement"]
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import hashlib
+import threading
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
@@ -14,12 +15,14 @@ class Session:
     user_id: int
     username: str
     expiry: datetime
+    token: str = ""
 
 
 class Authenticator:
     def __init__(self, session_ttl_hours: int = 24):
         self._sessions: Dict[str, Session] = {}
         self._ttl = timedelta(hours=session_ttl_hours)
+        self._lock = threading.Lock()
 
     @staticmethod
     def hash_password(password: str) -> str:
@@ -27,22 +30,27 @@ class Authenticator:
 
     def create_session(self, user_id: int, username: str) -> str:
         token = str(uuid.uuid4())
-        self._sessions[token] = Session(
+        session = Session(
             user_id=user_id,
             username=username,
             expiry=datetime.now(timezone.utc) + self._ttl,
+            token=token,
         )
+        with self._lock:
+            self._sessions[token] = session
         return token
 
     def validate(self, token: Optional[str]) -> Session:
-        if not token or token not in self._sessions:
-            raise AuthError("Invalid session")
-        s = self._sessions[token]
-        if datetime.now(timezone.utc) >= s.expiry:
-            del self._sessions[token]
-            raise AuthError("Session expired")
-        return s
+        with self._lock:
+            s = self._sessions.get(token) if token else None
+            if s is None:
+                raise AuthError("Invalid session")
+            if datetime.now(timezone.utc) >= s.expiry:
+                del self._sessions[token]
+                raise AuthError("Session expired")
+            return s
 
     def logout(self, token: Optional[str]) -> None:
-        if token and token in self._sessions:
-            del self._sessions[token]
+        with self._lock:
+            if token:
+                self._sessions.pop(token, None)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .errors import SchemaError
+
+
+COPY_FORMATS = {"csv", "jsonl"}
+
+
+def infer_format(path: str, fmt: Optional[str] = None) -> str:
+    if fmt is None:
+        fmt = "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    fmt = fmt.lower()
+    if fmt not in COPY_FORMATS:
+        raise SchemaError(f"Unsupported COPY format: {fmt}")
+    return fmt
+
+
+def read_csv(f: Iterable[str]) -> Tuple[Optional[List[str]], Iterator[List[str]]]:
+    # The header line names the columns; the remaining lines stream from the open file.
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return None, iter(())
+    return [c.strip() for c in header], reader
+
+
+def read_jsonl(f: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for n, line in enumerate(f, start=1):
+        if line.strip() == "":
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise SchemaError(f"Invalid JSON on line {n}") from None
+        if not isinstance(record, dict):
+            raise SchemaError(f"Expected a JSON object on line {n}")
+        yield record
+
+
+def write_rows(path: str, fmt: str, columns: List[str], rows: Iterable[Dict[str, Any]]) -> int:
+    # Rows stream into a temporary file that replaces the target once complete.
+    tmp = f"{path}.tmp"
+    n = 0
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(["" if row.get(c) is None else row.get(c) for c in columns])
+                n += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n")
+                n += 1
+    os.replace(tmp, path)
+    return n
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from . import protocol
+from .errors import MiniDBError
+
+
+class Client:
+    # A connection to a MiniDB server (python -m minidb.server) with the same surface as
+    # MiniDB, so code can switch between an in-process engine and a shared one.
+    # `persistence_dir` names the database relative to the server's root. One client may be
+    # shared by threads; its requests are sent one at a time. Transactions belong to the
+    # connection. Whether the database checks sessions is up to the server (`enable_auth`
+    # reports it).
+    def __init__(
+        self,
+        address: protocol.Address = f"127.0.0.1:{protocol.DEFAULT_PORT}",
+        persistence_dir: str = "./minidb_data",
+        timeout: Optional[float] = None,
+    ):
+        self.address = address
+        self.persistence_dir = persistence_dir
+        self.enable_auth = True
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._sock: Optional[socket.socket] = _connect(protocol.parse_address(address), timeout)
+        try:
+            self.enable_auth = bool(self._call("open", db=persistence_dir)["enable_auth"])
+        except BaseException:
+            self.close()
+            raise
+
+    def _call(self, op: str, **args: Any) -> Any:
+        with self._lock:
+            if self._sock is None:
+                raise MiniDBError("Client is closed")
+            self._next_id += 1
+            try:
+                self._sock.sendall(protocol.encode({"id": self._next_id, "op": op, **args}))
+                response = protocol.recv_message(self._sock)
+            except BaseException:
+                # The stream is out of step after a partial exchange; it cannot be reused.
+                self._close_socket()
+                raise
+            if response is None:
+                self._close_socket()
+                raise MiniDBError("Connection closed by server")
+        if "error" in response:
+            protocol.raise_error(response["error"])
+        return response.get("result")
+
+    def _close_socket(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    @property
+    def closed(self) -> bool:
+        return self._sock is None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_socket()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def ping(self) -> None:
+        self._call("ping")
+
+    def register_user(
+        self, username: str, password: str, email: str = "", is_admin: int = 0, session_token: Optional[str] = None
+    ) -> int:
+        # Over the wire an admin user can only be registered with an admin's session token.
+        return self._call(
+            "register_user", username=username, password=password, email=email, is_admin=is_admin, token=session_token
+        )
+
+    def login(self, username: str, password: str) -> str:
+        return self._call("login", username=username, password=password)
+
+    def validate(self, token: Optional[str]) -> Tuple[int, str]:
+        user_id, username = self._call("validate", token=token)
+        return user_id, username
+
+    def logout(self, token: Optional[str]) -> None:
+        self._call("logout", token=token)
+
+    def rollback(self) -> bool:
+        return self._call("rollback")
+
+    def checkpoint(self, session_token: Optional[str] = None) -> None:
+        self._call("checkpoint", token=session_token)
+
+    def list_tables(self) -> List[str]:
+        return self._call("list_tables")
+
+    def row_count(self, table: str) -> int:
+        return self._call("row_count", table=table)
+
+    def table_versions(self, session_token: Optional[str] = None) -> Dict[str, int]:
+        return self._call("table_versions", token=session_token)
+
+    def next_id(self, table: str, session_token: Optional[str] = None) -> int:
+        return self._call("next_id", table=table, token=session_token)
+
+    @contextmanager
+    def transaction(self, session_token: Optional[str] = None) -> Iterator[None]:
+        self.execute("BEGIN", session_token)
+        try:
+            yield
+        except BaseException:
+            self.execute("ROLLBACK", session_token)
+            raise
+        self.execute("COMMIT", session_token)
+
+    def execute(self, sql: str, session_token: Optional[str] = None) -> Any:
+        return self._call("execute", sql=sql, token=session_token)
+
+    def prepare(self, sql: str) -> "RemotePreparedStatement":
+        return RemotePreparedStatement(self, sql)
+
+    def executemany(
+        self,
+        sql: str,
+        seq_of_params: Iterable[Union[Sequence[Any], Mapping[str, Any]]],
+        session_token: Optional[str] = None,
+    ) -> int:
+        return self._call("executemany", sql=sql, params=[_params(p) for p in seq_of_params], token=session_token)
+
+    def execute_iter(
+        self, sql: str, session_token: Optional[str] = None, batch_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        return self._query({"sql": sql, "token": session_token}, batch_size)
+
+    def _query(self, args: Dict[str, Any], batch_size: int) -> "_RemoteCursor":
+        # The first batch comes back with the query, so errors surface here, as they do
+        # in MiniDB.execute_iter.
+        first = self._call("query", batch=batch_size, **args)
+        return _RemoteCursor(self, first, batch_size)
+
+
+class RemotePreparedStatement:
+    # Mirrors PreparedStatement. The server parses the SQL once and keeps the compiled
+    # statement; each call only ships the parameters.
+    def __init__(self, client: Client, sql: str):
+        self.client = client
+        self.sql = sql
+        info = client._call("prepare", sql=sql)
+        self.type: str = info["type"]
+        self.param_count: int = info["param_count"]
+        self.param_names = set(info["param_names"])
+
+    def execute(
+        self,
+        params: Union[Sequence[Any], Mapping[str, Any]] = (),
+        session_token: Optional[str] = None,
+    ) -> Any:
+        return self.client._call("execute", sql=self.sql, params=_params(params), token=session_token)
+
+    def executemany(
+        self,
+        seq_of_params: Iterable[Union[Sequence[Any], Mapping[str, Any]]],
+        session_token: Optional[str] = None,
+    ) -> int:
+        return self.client.executemany(self.sql, seq_of_params, session_token)
+
+    def execute_iter(
+        self,
+        params: Union[Sequence[Any], Mapping[str, Any]] = (),
+        session_token: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        return self.client._query({"sql": self.sql, "params": _params(params), "token": session_token}, batch_size)
+
+
+class _RemoteCursor:
+    # Streams a server-side cursor in batches. Like the in-process iterator it keeps the
+    # server's snapshot open until it is exhausted or closed.
+    def __init__(self, client: Client, first: Dict[str, Any], batch_size: int):
+        self._client = client
+        self._cursor = first["cursor"]
+        self._rows = iter(first["rows"])
+        self._batch_size = batch_size
+
+    def __iter__(self) -> "_RemoteCursor":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        while True:
+            row = next(self._rows, None)
+            if row is not None:
+                return row
+            if self._cursor is None:
+                raise StopIteration
+            reply = self._client._call("fetch", cursor=self._cursor, batch=self._batch_size)
+            self._cursor = reply["cursor"]
+            self._rows = iter(reply["rows"])
+
+    def close(self) -> None:
+        cursor, self._cursor = self._cursor, None
+        self._rows = iter(())
+        if cursor is not None and not self._client.closed:
+            self._client._call("close_cursor", cursor=cursor)
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _params(params: Union[Sequence[Any], Mapping[str, Any]]) -> Union[List[Any], Dict[str, Any]]:
+    if isinstance(params, Mapping):
+        return dict(params)
+    return list(params)
+
+
+def _connect(target: protocol.Address, timeout: Optional[float]) -> socket.socket:
+    if isinstance(target, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(target)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    sock = socket.create_connection(target, timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
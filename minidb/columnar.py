@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from .errors import SchemaError
+
+
+_INT_MIN = -(2**63)
+_INT_MAX = 2**63 - 1
+_TYPECODES = {"INT": "q", "FLOAT": "d"}
+
+
+class ColumnStore:
+    def __init__(self, columns: Sequence[Tuple[str, str]], rows: Iterable[Dict[str, Any]] = ()):
+        self.columns = list(columns)
+        self._data: Dict[str, Union[array, List[str]]] = {}
+        self._nulls: Dict[str, bytearray] = {}
+        for name, dtype in self.columns:
+            self._data[name] = array(_TYPECODES[dtype]) if dtype in _TYPECODES else []
+            self._nulls[name] = bytearray()
+        self._deleted = bytearray()
+        self._n = 0
+        for row in rows:
+            self.append(row)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _encode(self, row: Dict[str, Any]) -> List[Tuple[Any, bool]]:
+        out: List[Tuple[Any, bool]] = []
+        for name, dtype in self.columns:
+            v = row.get(name)
+            if v is None:
+                out.append(("" if dtype == "STRING" else 0, True))
+                continue
+            if dtype == "INT" and not (_INT_MIN <= v <= _INT_MAX):
+                raise SchemaError(f"Value out of range for columnar storage: {name}")
+            if dtype == "STRING":
+                v = sys.intern(v)
+            out.append((v, False))
+        return out
+
+    def _set_null(self, name: str, i: int, is_null: bool) -> None:
+        bm = self._nulls[name]
+        if is_null:
+            bm[i >> 3] |= 1 << (i & 7)
+        else:
+            bm[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def is_null(self, name: str, i: int) -> bool:
+        return bool(self._nulls[name][i >> 3] & (1 << (i & 7)))
+
+    def append(self, row: Dict[str, Any]) -> None:
+        encoded = self._encode(row)
+        i = self._n
+        if i & 7 == 0:
+            for bm in self._nulls.values():
+                bm.append(0)
+            self._deleted.append(0)
+        for (name, _dtype), (v, is_null) in zip(self.columns, encoded):
+            self._data[name].append(v)
+            if is_null:
+                self._set_null(name, i, True)
+        self._n += 1
+
+    def truncate(self, n: int) -> None:
+        size = (n + 7) >> 3
+        for data in self._data.values():
+            del data[n:]
+        for bm in [*self._nulls.values(), self._deleted]:
+            del bm[size:]
+            if n & 7:
+                bm[-1] &= (1 << (n & 7)) - 1
+        self._n = n
+
+    def is_deleted(self, i: int) -> bool:
+        return bool(self._deleted[i >> 3] & (1 << (i & 7)))
+
+    def delete(self, i: int) -> None:
+        self._deleted[i >> 3] |= 1 << (i & 7)
+
+    def undelete(self, i: int) -> None:
+        self._deleted[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def get(self, i: int, name: str) -> Any:
+        if self.is_null(name, i):
+            return None
+        return self._data[name][i]
+
+    def project(self, i: int, names: Sequence[str]) -> Dict[str, Any]:
+        return {c: self.get(i, c) for c in names}
+
+    def values(self, i: int, names: Sequence[str]) -> Tuple[Any, ...]:
+        return tuple(self.get(i, c) for c in names)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("row index out of range")
+        return self.project(i, [name for name, _ in self.columns])
+
+    def __setitem__(self, i: int, row: Dict[str, Any]) -> None:
+        encoded = self._encode(row)
+        for (name, _dtype), (v, is_null) in zip(self.columns, encoded):
+            self._data[name][i] = v
+            self._set_null(name, i, is_null)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        deleted = self._deleted
+        for i in range(self._n):
+            if not deleted[i >> 3] & (1 << (i & 7)):
+                yield self[i]
+
+    def live_values(self, name: str) -> Iterator[Tuple[int, Any]]:
+        data = self._data[name]
+        bm = self._nulls[name]
+        deleted = self._deleted
+        for i, v in enumerate(data):
+            if not deleted[i >> 3] & (1 << (i & 7)):
+                yield i, None if bm[i >> 3] & (1 << (i & 7)) else v
+
+    def match_positions(self, name: str, op: str, right: Any, positions: Optional[Iterable[int]] = None) -> List[int]:
+        data = self._data[name]
+        bm = self._nulls[name]
+        deleted = self._deleted
+        if right is None:
+            if op != "=":
+                return []
+            candidates = range(self._n) if positions is None else positions
+            return [
+                i for i in candidates if bm[i >> 3] & (1 << (i & 7)) and not deleted[i >> 3] & (1 << (i & 7))
+            ]
+        if positions is None:
+            if op == "=":
+                hits = [i for i, v in enumerate(data) if v == right]
+            elif op == ">":
+                hits = [i for i, v in enumerate(data) if v > right]
+            elif op == "<":
+                hits = [i for i, v in enumerate(data) if v < right]
+            else:
+                raise SchemaError(f"Unsupported operator: {op}")
+        else:
+            if op == "=":
+                hits = [i for i in positions if data[i] == right]
+            elif op == ">":
+                hits = [i for i in positions if data[i] > right]
+            elif op == "<":
+                hits = [i for i in positions if data[i] < right]
+            else:
+                raise SchemaError(f"Unsupported operator: {op}")
+        return [i for i in hits if not (bm[i >> 3] | deleted[i >> 3]) & (1 << (i & 7))]
+
+    def compact(self) -> None:
+        deleted = self._deleted
+        keep = [i for i in range(self._n) if not deleted[i >> 3] & (1 << (i & 7))]
+        if len(keep) == self._n:
+            return
+        for name, dtype in self.columns:
+            data = self._data[name]
+            bm = self._nulls[name]
+            kept = [data[i] for i in keep]
+            self._data[name] = array(_TYPECODES[dtype], kept) if dtype in _TYPECODES else kept
+            new_bm = bytearray((len(keep) + 7) // 8)
+            for j, i in enumerate(keep):
+                if bm[i >> 3] & (1 << (i & 7)):
+                    new_bm[j >> 3] |= 1 << (j & 7)
+            self._nulls[name] = new_bm
+        self._deleted = bytearray((len(keep) + 7) // 8)
+        self._n = len(keep)
+
+    def nbytes(self) -> int:
+        total = 0
+        for name, dtype in self.columns:
+            data = self._data[name]
+            total += sys.getsizeof(data) + sys.getsizeof(self._nulls[name])
+            if dtype == "STRING":
+                seen: Set[int] = set()
+                for v in data:
+                    if v is not None and id(v) not in seen:
+                        seen.add(id(v))
+                        total += sys.getsizeof(v)
+        return total
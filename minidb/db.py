@@ -1,21 +1,69 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, List, Optional, Tuple, Union
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
+from . import bulk, executor
 from .auth import Authenticator
-from .errors import AuthError, SchemaError
-from .parser import parse
-from .storage import Catalog, Column
+from .errors import AuthError, LockTimeout, ParseError, SchemaError
+from .parser import ParseCache, compile_template, param_keys, parse
+from .storage import Catalog, Column, TableSnapshot, Transaction
+
+
+_SCHEMA_CHANGES = {"CREATE_TABLE", "DROP_TABLE", "CREATE_INDEX", "DROP_INDEX"}
 
 
 class MiniDB:
-    def __init__(self, persistence_dir: str = "./minidb_data", enable_auth: bool = True):
+    def __init__(
+        self,
+        persistence_dir: str = "./minidb_data",
+        enable_auth: bool = True,
+        checkpoint_interval: int = 1000,
+        storage_format: str = "json",
+        table_layout: str = "row",
+        lazy_load: bool = True,
+        warm_tables: Optional[List[str]] = None,
+        parse_cache_size: int = 256,
+        durability: str = "async",
+        flush_interval: float = 0.05,
+        lock_timeout: float = 5.0,
+        copy_dir: Optional[str] = None,
+    ):
         self.persistence_dir = persistence_dir
         self.enable_auth = enable_auth
-        self.catalog = Catalog(persistence_dir=persistence_dir)
-        self.catalog.load_existing()
+        # COPY statements are off unless copy_dir is given, and then only reach files in it.
+        self.copy_dir = None if copy_dir is None else os.path.realpath(copy_dir)
+        self.catalog = Catalog(
+            persistence_dir=persistence_dir,
+            checkpoint_interval=checkpoint_interval,
+            storage_format=storage_format,
+            table_layout=table_layout,
+            lazy_load=lazy_load,
+            durability=durability,
+            flush_interval=flush_interval,
+        )
+        try:
+            self.catalog.load_existing()
+        except BaseException:
+            self.catalog.close(checkpoint=False)
+            raise
+        if warm_tables:
+            self.catalog.warm(warm_tables)
         self.auth = Authenticator()
+        self.parse_cache = ParseCache(parse_cache_size)
+        # Open transactions by thread: a transaction holds its locks, and locks belong to
+        # the thread that took them (in the server, one per connection). Inside a
+        # transaction, lock waits give up after lock_timeout seconds.
+        self._transactions: Dict[int, Transaction] = {}
+        self._txn_lock = threading.Lock()
+        self.lock_timeout = lock_timeout
+        # Release calls of result iterators collected without being closed (see
+        # _LockedIterator); the next statement runs them.
+        self._abandoned: "deque[List[Callable[[], None]]]" = deque()
         if enable_auth:
             self._ensure_users_table()
 
@@ -34,8 +82,9 @@ class MiniDB:
         )
 
     def _next_int_id(self, table: str) -> int:
-        t = self.catalog.get_table(table)
-        rows = t.select(["id"], None)
+        with self._locked(reads=[table]):
+            t = self.catalog.get_table(table)
+            rows = t.select(["id"], None)
         max_id = 0
         for r in rows:
             v = r.get("id")
@@ -43,28 +92,38 @@ class MiniDB:
                 max_id = v
         return max_id + 1
 
+    def next_id(self, table: str, session_token: Optional[str] = None) -> int:
+        # One more than the largest integer id in `table`, counting every user's rows (which
+        # a SELECT MAX(id) under row-level filtering would not).
+        if self.enable_auth:
+            self.auth.validate(session_token)
+        return self._next_int_id(table)
+
     def register_user(self, username: str, password: str, email: str = "", is_admin: int = 0) -> int:
         if not self.enable_auth:
             raise AuthError("Auth disabled")
-        users = self.catalog.get_table("users")
-        uid = self._next_int_id("users")
-        users.insert(
-            {
+        with self._locked(writes=["users"]):
+            users = self.catalog.get_table("users")
+            uid = self._next_int_id("users")
+            row = {
                 "id": uid,
                 "username": username,
                 "password_hash": self.auth.hash_password(password),
                 "email": email,
                 "is_admin": int(is_admin),
             }
-        )
-        users.persist()
+            users.insert(row)
+            self.catalog.log(users, {"op": "insert", "row": row})
+        self.catalog.wal.wait_durable()
+        self.catalog.maybe_checkpoint()
         return uid
 
     def login(self, username: str, password: str) -> str:
         if not self.enable_auth:
             raise AuthError("Auth disabled")
-        users = self.catalog.get_table("users")
-        rows = users.select(["id", "username", "password_hash"], ("username", "=", username))
+        with self._locked(reads=["users"]):
+            users = self.catalog.get_table("users")
+            rows = users.select(["id", "username", "password_hash"], ("username", "=", username))
         if not rows:
             raise AuthError("Invalid credentials")
         row = rows[0]
@@ -76,26 +135,231 @@ class MiniDB:
         s = self.auth.validate(token)
         return s.user_id, s.username
 
-    def close(self) -> None:
-        for name in self.catalog.list_tables():
-            self.catalog.get_table(name).persist()
+    def logout(self, token: Optional[str]) -> None:
+        self.auth.logout(token)
+
+    def list_tables(self) -> List[str]:
+        with self.catalog.lock.read():
+            return self.catalog.list_tables()
+
+    def row_count(self, table: str) -> int:
+        with self._locked(reads=[table]):
+            return self.catalog.get_table(table).row_count()
+
+    def table_versions(self) -> Dict[str, int]:
+        # Table name -> Table.version. Versions only grow within a process and are never
+        # reused, also across DROP/CREATE, so an unchanged number means unchanged rows.
+        with self.catalog.lock.read():
+            return {name: self.catalog.get_table(name).version for name in self.catalog.list_tables()}
+
+    @property
+    def recovery(self) -> Dict[str, Any]:
+        # What opening the database had to recover: seconds taken, WAL records replayed and
+        # uncommitted ones discarded, whether an interrupted checkpoint was finished, and
+        # the stray staged files removed.
+        return dict(self.catalog.recovery)
+
+    def checkpoint(self) -> None:
+        # Waits for transactions of other threads to finish.
+        self._check_no_transaction("Checkpoint")
+        with self._exclusive():
+            self.catalog.checkpoint()
+
+    def convert_storage(self, storage_format: str) -> None:
+        self._check_no_transaction("Storage conversion")
+        with self._exclusive():
+            self.catalog.convert_storage(storage_format)
+
+    def set_table_layout(self, table: str, layout: str) -> None:
+        self._check_no_transaction("Layout change")
+        with self._exclusive():
+            t = self.catalog.get_table(table)
+            t.set_layout(layout)
+            t.persist()
+
+    def rollback(self) -> bool:
+        # Rolls back the calling thread's open transaction, if any, e.g. when the request or
+        # connection that began it ends. Returns whether there was one.
+        txn = self._transaction()
+        if txn is None:
+            return False
+        self._end_transaction(txn, commit=False)
+        return True
+
+    def close(self, checkpoint: bool = True) -> None:
+        # Rolls back the calling thread's transaction and waits for those of other threads.
+        self.rollback()
+        with self._exclusive():
+            self.catalog.close(checkpoint=checkpoint)
+
+    def _transaction(self) -> Optional[Transaction]:
+        with self._txn_lock:
+            return self._transactions.get(threading.get_ident())
+
+    def _end_transaction(self, txn: Transaction, commit: bool) -> None:
+        with self._txn_lock:
+            del self._transactions[threading.get_ident()]
+        if commit:
+            txn.commit()
+        else:
+            txn.rollback()
+
+    def _release_abandoned(self) -> None:
+        while self._abandoned:
+            _unlock(self._abandoned.popleft())
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        # The catalog write lock, for DDL, checkpoints and close. Locks of iterators that were
+        # dropped without closing go first, or this would wait for them forever. A background
+        # checkpoint still writing table files finishes before any of these touch them.
+        self._release_abandoned()
+        with self.catalog.lock.write():
+            self.catalog.wait_checkpoint()
+            yield
+
+    def _lock(self, reads: Iterable[str] = (), writes: Iterable[str] = ()) -> List[Callable[[], None]]:
+        # Lock order is the catalog (read side), then tables sorted by name, so two statements
+        # can never wait on each other in a cycle. Transactions keep their table locks across
+        # statements and so break that order; their waits time out (LockTimeout). Returns the
+        # release calls for _unlock, which work from any thread.
+        self._release_abandoned()
+        modes = {name: False for name in reads}
+        modes.update({name: True for name in writes})
+        timeout = None if self._transaction() is None else self.lock_timeout
+        me = threading.get_ident()
+        self.catalog.lock.acquire_read()
+        releases: List[Callable[[], None]] = [partial(self.catalog.lock.release_read, me)]
+        try:
+            for name in sorted(modes):
+                if self.catalog.has_table(name):
+                    lock = self.catalog.get_table(name).lock
+                    if modes[name]:
+                        acquired = lock.acquire_write(timeout=timeout)
+                        release = lock.release_write
+                    else:
+                        acquired = lock.acquire_read(timeout=timeout)
+                        release = partial(lock.release_read, me)
+                    if not acquired:
+                        raise LockTimeout(f"Lock wait timed out on table {name}")
+                    releases.append(release)
+        except BaseException:
+            _unlock(releases)
+            raise
+        return releases
+
+    @contextmanager
+    def _locked(self, reads: Iterable[str] = (), writes: Iterable[str] = ()) -> Iterator[None]:
+        releases = self._lock(reads, writes)
+        try:
+            yield
+        finally:
+            _unlock(releases)
+
+    @contextmanager
+    def transaction(self, session_token: Optional[str] = None) -> Iterator[None]:
+        self.execute("BEGIN", session_token)
+        try:
+            yield
+        except BaseException:
+            self.execute("ROLLBACK", session_token)
+            raise
+        self.execute("COMMIT", session_token)
 
     def execute(self, sql: str, session_token: Optional[str] = None) -> Any:
         session = None
         if self.enable_auth:
             session = self.auth.validate(session_token)
+        return self._execute_ast(self.parse_cache.parse(sql), session)
+
+    def prepare(self, sql: str) -> "PreparedStatement":
+        return PreparedStatement(self, sql)
+
+    def executemany(
+        self,
+        sql: str,
+        seq_of_params: Iterable[Union[Sequence[Any], Mapping[str, Any]]],
+        session_token: Optional[str] = None,
+    ) -> int:
+        return self.prepare(sql).executemany(seq_of_params, session_token)
 
-        ast = parse(sql)
+    def _execute_ast(self, ast: Dict[str, Any], session: Any) -> Any:
         t = ast["type"]
 
         is_admin = True
         if self.enable_auth:
             is_admin = self._is_admin(session.user_id)
 
+        txn = self._transaction()
+        try:
+            result = self._dispatch(ast, session, is_admin, txn)
+        except LockTimeout as e:
+            if txn is None or txn.closed:
+                raise
+            # Most likely a deadlock with another transaction; giving up this one's locks
+            # lets the other proceed.
+            self._end_transaction(txn, commit=False)
+            raise LockTimeout(f"{e}; transaction rolled back") from None
+        if t != "SELECT":
+            # Waiting for the log flush only once the table locks are released lets the
+            # writers queued behind this statement join the same flush (group commit).
+            self.catalog.wal.wait_durable()
+        self.catalog.maybe_checkpoint()
+        return result
+
+    def _dispatch(self, ast: Dict[str, Any], session: Any, is_admin: bool, txn: Optional[Transaction]) -> Any:
+        t = ast["type"]
+        if t in _SCHEMA_CHANGES:
+            self._check_no_transaction(t.replace("_", " "))
+            with self._exclusive():
+                return self._apply_ast(ast, session, is_admin, txn)
+        if t == "SELECT" or (t == "COPY" and ast["direction"] == "TO"):
+            # Reads lock for themselves, only while their snapshots are taken (_open_select).
+            return self._apply_ast(ast, session, is_admin, txn)
+
+        if t == "BEGIN":
+            if txn is not None:
+                raise SchemaError("Transaction already in progress")
+            txn = self.catalog.begin()
+            with self._txn_lock:
+                self._transactions[threading.get_ident()] = txn
+            return 1
+        if t in ("COMMIT", "ROLLBACK"):
+            if txn is None:
+                raise SchemaError("No transaction in progress")
+            self._end_transaction(txn, commit=t == "COMMIT")
+            return 1
+        if t == "COPY":
+            self._check_no_transaction("COPY FROM")
+
+        if txn is not None:
+            # The catalog is read-locked for the whole transaction; the table stays
+            # write-locked until it ends.
+            if self.catalog.has_table(ast["table"]):
+                txn.lock(self.catalog.get_table(ast["table"]), self.lock_timeout)
+            return self._apply_ast(ast, session, is_admin, txn)
+        releases = self._lock(writes=[ast["table"]])
+        try:
+            return self._apply_ast(ast, session, is_admin, txn)
+        finally:
+            _unlock(releases)
+
+    def _apply_ast(self, ast: Dict[str, Any], session: Any, is_admin: bool, txn: Optional[Transaction]) -> Any:
+        t = ast["type"]
+        log = self.catalog.log if txn is None else txn.log
+
         if t == "DROP_TABLE":
             self.catalog.drop_table(ast["table"])
             return 1
 
+        if t == "CREATE_INDEX":
+            self.catalog.create_index(ast["name"], ast["table"], ast["column"], ast["kind"])
+            return 1
+
+        if t == "DROP_INDEX":
+            self.catalog.drop_index(ast["name"])
+            return 1
+
         if t == "CREATE_TABLE":
             cols = [
                 Column(
@@ -111,52 +375,41 @@ class MiniDB:
 
         if t == "INSERT":
             table = self.catalog.get_table(ast["table"])
-            row = dict(ast["row"])
+            rows = [dict(row) for row in ast["rows"]]
             if self.enable_auth and "user_id" in table.schema and not is_admin:
-                row["user_id"] = session.user_id
-            table.insert(row)
-            table.persist()
-            return 1
+                for row in rows:
+                    row["user_id"] = session.user_id
+            undo = None if txn is None else txn.undo_log(table)
+            if len(rows) == 1:
+                table.insert(rows[0], undo)
+                log(table, {"op": "insert", "row": rows[0]})
+                return 1
+            n = table.insert_many(rows, undo)
+            log(table, {"op": "insert_many", "rows": rows})
+            return n
 
         if t == "SELECT":
-            if ast.get("join") is None:
-                table = self.catalog.get_table(ast["table"])
-                where = ast.get("where")
-                if self.enable_auth and "user_id" in table.schema and not is_admin:
-                    where = self._and_where(where, ("user_id", "=", session.user_id))
-                return table.select(ast.get("columns"), where)
-
-            left = self.catalog.get_table(ast["table"])
-            join = ast["join"]
-            right = self.catalog.get_table(join["table"])
-
-            where_left = ast.get("where")
-            if self.enable_auth and "user_id" in left.schema and not is_admin:
-                where_left = self._and_where(where_left, ("user_id", "=", session.user_id))
-
-            where_right = None
-            if self.enable_auth and "user_id" in right.schema and not is_admin:
-                where_right = ("user_id", "=", session.user_id)
+            rows, releases = self._open_select(ast, session, is_admin)
+            try:
+                return list(rows)
+            finally:
+                _unlock(releases)
 
-            left_rows = left.select(["*"], where_left)
-            results: List[Dict[str, Any]] = []
-            for lr in left_rows:
-                lv = lr.get(join["left"])
-                join_cond: Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]] = (join["right"], "=", lv)
-                if where_right is not None:
-                    join_cond = self._and_where(join_cond, where_right)
-                rr = right.select(["*"], join_cond)
-                for rrow in rr:
-                    merged = {**{f"{left.name}.{k}": v for k, v in lr.items()}, **{f"{right.name}.{k}": v for k, v in rrow.items()}}
-                    results.append(merged)
-
-            cols = ast.get("columns")
-            if cols == ["*"]:
-                return results
-            projected: List[Dict[str, Any]] = []
-            for row in results:
-                projected.append({c: row.get(c) for c in cols})
-            return projected
+        if t == "COPY":
+            if not is_admin:
+                raise AuthError("COPY requires an admin user")
+            if not isinstance(ast["path"], str):
+                raise SchemaError("COPY path must be a string")
+            path = self._copy_path(ast["path"])
+            if ast["direction"] == "FROM":
+                return self._copy_from(ast["table"], path, ast["format"])
+            columns = self.catalog.get_table(ast["table"]).resolve_columns(None)
+            fmt = bulk.infer_format(path, ast["format"])
+            rows, releases = self._open_select({"type": "SELECT", "table": ast["table"], "columns": columns}, session, is_admin)
+            try:
+                return bulk.write_rows(path, fmt, columns, rows)
+            finally:
+                _unlock(releases)
 
         if t == "UPDATE":
             table = self.catalog.get_table(ast["table"])
@@ -165,8 +418,9 @@ class MiniDB:
                 if "user_id" in ast["updates"]:
                     raise SchemaError("Cannot update user_id")
                 where = self._and_where(where, ("user_id", "=", session.user_id))
-            n = table.update(ast["updates"], where)
-            table.persist()
+            n = table.update(ast["updates"], where, None if txn is None else txn.undo_log(table))
+            if n:
+                log(table, {"op": "update", "updates": ast["updates"], "where": where})
             return n
 
         if t == "DELETE":
@@ -174,12 +428,248 @@ class MiniDB:
             where = ast.get("where")
             if self.enable_auth and "user_id" in table.schema and not is_admin:
                 where = self._and_where(where, ("user_id", "=", session.user_id))
-            n = table.delete(where)
-            table.persist()
+            n = table.delete(where, None if txn is None else txn.undo_log(table))
+            if n:
+                log(table, {"op": "delete", "where": where})
             return n
 
         raise SchemaError("Unsupported AST")
 
+    def bulk_load(
+        self,
+        table: str,
+        source: Union[str, Iterable[Mapping[str, Any]]],
+        format: Optional[str] = None,
+        session_token: Optional[str] = None,
+    ) -> int:
+        if self.enable_auth and not self._is_admin(self.auth.validate(session_token).user_id):
+            raise AuthError("Bulk load requires an admin user")
+        self._check_no_transaction("Bulk load")
+        with self._locked(writes=[table]):
+            if isinstance(source, str):
+                return self._copy_from(table, source, format)
+            return self.catalog.bulk_load(table, source)
+
+    def _copy_path(self, path: str) -> str:
+        # Resolves a COPY file name relative to copy_dir. Symlinks and ".." are resolved
+        # before the check, so neither leads outside it, and the database's own files are
+        # never reachable.
+        if self.copy_dir is None:
+            raise AuthError("COPY is disabled (open the database with copy_dir=...)")
+        full = os.path.realpath(os.path.join(self.copy_dir, path))
+        if os.path.commonpath([self.copy_dir, full]) != self.copy_dir:
+            raise AuthError("COPY path is outside the copy directory")
+        db_dir = os.path.realpath(self.persistence_dir)
+        if os.path.commonpath([db_dir, full]) == db_dir:
+            raise AuthError("COPY path is inside the database directory")
+        return full
+
+    def _copy_from(self, table: str, path: str, fmt: Optional[str]) -> int:
+        fmt = bulk.infer_format(path, fmt)
+        self.catalog.get_table(table)
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if fmt == "jsonl":
+                return self.catalog.bulk_load(table, bulk.read_jsonl(f))
+            header, records = bulk.read_csv(f)
+            if header is None:
+                return 0
+            return self.catalog.bulk_load(table, records, header, text=True)
+
+    def execute_iter(self, sql: str, session_token: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        session = None
+        if self.enable_auth:
+            session = self.auth.validate(session_token)
+        return self._iter_ast(self.parse_cache.parse(sql), session)
+
+    def _iter_ast(self, ast: Dict[str, Any], session: Any) -> Iterator[Dict[str, Any]]:
+        if ast["type"] != "SELECT":
+            raise SchemaError("execute_iter only supports SELECT")
+
+        is_admin = True
+        if self.enable_auth:
+            is_admin = self._is_admin(session.user_id)
+        return _LockedIterator(self, *self._open_select(ast, session, is_admin))
+
+    def _open_select(
+        self, ast: Dict[str, Any], session: Any, is_admin: bool
+    ) -> Tuple[Iterator[Dict[str, Any]], List[Callable[[], None]]]:
+        # The query reads table snapshots. Table read locks are held only while the snapshots
+        # are taken and the plan is set up; the rows then stream while writers proceed. The
+        # catalog stays read-locked until the iterator is done, which keeps schema changes
+        # and checkpoints away from the snapshots. Returns the rows and the release calls.
+        names = [ast["table"]] + ([] if ast.get("join") is None else [ast["join"]["table"]])
+        releases = self._lock(reads=names)
+        locked = len(releases)
+        try:
+            views: Dict[str, TableSnapshot] = {}
+            for name in names:
+                if name not in views:
+                    views[name] = self.catalog.get_table(name).snapshot()
+                    releases.append(views[name].close)
+            rows = self._select_iter(ast, session, is_admin, views)
+        except BaseException:
+            _unlock(releases)
+            raise
+        for release in reversed(releases[1:locked]):
+            release()
+        del releases[1:locked]
+        return rows, releases
+
+    def _select_iter(
+        self, ast: Dict[str, Any], session: Any, is_admin: bool, views: Dict[str, TableSnapshot]
+    ) -> Iterator[Dict[str, Any]]:
+        if ast.get("aggregates") is not None or ast.get("group_by") is not None:
+            return self._aggregate_iter(ast, session, is_admin, views)
+
+        order = ast.get("order_by")
+        count, offset = self._limit_offset(ast)
+        top_k = None if count is None else offset + count
+
+        if ast.get("join") is None:
+            table = views[ast["table"]]
+            where = ast.get("where")
+            if self.enable_auth and "user_id" in table.schema and not is_admin:
+                where = self._and_where(where, ("user_id", "=", session.user_id))
+            if not order:
+                return executor.limit(executor.scan(table, ast.get("columns"), where), count, offset)
+            for col, _desc in order:
+                if col not in table.schema:
+                    raise SchemaError(f"Unknown column: {col}")
+            if len(order) == 1:
+                ordered = table.iter_ordered(order[0][0], order[0][1], ast.get("columns"), where)
+                if ordered is not None:
+                    return executor.limit(ordered, count, offset)
+            columns = table.resolve_columns(ast.get("columns"))
+            rows = executor.order_by(table.iter_rows(where), order, top_k)
+            return executor.limit(executor.project(rows, columns), count, offset)
+
+        left = views[ast["table"]]
+        join = ast["join"]
+        right = views[join["table"]]
+
+        where_left = ast.get("where")
+        if self.enable_auth and "user_id" in left.schema and not is_admin:
+            where_left = self._and_where(where_left, ("user_id", "=", session.user_id))
+
+        where_right = None
+        if self.enable_auth and "user_id" in right.schema and not is_admin:
+            where_right = ("user_id", "=", session.user_id)
+
+        pairs = executor.join(left, right, join["left"], join["right"], where_left, where_right)
+        rows = executor.merge(pairs, left, right)
+        if order:
+            keys = [(self._join_key(left, right, col), desc) for col, desc in order]
+            rows = executor.order_by(rows, keys, top_k)
+        rows = executor.limit(rows, count, offset)
+        cols = ast.get("columns")
+        if cols == ["*"]:
+            return rows
+        return executor.project(rows, cols)
+
+    def _limit_offset(self, ast: Dict[str, Any]) -> Tuple[Optional[int], int]:
+        count = ast.get("limit")
+        offset = ast.get("offset") or 0
+        for v in (count, offset):
+            if v is not None and (not isinstance(v, int) or v < 0):
+                raise SchemaError("LIMIT and OFFSET must be non-negative integers")
+        return count, offset
+
+    def _join_key(self, left: TableSnapshot, right: TableSnapshot, col: str) -> str:
+        side, name = self._join_ref(left, right, col)
+        return f"{(left, right)[side].name}.{name}"
+
+    def _join_ref(self, left: TableSnapshot, right: TableSnapshot, col: str) -> Tuple[int, str]:
+        if "." in col:
+            table, name = col.split(".", 1)
+            if table == left.name and name in left.schema:
+                return 0, name
+            if table == right.name and name in right.schema:
+                return 1, name
+        elif col in left.schema:
+            return 0, col
+        elif col in right.schema:
+            return 1, col
+        raise SchemaError(f"Unknown column: {col}")
+
+    def _aggregate_iter(
+        self, ast: Dict[str, Any], session: Any, is_admin: bool, views: Dict[str, TableSnapshot]
+    ) -> Iterator[Dict[str, Any]]:
+        group = ast.get("group_by") or []
+        aggregates = ast.get("aggregates") or []
+        refs = group + [col for _name, _func, col in aggregates if col != "*"]
+
+        left = views[ast["table"]]
+        where = ast.get("where")
+        if self.enable_auth and "user_id" in left.schema and not is_admin:
+            where = self._and_where(where, ("user_id", "=", session.user_id))
+
+        if ast.get("join") is None:
+            for c in refs:
+                if c not in left.schema:
+                    raise SchemaError(f"Unknown column: {c}")
+            dtypes = {c: left.schema[c] for c in refs}
+            records, keys = left.iter_records(refs, where)
+        else:
+            join = ast["join"]
+            right = views[join["table"]]
+            where_right = None
+            if self.enable_auth and "user_id" in right.schema and not is_admin:
+                where_right = ("user_id", "=", session.user_id)
+            sides = [self._join_ref(left, right, c) for c in refs]
+            dtypes = {c: (left, right)[side].schema[name] for c, (side, name) in zip(refs, sides)}
+            pairs = executor.join(left, right, join["left"], join["right"], where, where_right)
+            records = (tuple(pair[side].get(name) for side, name in sides) for pair in pairs)
+            keys = list(range(len(refs)))
+
+        field = dict(zip(refs, keys))
+        specs: List[Tuple[str, str, Any]] = []
+        for name, func, col in aggregates:
+            if col == "*":
+                specs.append((name, func, None))
+                continue
+            if func in ("SUM", "AVG") and dtypes[col] not in ("INT", "FLOAT"):
+                raise SchemaError(f"{func} requires a numeric column: {col}")
+            specs.append((name, func, field[col]))
+
+        outputs = set(group) | {name for name, _func, _col in aggregates}
+        having = ast.get("having")
+        order = ast.get("order_by") or []
+        for name in ([having[0]] if having else []) + [col for col, _desc in order]:
+            if name not in outputs:
+                raise SchemaError(f"Unknown column: {name}")
+
+        rows: Optional[Iterable[Dict[str, Any]]] = None
+        if not group and where is None and ast.get("join") is None:
+            rows = self._index_aggregate(left, aggregates)
+        if rows is None:
+            rows = executor.hash_aggregate(records, [(c, field[c]) for c in group], specs)
+        if having is not None:
+            name, op, v = having
+            rows = executor.filter_rows(rows, lambda r: executor.compare(r.get(name), op, v))
+        count, offset = self._limit_offset(ast)
+        if order:
+            rows = executor.order_by(rows, order, None if count is None else offset + count)
+        rows = executor.limit(rows, count, offset)
+        return executor.project(rows, ast["columns"])
+
+    def _index_aggregate(
+        self, table: TableSnapshot, aggregates: List[Tuple[str, str, str]]
+    ) -> Optional[List[Dict[str, Any]]]:
+        # Without WHERE or GROUP BY, MIN and MAX of a BTREE-indexed column are the ends of its
+        # index (NULLs are not indexed) and COUNT(*) is the row count, so such a query reads
+        # no rows. Runs while the snapshot is set up, under the table lock, so the index
+        # matches the snapshot. None when an aggregate needs the scan.
+        out: Dict[str, Any] = {}
+        for name, func, col in aggregates:
+            if func == "COUNT" and col == "*":
+                out[name] = table.row_count()
+                continue
+            index = table.ordered_index(col) if func in ("MIN", "MAX") else None
+            if index is None:
+                return None
+            out[name] = index.min() if func == "MIN" else index.max()
+        return [out]
+
     def _and_where(
         self,
         a: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]],
@@ -191,12 +681,141 @@ class MiniDB:
             return a + [b]
         return [a, b]
 
+    def _check_no_transaction(self, what: str) -> None:
+        # Schema changes, bulk loads and checkpoints write table files directly, which must
+        # never pick up uncommitted rows. They wait for other threads' transactions (which
+        # hold the catalog read lock); inside one of the caller's own they are refused.
+        if self._transaction() is not None:
+            raise SchemaError(f"{what} is not allowed inside a transaction")
+
     def _is_admin(self, user_id: int) -> bool:
         if not self.enable_auth:
             return True
-        users = self.catalog.get_table("users")
-        r = users.select(["is_admin"], ("id", "=", user_id))
+        releases = self._lock(reads=["users"])
+        try:
+            r = self.catalog.get_table("users").select(["is_admin"], ("id", "=", user_id))
+        finally:
+            _unlock(releases)
         if not r:
             return False
         v = r[0].get("is_admin")
         return bool(v) and int(v) != 0
+
+
+def _unlock(releases: List[Callable[[], None]]) -> None:
+    while releases:
+        releases.pop()()
+
+
+class _LockedIterator:
+    # Holds the catalog read lock and the table snapshots of a streamed SELECT until the rows
+    # run out or the iterator is closed, from any thread, so old row versions are kept exactly
+    # as long as the consumer may still read them. An iterator collected without being
+    # closed does not release anything itself: a finalizer can run inside the lock code of
+    # the thread it interrupts. It leaves its releases to the next statement instead.
+    def __init__(self, db: MiniDB, rows: Iterator[Dict[str, Any]], releases: List[Callable[[], None]]):
+        self._db = db
+        self._rows = rows
+        self._releases = releases
+
+    def __iter__(self) -> "_LockedIterator":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        try:
+            return next(self._rows)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self._rows = iter(())
+        _unlock(self._releases)
+
+    def __del__(self) -> None:
+        if self._releases:
+            self._db._abandoned.append(self._releases)
+
+
+class PreparedStatement:
+    def __init__(self, db: MiniDB, sql: str):
+        self.db = db
+        self.sql = sql
+        template = parse(sql)
+        self.type = template["type"]
+        keys = param_keys(template)
+        self.param_count = sum(1 for k in keys if isinstance(k, int))
+        self.param_names = {k for k in keys if isinstance(k, str)}
+        if self.param_count and self.param_names:
+            raise ParseError("Cannot mix ? and named parameters")
+        self._bind = compile_template(template)
+        self._check_columns(template)
+
+    def _check_columns(self, ast: Dict[str, Any]) -> None:
+        if ast["type"] not in ("SELECT", "UPDATE", "DELETE") or ast.get("join") is not None:
+            return
+        if not self.db.catalog.has_table(ast["table"]):
+            return
+        schema = self.db.catalog.get_table(ast["table"]).schema
+        refs: List[str] = list(ast.get("updates") or ())
+        where = ast.get("where")
+        refs += [c for c, _op, _v in ([] if where is None else where if isinstance(where, list) else [where])]
+        if ast["type"] == "SELECT":
+            if ast.get("aggregates") is not None or ast.get("group_by") is not None:
+                refs += (ast.get("group_by") or []) + [c for _n, _f, c in ast["aggregates"] or [] if c != "*"]
+            else:
+                refs += [c for c in ast["columns"] if c != "*"] + [c for c, _desc in ast.get("order_by") or []]
+        for c in refs:
+            if c not in schema:
+                raise SchemaError(f"Unknown column: {c}")
+
+    def _ast(self, params: Union[Sequence[Any], Mapping[str, Any]]) -> Dict[str, Any]:
+        if self.param_names:
+            if not isinstance(params, Mapping):
+                raise ParseError("Named parameters require a mapping")
+            missing = self.param_names - params.keys()
+            if missing:
+                raise ParseError(f"Missing parameter: {sorted(missing)[0]}")
+        elif isinstance(params, Mapping) or len(params) != self.param_count:
+            raise ParseError(f"Expected {self.param_count} parameters")
+        return self._bind(params)
+
+    def execute(
+        self,
+        params: Union[Sequence[Any], Mapping[str, Any]] = (),
+        session_token: Optional[str] = None,
+    ) -> Any:
+        session = None
+        if self.db.enable_auth:
+            session = self.db.auth.validate(session_token)
+        return self.db._execute_ast(self._ast(params), session)
+
+    def executemany(
+        self,
+        seq_of_params: Iterable[Union[Sequence[Any], Mapping[str, Any]]],
+        session_token: Optional[str] = None,
+    ) -> int:
+        session = None
+        if self.db.enable_auth:
+            session = self.db.auth.validate(session_token)
+        if self.type == "SELECT":
+            raise SchemaError("executemany does not support SELECT")
+        asts = [self._ast(params) for params in seq_of_params]
+        if not asts:
+            return 0
+        if self.type == "INSERT":
+            # One INSERT of every bound row: validated and UNIQUE-checked in a single pass
+            # and written to the log as one record.
+            rows = [row for ast in asts for row in ast["rows"]]
+            return self.db._execute_ast({**asts[0], "rows": rows}, session)
+        return sum(self.db._execute_ast(ast, session) for ast in asts)
+
+    def execute_iter(
+        self,
+        params: Union[Sequence[Any], Mapping[str, Any]] = (),
+        session_token: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        session = None
+        if self.db.enable_auth:
+            session = self.db.auth.validate(session_token)
+        return self.db._iter_ast(self._ast(params), session)
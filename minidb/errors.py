@@ -20,3 +20,11 @@ class ConstraintViolation(MiniDBError):
 
 class AuthError(MiniDBError):
     pass
+
+
+class LockTimeout(MiniDBError):
+    pass
+
+
+class DatabaseLocked(MiniDBError):
+    pass
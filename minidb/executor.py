@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import heapq
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .errors import SchemaError
+from .storage import Table, TableSnapshot, _coerce_value
+
+
+Row = Dict[str, Any]
+Where = Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]]
+Source = Union[Table, TableSnapshot]
+
+
+def scan(table: Source, columns: Optional[List[str]] = None, where: Where = None) -> Iterator[Row]:
+    return table.iter_select(columns, where)
+
+
+def filter_rows(rows: Iterable[Row], predicate: Callable[[Row], bool]) -> Iterator[Row]:
+    for row in rows:
+        if predicate(row):
+            yield row
+
+
+def project(rows: Iterable[Row], columns: List[str]) -> Iterator[Row]:
+    for row in rows:
+        yield {c: row.get(c) for c in columns}
+
+
+def limit(rows: Iterable[Row], count: Optional[int], offset: int = 0) -> Iterator[Row]:
+    return islice(rows, offset, None if count is None else offset + count)
+
+
+_AGGREGATORS: Dict[Tuple[Any, ...], Callable[..., None]] = {}
+
+_SLOT_UPDATES = {
+    "COUNT": "s[{j}] += 1",
+    "SUM": "s[{j}] = v if s[{j}] is None else s[{j}] + v",
+    "MIN": "if s[{j}] is None or v < s[{j}]: s[{j}] = v",
+    "MAX": "if s[{j}] is None or v > s[{j}]: s[{j}] = v",
+}
+
+
+def _field(key: Any) -> str:
+    return f"row[{key}]" if isinstance(key, int) else f"row.get({key!r})"
+
+
+def _aggregator(group_keys: Tuple[Any, ...], slots: Tuple[Tuple[str, Any], ...]) -> Callable[..., None]:
+    shape = (group_keys, slots)
+    fn = _AGGREGATORS.get(shape)
+    if fn is None:
+        if len(group_keys) == 1:
+            key = _field(group_keys[0])
+        else:
+            key = "(" + "".join(f"{_field(k)}, " for k in group_keys) + ")"
+        lines = [
+            "def aggregate(rows, groups, init):",
+            "    get = groups.get",
+            "    for row in rows:",
+            f"        key = {key}",
+            "        s = get(key)",
+            "        if s is None:",
+            "            s = groups[key] = init[:]",
+        ]
+        for j, (func, field) in enumerate(slots):
+            update = _SLOT_UPDATES[func].format(j=j)
+            if field is None:
+                lines.append(f"        {update}")
+            else:
+                lines.append(f"        v = {_field(field)}")
+                lines.append("        if v is not None:")
+                lines.append(f"            {update}")
+        scope: Dict[str, Any] = {}
+        exec("\n".join(lines), scope)
+        fn = scope["aggregate"]
+        _AGGREGATORS[shape] = fn
+    return fn
+
+
+def hash_aggregate(
+    rows: Iterable[Any],
+    group_by: List[Tuple[str, Any]],
+    aggregates: List[Tuple[str, str, Any]],
+) -> Iterator[Row]:
+    # Input rows are read through keys: dict rows by column name, value tuples by index.
+    # group_by pairs an output name with its key; an aggregate key of None means COUNT(*).
+    # Each group keeps one state slot per running value (AVG keeps a sum and a count),
+    # updated by a loop generated once per query shape.
+    slots: List[Tuple[str, Any]] = []
+    finals: List[Tuple[str, Callable[[List[Any]], Any]]] = []
+    for name, func, field in aggregates:
+        j = len(slots)
+        if func == "AVG":
+            slots += [("SUM", field), ("COUNT", field)]
+            finals.append((name, lambda s, j=j: s[j] / s[j + 1] if s[j + 1] else None))
+        else:
+            slots.append((func, field))
+            finals.append((name, lambda s, j=j: s[j]))
+    init = [0 if func == "COUNT" else None for func, _field in slots]
+    names = [name for name, _key in group_by]
+
+    groups: Dict[Any, List[Any]] = {}
+    _aggregator(tuple(key for _name, key in group_by), tuple(slots))(rows, groups, init)
+    if not groups and not group_by:
+        groups[()] = list(init)
+
+    for key, state in groups.items():
+        out = dict(zip(names, (key,) if len(names) == 1 else key))
+        for name, final in finals:
+            out[name] = final(state)
+        yield out
+
+
+def compare(left: Any, op: str, right: Any) -> bool:
+    if left is None or right is None:
+        return op == "=" and left is right
+    try:
+        if op == "=":
+            return left == right
+        if op == "<":
+            return left < right
+        if op == ">":
+            return left > right
+    except TypeError:
+        return False
+    raise SchemaError(f"Unsupported operator: {op}")
+
+
+class _MixedKey:
+    __slots__ = ("parts", "descending")
+
+    def __init__(self, parts: Tuple[Tuple[Any, ...], ...], descending: List[bool]):
+        self.parts = parts
+        self.descending = descending
+
+    def __lt__(self, other: "_MixedKey") -> bool:
+        for a, b, desc in zip(self.parts, other.parts, self.descending):
+            if a != b:
+                return a > b if desc else a < b
+        return False
+
+
+def _sort_key(keys: List[Tuple[str, bool]]) -> Tuple[Callable[[Row], Any], bool]:
+    # NULL sorts before every value: (0,) < (1, v) for any v.
+    names = [c for c, _desc in keys]
+    descending = [desc for _c, desc in keys]
+    if len(names) == 1:
+        name = names[0]
+        return (lambda row: (0,) if row.get(name) is None else (1, row.get(name))), descending[0]
+    if len(set(descending)) == 1:
+        return (lambda row: tuple((0,) if v is None else (1, v) for v in map(row.get, names))), descending[0]
+    return (
+        lambda row: _MixedKey(tuple((0,) if v is None else (1, v) for v in map(row.get, names)), descending)
+    ), False
+
+
+def order_by(rows: Iterable[Row], keys: List[Tuple[str, bool]], count: Optional[int] = None) -> Iterator[Row]:
+    key, reverse = _sort_key(keys)
+    if count is None:
+        return iter(sorted(rows, key=key, reverse=reverse))
+    top_k = heapq.nlargest if reverse else heapq.nsmallest
+    return iter(top_k(count, rows, key=key))
+
+
+def join(
+    left: Source,
+    right: Source,
+    left_col: str,
+    right_col: str,
+    where_left: Where = None,
+    where_right: Where = None,
+) -> Iterator[Tuple[Row, Row]]:
+    for table, col in ((left, left_col), (right, right_col)):
+        if col not in table.schema:
+            raise SchemaError(f"Unknown column: {col}")
+    right_dtype = right.schema[right_col]
+
+    def key(v: Any) -> Any:
+        if v is None:
+            return None
+        try:
+            return _coerce_value(v, right_dtype)
+        except (SchemaError, ValueError):
+            return None
+
+    left_rows = left.iter_rows(where_left)
+    right_filter = right.compile_where(where_right).match
+    probe = right.index_probe(right_col)
+    if probe is not None and left.row_count() <= right.row_count():
+        return _index_join(left_rows, left_col, key, probe, right_filter)
+    if right.row_count() <= left.row_count():
+        return _hash_join(left_rows, left_col, key, right.iter_rows(where_right), right_col)
+    return _hash_join_build_left(left_rows, left_col, key, right.iter_rows(where_right), right_col)
+
+
+def _index_join(
+    left_rows: Iterator[Row],
+    left_col: str,
+    key: Callable[[Any], Any],
+    probe: Callable[[Any], List[Row]],
+    right_filter: Callable[[Row], bool],
+) -> Iterator[Tuple[Row, Row]]:
+    for lr in left_rows:
+        k = key(lr.get(left_col))
+        if k is None:
+            continue
+        for rr in filter_rows(probe(k), right_filter):
+            yield lr, rr
+
+
+def _hash_join(
+    left_rows: Iterator[Row],
+    left_col: str,
+    key: Callable[[Any], Any],
+    right_rows: Iterator[Row],
+    right_col: str,
+) -> Iterator[Tuple[Row, Row]]:
+    built: Dict[Any, List[Row]] = {}
+    for rr in right_rows:
+        k = rr.get(right_col)
+        if k is not None:
+            built.setdefault(k, []).append(rr)
+    for lr in left_rows:
+        k = key(lr.get(left_col))
+        if k is not None:
+            for rr in built.get(k, ()):
+                yield lr, rr
+
+
+def _hash_join_build_left(
+    left_rows: Iterator[Row],
+    left_col: str,
+    key: Callable[[Any], Any],
+    right_rows: Iterator[Row],
+    right_col: str,
+) -> Iterator[Tuple[Row, Row]]:
+    built: Dict[Any, List[Row]] = {}
+    for lr in left_rows:
+        k = key(lr.get(left_col))
+        if k is not None:
+            built.setdefault(k, []).append(lr)
+    for rr in right_rows:
+        for lr in built.get(rr.get(right_col), ()):
+            yield lr, rr
+
+
+def merge(pairs: Iterable[Tuple[Row, Row]], left: Source, right: Source) -> Iterator[Row]:
+    left_keys = [(f"{left.name}.{c}", c) for c in left.schema]
+    right_keys = [(f"{right.name}.{c}", c) for c in right.schema]
+    for lr, rr in pairs:
+        merged = {k: lr.get(c) for k, c in left_keys}
+        merged.update({k: rr.get(c) for k, c in right_keys})
+        yield merged
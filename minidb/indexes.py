@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+class OrderedIndex:
+    def __init__(self, pairs: Iterable[Tuple[Any, int]] = ()):
+        ordered = sorted(pairs)
+        self._keys: List[Any] = [k for k, _ in ordered]
+        self._pos: List[int] = [p for _, p in ordered]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Any, pos: int) -> None:
+        j = bisect_right(self._keys, key)
+        self._keys.insert(j, key)
+        self._pos.insert(j, pos)
+
+    def remove(self, key: Any, pos: int) -> None:
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        for j in range(lo, hi):
+            if self._pos[j] == pos:
+                del self._keys[j]
+                del self._pos[j]
+                return
+
+    def _bounds(self, low: Any, low_inclusive: bool, high: Any, high_inclusive: bool) -> Tuple[int, int]:
+        lo = 0
+        hi = len(self._keys)
+        if low is not None:
+            lo = bisect_left(self._keys, low) if low_inclusive else bisect_right(self._keys, low)
+        if high is not None:
+            hi = bisect_right(self._keys, high) if high_inclusive else bisect_left(self._keys, high)
+        return lo, max(lo, hi)
+
+    def range(
+        self,
+        low: Any = None,
+        high: Any = None,
+        low_inclusive: bool = True,
+        high_inclusive: bool = True,
+    ) -> List[int]:
+        lo, hi = self._bounds(low, low_inclusive, high, high_inclusive)
+        return self._pos[lo:hi]
+
+    def count_range(
+        self,
+        low: Any = None,
+        high: Any = None,
+        low_inclusive: bool = True,
+        high_inclusive: bool = True,
+    ) -> int:
+        lo, hi = self._bounds(low, low_inclusive, high, high_inclusive)
+        return hi - lo
+
+    def min(self) -> Optional[Any]:
+        return self._keys[0] if self._keys else None
+
+    def max(self) -> Optional[Any]:
+        return self._keys[-1] if self._keys else None
+
+    def positions(
+        self,
+        descending: bool = False,
+        low: Any = None,
+        high: Any = None,
+        low_inclusive: bool = True,
+        high_inclusive: bool = True,
+    ) -> Iterator[int]:
+        lo, hi = self._bounds(low, low_inclusive, high, high_inclusive)
+        pos = self._pos
+        if descending:
+            return (pos[j] for j in range(hi - 1, lo - 1, -1))
+        return (pos[j] for j in range(lo, hi))
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class RWLock:
+    # Many readers or one writer. Waiting writers block new readers so a steady stream of
+    # SELECTs cannot starve them. Both sides are reentrant for the holding thread, and the
+    # writer may also take the read side; upgrading a read lock to a write lock is refused.
+    def __init__(self) -> None:
+        self._mutex = threading.Lock()
+        self._cond = threading.Condition(self._mutex)
+        self._readers: Dict[int, int] = {}
+        self._writer: Optional[int] = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self, timeout: Optional[float] = None) -> bool:
+        me = threading.get_ident()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._mutex:
+            readers = self._readers
+            if me not in readers and self._writer != me:
+                while self._writer is not None or self._waiting_writers:
+                    if not _wait(self._cond, deadline):
+                        return False
+            readers[me] = readers.get(me, 0) + 1
+            return True
+
+    def release_read(self, owner: Optional[int] = None) -> None:
+        # `owner` is the ident of the thread that acquired the lock, for releasing it from
+        # another thread (e.g. when a result iterator is closed elsewhere).
+        me = threading.get_ident() if owner is None else owner
+        with self._mutex:
+            readers = self._readers
+            n = readers[me] - 1
+            if n:
+                readers[me] = n
+                return
+            del readers[me]
+            if not readers and self._waiting_writers:
+                self._cond.notify_all()
+
+    def acquire_write(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        me = threading.get_ident()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._mutex:
+            if self._writer == me:
+                self._writer_depth += 1
+                return True
+            if me in self._readers:
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            if not blocking:
+                if self._writer is not None or self._readers:
+                    return False
+            else:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        if not _wait(self._cond, deadline):
+                            return False
+                finally:
+                    self._waiting_writers -= 1
+                    if not self._waiting_writers:
+                        # Readers held back by this writer may go ahead if it gave up.
+                        self._cond.notify_all()
+            self._writer = me
+            self._writer_depth = 1
+            return True
+
+    def release_write(self) -> None:
+        with self._mutex:
+            self._writer_depth -= 1
+            if self._writer_depth == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def _wait(cond: threading.Condition, deadline: Optional[float]) -> bool:
+    # One wait on `cond`; False once `deadline` (a time.monotonic() value) has passed.
+    if deadline is None:
+        cond.wait()
+        return True
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return False
+    cond.wait(remaining)
+    return True
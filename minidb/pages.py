@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import os
+import struct
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .errors import SchemaError
+
+
+PAGE_SIZE = 4096
+
+_MAGIC = b"MDBPAGE2"
+_MAGIC_V1 = b"MDBPAGE1"
+# Magic, page size, data pages, row positions (slots).
+_FILE_HEADER = struct.Struct("<8sIII")
+# Slots, start of the row bodies, position of the first slot.
+_PAGE_HEADER = struct.Struct("<HHI")
+_PAGE_HEADER_V1 = struct.Struct("<HH")
+_SLOT = struct.Struct("<HH")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LEN = struct.Struct("<I")
+_JOURNAL_MAGIC = b"MDBJRNL1"
+_JOURNAL_HEADER = struct.Struct("<8sII")
+
+MAX_ROW_SIZE = PAGE_SIZE - _PAGE_HEADER.size - _SLOT.size
+
+
+class RowCodec:
+    def __init__(self, columns: Sequence[Tuple[str, str]]):
+        self.columns = list(columns)
+        self._bitmap_len = (len(self.columns) + 7) // 8
+
+    def encode(self, row: Dict[str, Any]) -> bytes:
+        bitmap = bytearray(self._bitmap_len)
+        parts: List[bytes] = []
+        for i, (name, dtype) in enumerate(self.columns):
+            v = row.get(name)
+            if v is None:
+                bitmap[i >> 3] |= 1 << (i & 7)
+                continue
+            try:
+                if dtype == "INT":
+                    parts.append(_INT.pack(v))
+                elif dtype == "FLOAT":
+                    parts.append(_FLOAT.pack(v))
+                else:
+                    data = v.encode("utf-8")
+                    parts.append(_LEN.pack(len(data)))
+                    parts.append(data)
+            except struct.error:
+                raise SchemaError(f"Value out of range for paged storage: {name}")
+        return bytes(bitmap) + b"".join(parts)
+
+    def decode(self, buf: bytes) -> Dict[str, Any]:
+        row: Dict[str, Any] = {}
+        pos = self._bitmap_len
+        for i, (name, dtype) in enumerate(self.columns):
+            if buf[i >> 3] & (1 << (i & 7)):
+                row[name] = None
+                continue
+            if dtype == "INT":
+                row[name] = _INT.unpack_from(buf, pos)[0]
+                pos += _INT.size
+            elif dtype == "FLOAT":
+                row[name] = _FLOAT.unpack_from(buf, pos)[0]
+                pos += _FLOAT.size
+            else:
+                n = _LEN.unpack_from(buf, pos)[0]
+                pos += _LEN.size
+                row[name] = buf[pos : pos + n].decode("utf-8")
+                pos += n
+        return row
+
+
+def _pack_pages(first: int, encoded: Sequence[bytes]) -> List[Tuple[int, int, bytes]]:
+    # Packs consecutive slots, the first at row position `first`, into as many pages as they
+    # need. Returns (first position, slot count, page) per page; b"" is a deleted row's slot.
+    pages: List[Tuple[int, int, bytes]] = []
+    page = bytearray(PAGE_SIZE)
+    slots = 0
+    free_end = PAGE_SIZE
+    for data in encoded:
+        slot_end = _PAGE_HEADER.size + (slots + 1) * _SLOT.size
+        if free_end - len(data) < slot_end:
+            _PAGE_HEADER.pack_into(page, 0, slots, free_end, first)
+            pages.append((first, slots, bytes(page)))
+            first += slots
+            page = bytearray(PAGE_SIZE)
+            slots = 0
+            free_end = PAGE_SIZE
+        free_end -= len(data)
+        page[free_end : free_end + len(data)] = data
+        _SLOT.pack_into(page, _PAGE_HEADER.size + slots * _SLOT.size, free_end, len(data))
+        slots += 1
+    if slots:
+        _PAGE_HEADER.pack_into(page, 0, slots, free_end, first)
+        pages.append((first, slots, bytes(page)))
+    return pages
+
+
+def _read_slots(page: bytes, header: struct.Struct) -> Tuple[Tuple[Any, ...], List[bytes]]:
+    fields = header.unpack_from(page, 0)
+    slots = []
+    for s in range(fields[0]):
+        off, n = _SLOT.unpack_from(page, header.size + s * _SLOT.size)
+        slots.append(page[off : off + n])
+    return fields, slots
+
+
+class PageFile:
+    # Row positions in the table are slot positions in the file. Every page header records
+    # the position of its first slot, and a deleted row leaves an empty slot behind, so a
+    # checkpoint re-encodes only the rows changed since the last one and rewrites only the
+    # pages holding them. A page that outgrows its 4 KiB is split and the rest goes to new
+    # pages at the end of the file; pages are otherwise in position order.
+    def __init__(self, path: str, columns: Sequence[Tuple[str, str]]):
+        self.path = path
+        self.codec = RowCodec(columns)
+        # (first position, slot count, page number) of each data page, by position. None
+        # while the file's layout is unknown; the next stage() then rewrites every page.
+        self._pages: Optional[List[Tuple[int, int, int]]] = None
+        self._staged: Optional[List[Tuple[int, int, int]]] = None
+
+    def check_row(self, row: Dict[str, Any]) -> None:
+        if len(self.codec.encode(row)) > MAX_ROW_SIZE:
+            raise SchemaError("Row too large for paged storage")
+
+    def read(self) -> List[Optional[Dict[str, Any]]]:
+        # Rows by position, None where a row was deleted. Files written before slots kept
+        # their positions (MDBPAGE1) are read too and rewritten whole at the next stage().
+        self._pages = None
+        if not os.path.exists(self.path):
+            self._pages = []
+            return []
+        pages: List[Tuple[int, int, int]] = []
+        with open(self.path, "rb") as f:
+            header = f.read(PAGE_SIZE)
+            magic, page_size, page_count, slot_count = _FILE_HEADER.unpack_from(header, 0)
+            if magic not in (_MAGIC, _MAGIC_V1) or page_size != PAGE_SIZE:
+                raise SchemaError(f"Not a MiniDB page file: {self.path}")
+            rows: List[Optional[Dict[str, Any]]] = [None] * slot_count
+            first = 0
+            for no in range(1, page_count + 1):
+                page = f.read(PAGE_SIZE)
+                if len(page) != PAGE_SIZE:
+                    raise SchemaError(f"Truncated page file: {self.path}")
+                if magic == _MAGIC:
+                    (_n, _free_end, first), slots = _read_slots(page, _PAGE_HEADER)
+                else:
+                    _fields, slots = _read_slots(page, _PAGE_HEADER_V1)
+                if first + len(slots) > slot_count:
+                    raise SchemaError(f"Corrupt page file: {self.path}")
+                for i, data in enumerate(slots, first):
+                    if data:
+                        rows[i] = self.codec.decode(data)
+                pages.append((first, len(slots), no))
+                if magic == _MAGIC_V1:
+                    first += len(slots)
+        if magic == _MAGIC:
+            self._pages = sorted(pages)
+        return rows
+
+    def stage(
+        self,
+        size: int,
+        row_at: Callable[[int], Optional[Dict[str, Any]]],
+        changed: Optional[Iterable[int]],
+    ) -> Optional[str]:
+        # Writes the pages holding the positions in `changed`, and those from the end of the
+        # file up to `size`, into a journal next to it and returns its path (None when
+        # nothing changed). row_at(i) is the row at position i, None if it was deleted;
+        # `changed` None rewrites every page. apply_journal() installs the journal; until
+        # then the page file is untouched, and applying it twice is harmless.
+        pages, self._pages = self._pages, None
+        encode = self.codec.encode
+
+        def encoded(positions: Iterable[int]) -> List[bytes]:
+            return [b"" if row is None else encode(row) for row in map(row_at, positions)]
+
+        slot_count = sum(n for _first, n, _no in pages) if pages else 0
+        writes: List[Tuple[int, bytes]] = []
+        rewrite = changed is None or not pages or size < slot_count or not os.path.exists(self.path)
+        if rewrite:
+            packed = _pack_pages(0, encoded(range(size)))
+            pages = [(first, n, no) for no, (first, n, _page) in enumerate(packed, 1)]
+            writes = [(no, page) for no, (_first, _n, page) in enumerate(packed, 1)]
+        else:
+            firsts = [first for first, _n, _no in pages]
+            dirty: Dict[int, List[int]] = {}
+            for i in changed:
+                if i < slot_count:
+                    dirty.setdefault(bisect_right(firsts, i) - 1, []).append(i)
+            if size > slot_count:
+                dirty.setdefault(len(pages) - 1, [])
+            page_count = max(no for _first, _n, no in pages)
+            added: List[Tuple[int, int, int]] = []
+            with open(self.path, "rb") as f:
+                for k in sorted(dirty):
+                    first, _n, no = pages[k]
+                    f.seek(no * PAGE_SIZE)
+                    _fields, slots = _read_slots(f.read(PAGE_SIZE), _PAGE_HEADER)
+                    for i, data in zip(dirty[k], encoded(dirty[k])):
+                        slots[i - first] = data
+                    if k == len(pages) - 1:
+                        slots.extend(encoded(range(slot_count, size)))
+                    for j, (piece_first, n, page) in enumerate(_pack_pages(first, slots)):
+                        if j:
+                            page_count += 1
+                            added.append((piece_first, n, page_count))
+                            writes.append((page_count, page))
+                        else:
+                            pages[k] = (piece_first, n, no)
+                            writes.append((no, page))
+            pages = sorted(pages + added)
+        self._staged = pages
+        if not rewrite and not writes:
+            return None
+        header = bytearray(PAGE_SIZE)
+        page_count = max((no for _first, _n, no in pages), default=0)
+        _FILE_HEADER.pack_into(header, 0, _MAGIC, PAGE_SIZE, page_count, size)
+        writes.insert(0, (0, bytes(header)))
+        journal = self.path + ".journal"
+        with open(journal, "wb") as f:
+            f.write(_JOURNAL_HEADER.pack(_JOURNAL_MAGIC, page_count + 1, len(writes)))
+            for i, page in writes:
+                f.write(_LEN.pack(i))
+                f.write(page)
+            f.flush()
+            os.fsync(f.fileno())
+        return journal
+
+    def commit_stage(self) -> None:
+        self._pages = self._staged
+
+
+def apply_journal(journal: str, path: str) -> int:
+    # Copies the journaled page images into the page file, truncates it to its new length
+    # and removes the journal. Returns the number of pages written.
+    with open(journal, "rb") as j:
+        magic, page_count, entries = _JOURNAL_HEADER.unpack(j.read(_JOURNAL_HEADER.size))
+        if magic != _JOURNAL_MAGIC:
+            raise SchemaError(f"Not a MiniDB page journal: {journal}")
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            for _ in range(entries):
+                (i,) = _LEN.unpack(j.read(_LEN.size))
+                page = j.read(PAGE_SIZE)
+                if len(page) != PAGE_SIZE:
+                    raise SchemaError(f"Truncated page journal: {journal}")
+                f.seek(i * PAGE_SIZE)
+                f.write(page)
+            f.truncate(page_count * PAGE_SIZE)
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(journal)
+    return entries
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import re
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from .bulk import COPY_FORMATS
 from .errors import ParseError
 
 
@@ -46,8 +49,23 @@ def _split_csv(content: str) -> List[str]:
     return items
 
 
-def _parse_value(token: str) -> Any:
+class Param:
+    __slots__ = ("key",)
+
+    def __init__(self, key: Any):
+        self.key = key
+
+    def __repr__(self) -> str:
+        return f"Param({self.key!r})"
+
+
+def _parse_value(token: str, params: Optional[List[Param]] = None) -> Any:
     t = token.strip()
+    if params is not None and (t == "?" or re.fullmatch(r":[A-Za-z_][A-Za-z0-9_]*", t)):
+        position = next((p.key + 1 for p in reversed(params) if isinstance(p.key, int)), 0)
+        param = Param(t[1:] if t != "?" else position)
+        params.append(param)
+        return param
     if t.upper() == "NULL":
         return None
     if len(t) >= 2 and t[0] == "'" and t[-1] == "'":
@@ -56,15 +74,86 @@ def _parse_value(token: str) -> Any:
         return int(t)
     if re.fullmatch(r"-?\d+\.\d+", t):
         return float(t)
+    if not t or t[0] == "'" or re.search(r"\s", t):
+        # A stray quote or several words (`'a' AND ...`, `- 5`): not one value.
+        raise ParseError(f"Invalid value: {t}")
     return t
 
 
+def _mask_strings(sql: str) -> str:
+    out: List[str] = []
+    in_str = False
+    for ch in sql:
+        if ch == "'":
+            in_str = not in_str
+            out.append(ch)
+        else:
+            out.append("_" if in_str else ch)
+    return "".join(out)
+
+
+_REF = r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?"
+_AGGREGATE = re.compile(r"(?is)^(COUNT|SUM|AVG|MIN|MAX)\s*\(\s*(\*|" + _REF + r")\s*\)$")
+
+
+_TUPLE = re.compile(r"\(([^)]*)\)\s*(,\s*)?")
+
+
+def _split_tuples(sql: str) -> List[str]:
+    # "(1, 'a'), (2, 'b)')" -> ["1, 'a'", "2, 'b)'"]; parentheses inside strings are masked.
+    masked = _mask_strings(sql)
+    out: List[str] = []
+    pos = 0
+    while pos < len(masked):
+        m = _TUPLE.match(masked, pos)
+        if not m or (m.group(2) is None and m.end() != len(masked)):
+            raise ParseError("Invalid INSERT")
+        out.append(sql[m.start(1) : m.end(1)])
+        pos = m.end()
+    if not out or m.group(2) is not None:
+        raise ParseError("Invalid INSERT")
+    return out
+
+
+def _split_select_tail(sql: str) -> Tuple[str, Dict[str, Optional[str]]]:
+    m = re.match(
+        r"(?is)^(.*?)(?:\s+GROUP\s+BY\s+(.+?))?(?:\s+HAVING\s+(.+?))?(?:\s+ORDER\s+BY\s+(.+?))?"
+        r"(?:\s+LIMIT\s+(\d+|\?|:[A-Za-z_][A-Za-z0-9_]*))?(?:\s+OFFSET\s+(\d+|\?|:[A-Za-z_][A-Za-z0-9_]*))?$",
+        _mask_strings(sql),
+    )
+    if not m:
+        raise ParseError("Invalid SELECT")
+    parts = {}
+    for i, key in enumerate(("group_by", "having", "order_by", "limit", "offset"), start=2):
+        parts[key] = sql[m.start(i) : m.end(i)] if m.group(i) else None
+    return sql[: m.end(1)], parts
+
+
+def _parse_aggregate(expr: str) -> Optional[Tuple[str, str]]:
+    m = _AGGREGATE.match(expr.strip())
+    if not m:
+        return None
+    return m.group(1).upper(), m.group(2)
+
+
+def _parse_ref(expr: str) -> str:
+    s = expr.strip()
+    if not re.fullmatch(_REF, s):
+        raise ParseError(f"Invalid identifier: {s}")
+    return s
+
+
 def parse(sql: str) -> Dict[str, Any]:
     sql = _strip_semicolon(sql)
     if sql == "":
         raise ParseError("Empty SQL")
+    params: List[Param] = []
 
     upper = sql.upper()
+    m = re.match(r"(?is)^(BEGIN|COMMIT|ROLLBACK)(?:\s+(?:TRANSACTION|WORK))?$", sql)
+    if m:
+        return {"type": m.group(1).upper()}
+
     if upper.startswith("DROP TABLE "):
         m = re.match(r"(?is)^DROP\s+TABLE\s+([A-Za-z_][A-Za-z0-9_]*)$", sql)
         if not m:
@@ -72,6 +161,27 @@ def parse(sql: str) -> Dict[str, Any]:
         table = _parse_identifier(m.group(1))
         return {"type": "DROP_TABLE", "table": table}
 
+    if upper.startswith("CREATE INDEX "):
+        m = re.match(
+            r"(?is)^CREATE\s+INDEX\s+([A-Za-z_][A-Za-z0-9_]*)\s+ON\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(\s*([A-Za-z_][A-Za-z0-9_]*)\s*\)(?:\s+USING\s+(HASH|BTREE))?$",
+            sql,
+        )
+        if not m:
+            raise ParseError("Invalid CREATE INDEX")
+        return {
+            "type": "CREATE_INDEX",
+            "name": _parse_identifier(m.group(1)),
+            "table": _parse_identifier(m.group(2)),
+            "column": _parse_identifier(m.group(3)),
+            "kind": (m.group(4) or "HASH").lower(),
+        }
+
+    if upper.startswith("DROP INDEX "):
+        m = re.match(r"(?is)^DROP\s+INDEX\s+([A-Za-z_][A-Za-z0-9_]*)$", sql)
+        if not m:
+            raise ParseError("Invalid DROP INDEX")
+        return {"type": "DROP_INDEX", "name": _parse_identifier(m.group(1))}
+
     if upper.startswith("CREATE TABLE "):
         m = re.match(r"(?is)^CREATE\s+TABLE\s+([A-Za-z_][A-Za-z0-9_]*)\s*\((.*)\)$", sql)
         if not m:
@@ -92,27 +202,47 @@ def parse(sql: str) -> Dict[str, Any]:
 
     if upper.startswith("INSERT INTO "):
         m = re.match(
-            r"(?is)^INSERT\s+INTO\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(([^)]*)\)\s+VALUES\s*\(([^)]*)\)$",
+            r"(?is)^INSERT\s+INTO\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(([^)]*)\)\s+VALUES\s*(\(.*\))$",
             sql,
         )
         if not m:
             raise ParseError("Invalid INSERT")
         table = _parse_identifier(m.group(1))
         cols = [_parse_identifier(x.strip()) for x in _split_csv(m.group(2))]
-        vals = [_parse_value(x) for x in _split_csv(m.group(3))]
-        if len(cols) != len(vals):
-            raise ParseError("INSERT columns/values mismatch")
-        return {"type": "INSERT", "table": table, "row": dict(zip(cols, vals))}
+        rows: List[Dict[str, Any]] = []
+        for values in _split_tuples(sql[m.start(3) :]):
+            vals = [_parse_value(x, params) for x in _split_csv(values)]
+            if len(cols) != len(vals):
+                raise ParseError("INSERT columns/values mismatch")
+            rows.append(dict(zip(cols, vals)))
+        return {"type": "INSERT", "table": table, "rows": rows}
+
+    if upper.startswith("COPY "):
+        m = re.match(
+            r"(?is)^COPY\s+([A-Za-z_][A-Za-z0-9_]*)\s+(FROM|TO)\s+('(?:[^']|'')*'|\?|:[A-Za-z_][A-Za-z0-9_]*)(?:\s*\(\s*FORMAT\s+([A-Za-z]+)\s*\))?$",
+            sql,
+        )
+        if not m:
+            raise ParseError("Invalid COPY")
+        fmt = m.group(4).lower() if m.group(4) else None
+        if fmt is not None and fmt not in COPY_FORMATS:
+            raise ParseError(f"Unsupported COPY format: {fmt}")
+        return {
+            "type": "COPY",
+            "table": _parse_identifier(m.group(1)),
+            "direction": m.group(2).upper(),
+            "path": _parse_value(m.group(3), params),
+            "format": fmt,
+        }
 
     if upper.startswith("SELECT "):
+        sql, tail = _split_select_tail(sql)
         m = re.match(
             r"(?is)^SELECT\s+(.*?)\s+FROM\s+([A-Za-z_][A-Za-z0-9_]*)(?:\s+JOIN\s+([A-Za-z_][A-Za-z0-9_]*)\s+ON\s+([A-Za-z_][A-Za-z0-9_]*)\s*=\s*([A-Za-z_][A-Za-z0-9_]*))?(?:\s+WHERE\s+([A-Za-z_][A-Za-z0-9_]*)\s*(=|<|>)\s*(.*))?$",
             sql,
         )
         if not m:
             raise ParseError("Invalid SELECT")
-        cols_raw = m.group(1).strip()
-        cols = ["*"] if cols_raw == "*" else [_parse_identifier(x.strip()) for x in _split_csv(cols_raw)]
         table = _parse_identifier(m.group(2))
         join_table = m.group(3)
         join = None
@@ -124,8 +254,84 @@ def parse(sql: str) -> Dict[str, Any]:
             }
         where = None
         if m.group(6):
-            where = (_parse_identifier(m.group(6)), m.group(7), _parse_value(m.group(8).strip()))
-        return {"type": "SELECT", "table": table, "columns": cols, "join": join, "where": where}
+            where = (_parse_identifier(m.group(6)), m.group(7), _parse_value(m.group(8).strip(), params))
+
+        aggregates: List[Tuple[str, str, str]] = []
+
+        def aggregate_name(func: str, col: str, alias: Optional[str] = None) -> str:
+            for name, f, c in aggregates:
+                if (f, c) == (func, col) and alias is None:
+                    return name
+            name = alias or f"{func}({col})"
+            aggregates.append((name, func, col))
+            return name
+
+        cols_raw = m.group(1).strip()
+        cols: List[str] = []
+        if cols_raw == "*":
+            cols = ["*"]
+        else:
+            for item in _split_csv(cols_raw):
+                am = re.fullmatch(r"(?is)(.+?)\s+AS\s+([A-Za-z_][A-Za-z0-9_]*)", item)
+                expr, alias = (am.group(1), am.group(2)) if am else (item, None)
+                agg = _parse_aggregate(expr)
+                if agg is not None:
+                    cols.append(aggregate_name(agg[0], agg[1], alias))
+                elif alias is not None:
+                    raise ParseError("Aliases are only supported on aggregates")
+                else:
+                    cols.append(_parse_identifier(item.strip()))
+
+        group_by = None
+        if tail["group_by"]:
+            group_by = [_parse_ref(x) for x in _split_csv(tail["group_by"])]
+
+        def output_ref(expr: str) -> str:
+            agg = _parse_aggregate(expr)
+            return aggregate_name(*agg) if agg is not None else _parse_ref(expr)
+
+        having = None
+        if tail["having"]:
+            hm = re.fullmatch(r"(?is)(.+?)\s*(=|<|>)\s*(.+)", tail["having"].strip())
+            if not hm:
+                raise ParseError("Invalid HAVING")
+            having = (output_ref(hm.group(1)), hm.group(2), _parse_value(hm.group(3).strip(), params))
+
+        order_by = None
+        if tail["order_by"]:
+            order_by = []
+            for item in _split_csv(tail["order_by"]):
+                km = re.fullmatch(r"(?is)(.+?)(?:\s+(ASC|DESC))?", item)
+                if not km:
+                    raise ParseError(f"Invalid ORDER BY item: {item}")
+                order_by.append((output_ref(km.group(1)), (km.group(2) or "ASC").upper() == "DESC"))
+
+        if aggregates or group_by is not None:
+            if cols == ["*"]:
+                raise ParseError("SELECT * cannot be used with GROUP BY or aggregates")
+            agg_names = {name for name, _f, _c in aggregates}
+            for c in cols:
+                if c not in agg_names and c not in (group_by or []):
+                    raise ParseError(f"Column must appear in GROUP BY: {c}")
+            for func, col in ((f, c) for _n, f, c in aggregates):
+                if col == "*" and func != "COUNT":
+                    raise ParseError(f"{func}(*) is not supported")
+        elif having is not None:
+            raise ParseError("HAVING requires GROUP BY or aggregates")
+
+        return {
+            "type": "SELECT",
+            "table": table,
+            "columns": cols,
+            "join": join,
+            "where": where,
+            "aggregates": aggregates or None,
+            "group_by": group_by,
+            "having": having,
+            "order_by": order_by,
+            "limit": _parse_value(tail["limit"], params) if tail["limit"] else None,
+            "offset": _parse_value(tail["offset"], params) if tail["offset"] else None,
+        }
 
     if upper.startswith("UPDATE "):
         m = re.match(
@@ -141,10 +347,10 @@ def parse(sql: str) -> Dict[str, Any]:
             if "=" not in assign:
                 raise ParseError("Invalid SET assignment")
             col, val = assign.split("=", 1)
-            updates[_parse_identifier(col.strip())] = _parse_value(val.strip())
+            updates[_parse_identifier(col.strip())] = _parse_value(val.strip(), params)
         where = None
         if m.group(3):
-            where = (_parse_identifier(m.group(3)), m.group(4), _parse_value(m.group(5).strip()))
+            where = (_parse_identifier(m.group(3)), m.group(4), _parse_value(m.group(5).strip(), params))
         return {"type": "UPDATE", "table": table, "updates": updates, "where": where}
 
     if upper.startswith("DELETE FROM "):
@@ -157,7 +363,114 @@ def parse(sql: str) -> Dict[str, Any]:
         table = _parse_identifier(m.group(1))
         where = None
         if m.group(2):
-            where = (_parse_identifier(m.group(2)), m.group(3), _parse_value(m.group(4).strip()))
+            where = (_parse_identifier(m.group(2)), m.group(3), _parse_value(m.group(4).strip(), params))
         return {"type": "DELETE", "table": table, "where": where}
 
     raise ParseError("Unsupported SQL")
+
+
+_LITERAL = re.compile(r"'((?:[^']|'')*)'|(?<![\w.])-?\d+(\.\d+)?(?![\w.])")
+
+
+def normalize(sql: str) -> Tuple[str, List[Any]]:
+    literals: List[Any] = []
+    append = literals.append
+
+    def replace(m: "re.Match[str]") -> str:
+        text, frac = m.group(1, 2)
+        if text is not None:
+            append(text)
+        else:
+            append(float(m.group(0)) if frac else int(m.group(0)))
+        return "?"
+
+    return _LITERAL.sub(replace, _strip_semicolon(sql)), literals
+
+
+def _template_source(node: Any) -> str:
+    if isinstance(node, Param):
+        return f"v[{node.key!r}]"
+    if isinstance(node, dict):
+        return "{" + ", ".join(f"{k!r}: {_template_source(v)}" for k, v in node.items()) + "}"
+    if isinstance(node, list):
+        return "[" + ", ".join(_template_source(v) for v in node) + "]"
+    if isinstance(node, tuple):
+        return "(" + "".join(f"{_template_source(v)}, " for v in node) + ")"
+    return repr(node)
+
+
+def compile_template(ast: Dict[str, Any]) -> Callable[[Any], Dict[str, Any]]:
+    build = eval(f"lambda v: {_template_source(ast)}", {})
+
+    def bind(values: Any) -> Dict[str, Any]:
+        try:
+            return build(values)
+        except (IndexError, KeyError) as e:
+            raise ParseError(f"Missing parameter: {e.args[0]}") from None
+
+    return bind
+
+
+def param_keys(node: Any) -> List[Any]:
+    if isinstance(node, Param):
+        return [node.key]
+    if isinstance(node, dict):
+        node = list(node.values())
+    if isinstance(node, (list, tuple)):
+        return [k for v in node for k in param_keys(v)]
+    return []
+
+
+MAX_CACHED_LITERALS = 256
+
+
+class ParseCache:
+    def __init__(self, capacity: int = 256):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Callable[[Any], Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, sql: str) -> Dict[str, Any]:
+        key, literals = normalize(sql)
+        if len(literals) > MAX_CACHED_LITERALS:
+            # Bulk statements (multi-row INSERT) rarely repeat and cost more to compile than to parse.
+            return self._parse_uncached(sql)
+        with self._lock:
+            bind = self._entries.get(key)
+            if bind is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if bind is None:
+            try:
+                template = parse(key)
+            except ParseError:
+                # A literal in a position the grammar does not take a value (or a genuine
+                # error): parse the original text uncached so errors quote the user's SQL.
+                return self._parse_uncached(sql)
+            if len(param_keys(template)) != len(literals):
+                # A `?` of the user's own, or literals the template swallowed into one
+                # malformed value: the uncached parse reports whichever it is.
+                return self._parse_uncached(sql)
+            bind = compile_template(template)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = bind
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+        return bind(literals)
+
+    def _parse_uncached(self, sql: str) -> Dict[str, Any]:
+        template = parse(sql)
+        if param_keys(template):
+            raise ParseError("Unbound parameter (use MiniDB.prepare)") from None
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, Union
+
+from . import protocol
+from .client import Client, _params
+from .errors import MiniDBError, ParseError, SchemaError
+from .parser import param_keys, parse
+
+
+@dataclass(eq=False)
+class _Slot:
+    client: Client
+    last_used: float
+    # token -> (user_id, username, validated at)
+    sessions: Dict[str, Tuple[int, str, float]] = field(default_factory=dict)
+
+
+class ClientPool:
+    # A bounded pool of connections to one database on a MiniDB server, with the surface of
+    # MiniDB so it can stand in for a module-level engine in a web app. Each call borrows a
+    # connection and returns it, most recently used first, so a steady trickle of requests
+    # keeps reusing the same warm sockets.
+    #
+    # - size: connections open at most; further callers wait (up to acquire_timeout seconds)
+    # - idle_timeout: connections unused for longer are closed
+    # - health_check_interval: a connection idle for longer is pinged before reuse, and
+    #   replaced if the server went away
+    # - session_cache_ttl: seconds a connection remembers that a session token validated
+    def __init__(
+        self,
+        address: protocol.Address = f"127.0.0.1:{protocol.DEFAULT_PORT}",
+        persistence_dir: str = "./minidb_data",
+        size: int = 8,
+        idle_timeout: float = 60.0,
+        health_check_interval: float = 5.0,
+        session_cache_ttl: float = 30.0,
+        timeout: Optional[float] = None,
+        acquire_timeout: Optional[float] = None,
+    ):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.address = address
+        self.persistence_dir = persistence_dir
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.session_cache_ttl = session_cache_ttl
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle: List[_Slot] = []
+        self._live: Set[_Slot] = set()
+        self._closed = False
+        # The connection a thread's open transaction lives on (see transaction()).
+        self._local = threading.local()
+        self.created = 0
+        self.reused = 0
+        self.reaped = 0
+        self.failed_checks = 0
+
+    def _acquire(self) -> _Slot:
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise MiniDBError("Connection pool exhausted")
+        try:
+            return self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkout(self) -> _Slot:
+        now = time.monotonic()
+        with self._lock:
+            if self._closed:
+                raise MiniDBError("Connection pool is closed")
+            # _idle is ordered oldest first.
+            expired = 0
+            while expired < len(self._idle) and now - self._idle[expired].last_used > self.idle_timeout:
+                expired += 1
+            stale, self._idle[:expired] = self._idle[:expired], []
+            slot = self._idle.pop() if self._idle else None
+        for s in stale:
+            self._discard(s)
+        self.reaped += len(stale)
+
+        if slot is not None and now - slot.last_used > self.health_check_interval:
+            try:
+                slot.client.ping()
+            except (MiniDBError, OSError):
+                self.failed_checks += 1
+                self._discard(slot)
+                slot = None
+        if slot is not None:
+            self.reused += 1
+            return slot
+
+        slot = _Slot(Client(self.address, self.persistence_dir, self.timeout), now)
+        with self._lock:
+            self._live.add(slot)
+        self.created += 1
+        return slot
+
+    def _release(self, slot: _Slot) -> None:
+        slot.last_used = time.monotonic()
+        with self._lock:
+            keep = not self._closed and not slot.client.closed
+            if keep:
+                self._idle.append(slot)
+        if not keep:
+            self._discard(slot)
+        self._slots.release()
+
+    def _discard(self, slot: _Slot) -> None:
+        with self._lock:
+            self._live.discard(slot)
+        slot.client.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[Client]:
+        pinned = getattr(self._local, "slot", None)
+        if pinned is not None:
+            yield pinned.client
+            return
+        slot = self._acquire()
+        try:
+            yield slot.client
+        finally:
+            self._release(slot)
+
+    def close(self) -> None:
+        # Idle connections close now, borrowed ones when they are returned.
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for slot in idle:
+            self._discard(slot)
+
+    def __enter__(self) -> "ClientPool":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": len(self._live),
+                "idle": len(self._idle),
+                "created": self.created,
+                "reused": self.reused,
+                "reaped": self.reaped,
+                "failed_checks": self.failed_checks,
+            }
+
+    def _call(self, op: str, **args: Any) -> Any:
+        with self.connection() as client:
+            return client._call(op, **args)
+
+    def register_user(
+        self, username: str, password: str, email: str = "", is_admin: int = 0, session_token: Optional[str] = None
+    ) -> int:
+        # Over the wire an admin user can only be registered with an admin's session token.
+        return self._call(
+            "register_user", username=username, password=password, email=email, is_admin=is_admin, token=session_token
+        )
+
+    def login(self, username: str, password: str) -> str:
+        return self._call("login", username=username, password=password)
+
+    def validate(self, token: Optional[str]) -> Tuple[int, str]:
+        slot = self._acquire()
+        try:
+            cached = slot.sessions.get(token) if token else None
+            if cached is not None and time.monotonic() - cached[2] <= self.session_cache_ttl:
+                return cached[0], cached[1]
+            user_id, username = slot.client.validate(token)
+            if token:
+                slot.sessions[token] = (user_id, username, time.monotonic())
+            return user_id, username
+        except BaseException:
+            slot.sessions.pop(token, None)  # type: ignore[arg-type]
+            raise
+        finally:
+            self._release(slot)
+
+    def logout(self, token: Optional[str]) -> None:
+        with self._lock:
+            for slot in self._live:
+                slot.sessions.pop(token, None)  # type: ignore[arg-type]
+        self._call("logout", token=token)
+
+    def checkpoint(self, session_token: Optional[str] = None) -> None:
+        self._call("checkpoint", token=session_token)
+
+    def list_tables(self) -> List[str]:
+        return self._call("list_tables")
+
+    def row_count(self, table: str) -> int:
+        return self._call("row_count", table=table)
+
+    def table_versions(self, session_token: Optional[str] = None) -> Dict[str, int]:
+        return self._call("table_versions", token=session_token)
+
+    def next_id(self, table: str, session_token: Optional[str] = None) -> int:
+        return self._call("next_id", table=table, token=session_token)
+
+    @contextmanager
+    def transaction(self, session_token: Optional[str] = None) -> Iterator[None]:
+        # Transactions belong to a server connection, so the calling thread keeps one for
+        # the whole block and its calls in the meantime all go through it. A bare
+        # execute("BEGIN") does not pin a connection; use this instead.
+        if getattr(self._local, "slot", None) is not None:
+            raise SchemaError("Transaction already in progress")
+        slot = self._acquire()
+        self._local.slot = slot
+        try:
+            slot.client.execute("BEGIN", session_token)
+            try:
+                yield
+            except BaseException:
+                slot.client.execute("ROLLBACK", session_token)
+                raise
+            slot.client.execute("COMMIT", session_token)
+        finally:
+            self._local.slot = None
+            self._release(slot)
+
+    def execute(self, sql: str, session_token: Optional[str] = None) -> Any:
+        return self._call("execute", sql=sql, token=session_token)
+
+    def prepare(self, sql: str) -> "PooledPreparedStatement":
+        return PooledPreparedStatement(self, sql)
+
+    def executemany(
+        self,
+        sql: str,
+        seq_of_params: Iterable[Union[Sequence[Any], Mapping[str, Any]]],
+        session_token: Optional[str] = None,
+    ) -> int:
+        return self._call("executemany", sql=sql, params=[_params(p) for p in seq_of_params], token=session_token)
+
+    def execute_iter(
+        self, sql: str, session_token: Optional[str] = None, batch_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        return self._query({"sql": sql, "token": session_token}, batch_size)
+
+    def _query(self, args: Dict[str, Any], batch_size: int) -> Iterator[Dict[str, Any]]:
+        # The server cursor lives on one connection, which stays borrowed until the rows
+        # are exhausted or the iterator is closed.
+        pinned = getattr(self._local, "slot", None)
+        if pinned is not None:
+            return pinned.client._query(args, batch_size)
+        slot = self._acquire()
+        try:
+            rows = slot.client._query(args, batch_size)
+        except BaseException:
+            self._release(slot)
+            raise
+        return _PooledCursor(self, slot, rows)
+
+
+class PooledPreparedStatement:
+    # The SQL is parsed locally for its parameters, so statements can be prepared at import
+    # time before the server is reachable; the server prepares it on first execution.
+    def __init__(self, pool: ClientPool, sql: str):
+        self.pool = pool
+        self.sql = sql
+        template = parse(sql)
+        self.type = template["type"]
+        keys = param_keys(template)
+        self.param_count = sum(1 for k in keys if isinstance(k, int))
+        self.param_names = {k for k in keys if isinstance(k, str)}
+        if self.param_count and self.param_names:
+            raise ParseError("Cannot mix ? and named parameters")
+
+    def execute(
+        self,
+        params: Union[Sequence[Any], Mapping[str, Any]] = (),
+        session_token: Optional[str] = None,
+    ) -> Any:
+        return self.pool._call("execute", sql=self.sql, params=_params(params), token=session_token)
+
+    def executemany(
+        self,
+        seq_of_params: Iterable[Union[Sequence[Any], Mapping[str, Any]]],
+        session_token: Optional[str] = None,
+    ) -> int:
+        return self.pool.executemany(self.sql, seq_of_params, session_token)
+
+    def execute_iter(
+        self,
+        params: Union[Sequence[Any], Mapping[str, Any]] = (),
+        session_token: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        return self.pool._query({"sql": self.sql, "params": _params(params), "token": session_token}, batch_size)
+
+
+class _PooledCursor:
+    def __init__(self, pool: ClientPool, slot: _Slot, rows: Iterator[Dict[str, Any]]):
+        self._pool: Optional[ClientPool] = pool
+        self._slot = slot
+        self._rows = rows
+
+    def __iter__(self) -> "_PooledCursor":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        try:
+            return next(self._rows)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        try:
+            self._rows.close()  # type: ignore[attr-defined]
+        finally:
+            pool._release(self._slot)
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
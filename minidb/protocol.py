@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+import struct
+from typing import Any, Dict, List, NoReturn, Optional, Tuple, Union
+
+from . import errors
+from .errors import MiniDBError
+
+
+# Every message is a JSON object preceded by its length as a 4-byte big-endian integer.
+MAX_MESSAGE = 64 * 1024 * 1024
+DEFAULT_PORT = 7433
+_HEADER = struct.Struct("!I")
+
+Address = Union[str, Tuple[str, int]]
+
+
+def parse_address(address: Address) -> Address:
+    # "unix:/path/to.sock" names a Unix socket; "host:port", "host" or (host, port) a TCP one.
+    if isinstance(address, tuple):
+        return address[0], int(address[1])
+    if address.startswith("unix:"):
+        return address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    if not sep:
+        return address, DEFAULT_PORT
+    try:
+        return host, int(port)
+    except ValueError:
+        raise MiniDBError(f"Invalid address: {address}") from None
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(data) > MAX_MESSAGE:
+        raise MiniDBError("Message too large")
+    return _HEADER.pack(len(data)) + data
+
+
+def _decode(data: bytes) -> Dict[str, Any]:
+    try:
+        message = json.loads(data)
+    except ValueError:
+        raise MiniDBError("Malformed message") from None
+    if not isinstance(message, dict):
+        raise MiniDBError("Malformed message")
+    return message
+
+
+def _length(header: bytes) -> int:
+    (n,) = _HEADER.unpack(header)
+    if n > MAX_MESSAGE:
+        raise MiniDBError("Message too large")
+    return n
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    # Returns None when the peer closed the connection between messages.
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _length(header))
+    if data is None:
+        raise MiniDBError("Connection closed mid-message")
+    return _decode(data)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            if buf:
+                raise MiniDBError("Connection closed mid-message")
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    try:
+        header = await reader.readexactly(_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise MiniDBError("Connection closed mid-message") from None
+        return None
+    try:
+        data = await reader.readexactly(_length(header))
+    except asyncio.IncompleteReadError:
+        raise MiniDBError("Connection closed mid-message") from None
+    return _decode(data)
+
+
+def error_payload(exc: BaseException) -> List[str]:
+    if isinstance(exc, MiniDBError):
+        return [type(exc).__name__, str(exc)]
+    return ["MiniDBError", f"{type(exc).__name__}: {exc}"]
+
+
+def raise_error(payload: Any) -> NoReturn:
+    # Errors travel as [class name, message] and come back as the same MiniDBError subclass.
+    name, message = payload
+    cls = getattr(errors, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, MiniDBError)):
+        cls = MiniDBError
+    raise cls(message)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .db import MiniDB
+
+
+# Resident bytes per stored value, roughly: `python bench.py memory` measures about 535 bytes
+# for a six-column row-layout row with its primary key index (columnar tables take about half).
+_BYTES_PER_VALUE = 90
+
+
+def _resident_size(db: MiniDB) -> int:
+    # An estimate from the row counts of the tables in memory; lazily loaded tables that no
+    # statement has touched yet cost nothing.
+    total = 0
+    for name in db.list_tables():
+        table = db.catalog.get_table(name)
+        if table.loaded:
+            total += table.row_count() * len(table.columns) * _BYTES_PER_VALUE
+    return total
+
+
+@dataclass
+class _Entry:
+    db: MiniDB
+    size: int = 0
+    users: int = 0
+    stale: bool = False
+
+
+class DatabaseRegistry:
+    # Open MiniDB handles of one process, by directory. A handle is shared by every thread
+    # that opens the directory (MiniDB does its own locking); the registry only counts its
+    # users so that eviction skips handles in use. Each open database holds its directory's
+    # lock, so several worker processes must share databases through minidb.server instead;
+    # a second process opening the same directory gets DatabaseLocked.
+    def __init__(self, memory_budget: int = 64 * 1024 * 1024, **db_kwargs: Any):
+        self.memory_budget = memory_budget
+        self._db_kwargs = db_kwargs
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Directories whose handle is being closed outside _lock; reopening one waits, since
+        # the old handle still holds the directory lock.
+        self._closing: Dict[str, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _acquire(self, persistence_dir: str) -> _Entry:
+        key = os.path.abspath(persistence_dir)
+        while True:
+            with self._lock:
+                closing = self._closing.get(key)
+                if closing is None:
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        self.misses += 1
+                        entry = _Entry(db=MiniDB(key, **self._db_kwargs))
+                        self._entries[key] = entry
+                    else:
+                        self.hits += 1
+                    self._entries.move_to_end(key)
+                    entry.users += 1
+                    evicted = self._evict()
+                    break
+            closing.wait()
+        self._close(evicted)
+        return entry
+
+    def _release(self, entry: _Entry, persistence_dir: str) -> None:
+        # Sized here, outside _lock: list_tables waits for the database's catalog lock.
+        size = 0 if entry.stale else _resident_size(entry.db)
+        with self._lock:
+            entry.users -= 1
+            entry.size = size
+            evicted: List[Tuple[str, _Entry, bool]] = []
+            if entry.stale:
+                if entry.users == 0 and self._entries.get(persistence_dir) is entry:
+                    evicted.append(self._pop(persistence_dir, checkpoint=False))
+            else:
+                evicted = self._evict()
+        self._close(evicted)
+
+    def _pop(self, key: str, checkpoint: bool = True) -> Tuple[str, _Entry, bool]:
+        # Called with _lock held; the caller closes the handle with _close once it is released.
+        self._closing[key] = threading.Event()
+        return key, self._entries.pop(key), checkpoint
+
+    def _close(self, evicted: List[Tuple[str, _Entry, bool]]) -> None:
+        # Closing checkpoints the database, which must not hold up the other databases.
+        for key, entry, checkpoint in evicted:
+            try:
+                entry.db.close(checkpoint=checkpoint)
+            finally:
+                with self._lock:
+                    self._closing.pop(key).set()
+
+    def _evict(self) -> List[Tuple[str, _Entry, bool]]:
+        # The most recently used handle stays even alone over the budget, or a large
+        # database would be reloaded on every request.
+        total = sum(e.size for e in self._entries.values())
+        evicted = []
+        for key in list(self._entries.keys())[:-1]:
+            if total <= self.memory_budget:
+                break
+            entry = self._entries[key]
+            if entry.users:
+                continue
+            total -= entry.size
+            evicted.append(self._pop(key))
+        return evicted
+
+    @contextmanager
+    def open(self, persistence_dir: str) -> Iterator[MiniDB]:
+        entry = self._acquire(persistence_dir)
+        try:
+            yield entry.db
+        finally:
+            self._release(entry, os.path.abspath(persistence_dir))
+
+    def invalidate(self, persistence_dir: str) -> None:
+        # Drops the handle, once its users are done, without a checkpoint; the next open()
+        # reads the directory from disk again.
+        key = os.path.abspath(persistence_dir)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self.invalidations += 1
+            if entry.users:
+                entry.stale = True
+                return
+            evicted = [self._pop(key, checkpoint=False)]
+        self._close(evicted)
+
+    def close(self) -> None:
+        with self._lock:
+            evicted = [self._pop(key) for key in list(self._entries)]
+        self._close(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open": len(self._entries),
+                "bytes": sum(e.size for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+from . import protocol
+from .db import MiniDB, PreparedStatement
+from .errors import AuthError, MiniDBError
+
+
+_BATCH = 500
+
+
+class _Database:
+    # One engine shared by every connection that opens the same directory. Parameterised
+    # statements are prepared once here and reused across connections.
+    def __init__(self, db: MiniDB, statement_cache_size: int = 256):
+        self.db = db
+        self._statements: "OrderedDict[str, PreparedStatement]" = OrderedDict()
+        self._statement_cache_size = statement_cache_size
+        self._lock = threading.Lock()
+
+    def prepare(self, sql: str) -> PreparedStatement:
+        with self._lock:
+            stmt = self._statements.get(sql)
+            if stmt is not None:
+                self._statements.move_to_end(sql)
+                return stmt
+        stmt = self.db.prepare(sql)
+        with self._lock:
+            self._statements[sql] = stmt
+            if len(self._statements) > self._statement_cache_size:
+                self._statements.popitem(last=False)
+        return stmt
+
+
+class _Connection:
+    # A client connection. Its requests run one at a time on a thread of its own: an open
+    # cursor or transaction holds engine locks, and those belong to the thread that took
+    # them. That also makes transactions per connection.
+    def __init__(self, server: "MiniDBServer"):
+        self.server = server
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="minidb-conn")
+        self.database: Optional[_Database] = None
+        self._cursors: Dict[int, Iterator[Dict[str, Any]]] = {}
+        self._next_cursor = 0
+
+    def handle(self, request: Dict[str, Any]) -> bytes:
+        rid = request.get("id")
+        try:
+            op = request.get("op")
+            handler = getattr(self, f"_op_{op}", None) if isinstance(op, str) else None
+            if handler is None:
+                raise MiniDBError(f"Unknown operation: {op}")
+            if self.database is None and op not in ("open", "ping"):
+                raise MiniDBError("No database open")
+            response = {"id": rid, "result": handler(request)}
+        except Exception as e:
+            response = {"id": rid, "error": protocol.error_payload(e)}
+        try:
+            return protocol.encode(response)
+        except Exception as e:
+            return protocol.encode({"id": rid, "error": protocol.error_payload(e)})
+
+    def close(self) -> None:
+        # Runs on the connection's thread, which owns its cursors' and transaction's locks.
+        for rows in self._cursors.values():
+            rows.close()  # type: ignore[attr-defined]
+        self._cursors.clear()
+        if self.database is not None:
+            self.db.rollback()
+
+    @property
+    def db(self) -> MiniDB:
+        assert self.database is not None
+        return self.database.db
+
+    def _op_ping(self, request: Dict[str, Any]) -> Any:
+        return "pong"
+
+    def _op_open(self, request: Dict[str, Any]) -> Any:
+        if self.database is not None:
+            raise MiniDBError("A database is already open on this connection")
+        # Whether the database checks sessions is the server's setting; an `enable_auth`
+        # sent by the client is ignored.
+        self.database = self.server.open_database(request["db"])
+        return {"enable_auth": self.db.enable_auth}
+
+    def _op_execute(self, request: Dict[str, Any]) -> Any:
+        params = request.get("params")
+        if params is None:
+            return self.db.execute(request["sql"], request.get("token"))
+        return self.database.prepare(request["sql"]).execute(params, request.get("token"))
+
+    def _op_executemany(self, request: Dict[str, Any]) -> Any:
+        return self.database.prepare(request["sql"]).executemany(request["params"], request.get("token"))
+
+    def _op_prepare(self, request: Dict[str, Any]) -> Any:
+        stmt = self.database.prepare(request["sql"])
+        return {"type": stmt.type, "param_count": stmt.param_count, "param_names": sorted(stmt.param_names)}
+
+    def _op_query(self, request: Dict[str, Any]) -> Any:
+        params = request.get("params")
+        if params is None:
+            rows = self.db.execute_iter(request["sql"], request.get("token"))
+        else:
+            rows = self.database.prepare(request["sql"]).execute_iter(params, request.get("token"))
+        self._next_cursor += 1
+        self._cursors[self._next_cursor] = rows
+        return self._fetch(self._next_cursor, request.get("batch", _BATCH))
+
+    def _op_fetch(self, request: Dict[str, Any]) -> Any:
+        if request.get("cursor") not in self._cursors:
+            raise MiniDBError("Unknown cursor")
+        return self._fetch(request["cursor"], request.get("batch", _BATCH))
+
+    def _fetch(self, cursor: int, batch: int) -> Dict[str, Any]:
+        rows = self._cursors[cursor]
+        batch = max(1, int(batch))
+        try:
+            chunk = list(islice(rows, batch))
+        except BaseException:
+            self._close_cursor(cursor)
+            raise
+        if len(chunk) < batch:
+            self._close_cursor(cursor)
+            return {"cursor": None, "rows": chunk}
+        return {"cursor": cursor, "rows": chunk}
+
+    def _close_cursor(self, cursor: Any) -> None:
+        rows = self._cursors.pop(cursor, None)
+        if rows is not None:
+            rows.close()  # type: ignore[attr-defined]
+
+    def _op_close_cursor(self, request: Dict[str, Any]) -> Any:
+        self._close_cursor(request.get("cursor"))
+        return None
+
+    def _op_login(self, request: Dict[str, Any]) -> Any:
+        return self.db.login(request["username"], request["password"])
+
+    def _check_session(self, request: Dict[str, Any]) -> None:
+        # The check execute makes: a valid session token when the database has auth on.
+        if self.db.enable_auth:
+            self.db.auth.validate(request.get("token"))
+
+    def _op_register_user(self, request: Dict[str, Any]) -> Any:
+        # Anyone who can connect may sign up, but only an admin's session can make an admin.
+        is_admin = 0
+        if request.get("is_admin"):
+            session = self.db.auth.validate(request.get("token"))
+            if not self.db._is_admin(session.user_id):
+                raise AuthError("Only an admin can register an admin user")
+            is_admin = 1
+        return self.db.register_user(request["username"], request["password"], request.get("email", ""), is_admin)
+
+    def _op_validate(self, request: Dict[str, Any]) -> Any:
+        return list(self.db.validate(request.get("token")))
+
+    def _op_logout(self, request: Dict[str, Any]) -> Any:
+        self.db.logout(request.get("token"))
+        return None
+
+    def _op_rollback(self, request: Dict[str, Any]) -> Any:
+        return self.db.rollback()
+
+    def _op_checkpoint(self, request: Dict[str, Any]) -> Any:
+        self._check_session(request)
+        self.db.checkpoint()
+        return None
+
+    def _op_list_tables(self, request: Dict[str, Any]) -> Any:
+        return self.db.list_tables()
+
+    def _op_row_count(self, request: Dict[str, Any]) -> Any:
+        return self.db.row_count(request["table"])
+
+    def _op_table_versions(self, request: Dict[str, Any]) -> Any:
+        self._check_session(request)
+        return self.db.table_versions()
+
+    def _op_next_id(self, request: Dict[str, Any]) -> Any:
+        return self.db.next_id(request["table"], request.get("token"))
+
+
+class MiniDBServer:
+    # Serves MiniDB over a socket so that several processes (e.g. web workers) share one
+    # in-memory engine and one write path. Each connection opens one database, named by
+    # its directory relative to `root`; the engines are opened on first use with
+    # `db_options` and stay open until the server stops. Whether a database checks
+    # sessions is set here, never by clients: `auth` maps directories (relative to `root`)
+    # to on/off for themselves and every database below them, the nearest one winning;
+    # anything unmapped gets `enable_auth`.
+    def __init__(
+        self,
+        root: str = ".",
+        enable_auth: bool = True,
+        auth: Optional[Mapping[str, bool]] = None,
+        **db_options: Any,
+    ):
+        self.root = os.path.realpath(root)
+        self.enable_auth = enable_auth
+        self.db_options = db_options
+        self._databases: Dict[str, _Database] = {}
+        self._auth: Dict[str, bool] = {self._resolve(path): bool(on) for path, on in (auth or {}).items()}
+        self._lock = threading.Lock()
+        self._connections: Dict[asyncio.StreamWriter, "asyncio.Task[None]"] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def _resolve(self, path: str) -> str:
+        full = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, full]) != self.root:
+            raise MiniDBError("Database path is outside the server root")
+        return full
+
+    def open_database(self, path: str) -> _Database:
+        full = self._resolve(path)
+        with self._lock:
+            database = self._databases.get(full)
+            if database is None:
+                database = _Database(MiniDB(full, enable_auth=self._auth_for(full), **self.db_options))
+                self._databases[full] = database
+            return database
+
+    def _auth_for(self, full: str) -> bool:
+        path = full
+        while path not in self._auth:
+            if path == self.root:
+                return self.enable_auth
+            path = os.path.dirname(path)
+        return self._auth[path]
+
+    async def start(self, address: protocol.Address) -> None:
+        target = protocol.parse_address(address)
+        if isinstance(target, str):
+            if os.path.exists(target):
+                os.unlink(target)
+            self._server = await asyncio.start_unix_server(self._serve, path=target)
+        else:
+            self._server = await asyncio.start_server(self._serve, host=target[0], port=target[1])
+
+    @property
+    def addresses(self) -> List[Any]:
+        assert self._server is not None
+        return [s.getsockname() for s in self._server.sockets]
+
+    async def run(self, address: protocol.Address) -> None:
+        # Serves until cancelled or sent SIGINT/SIGTERM, then checkpoints and closes every
+        # database.
+        await self.start(address)
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        try:
+            await stop.wait()
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        # Dropping the connections ends their handlers, which close any open cursors (those
+        # hold catalog read locks) before the databases are closed.
+        handlers = list(self._connections.values())
+        for writer in self._connections:
+            writer.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        await asyncio.get_running_loop().run_in_executor(None, self.close_databases)
+
+    def close_databases(self) -> None:
+        with self._lock:
+            for database in self._databases.values():
+                database.db.close()
+            self._databases.clear()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        conn = _Connection(self)
+        self._connections[writer] = asyncio.current_task()  # type: ignore[assignment]
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await protocol.read_message(reader)
+                except MiniDBError as e:
+                    writer.write(protocol.encode({"id": None, "error": protocol.error_payload(e)}))
+                    break
+                if request is None:
+                    break
+                writer.write(await loop.run_in_executor(conn.executor, conn.handle, request))
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            await loop.run_in_executor(conn.executor, conn.close)
+            conn.executor.shutdown(wait=False)
+            writer.close()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Serve MiniDB databases over a socket")
+    p.add_argument(
+        "--listen",
+        default=f"127.0.0.1:{protocol.DEFAULT_PORT}",
+        help="host:port or unix:/path/to.sock",
+    )
+    p.add_argument("--root", default=".", help="directory the client database paths are relative to")
+    p.add_argument("--checkpoint-interval", type=int, default=1000)
+    p.add_argument("--storage-format", choices=["json", "paged"], default="json")
+    p.add_argument("--durability", choices=["sync", "group", "async"], default="async")
+    p.add_argument("--copy-dir", help="enable COPY for files in this directory (off by default)")
+    p.add_argument(
+        "--no-auth",
+        action="append",
+        default=[],
+        metavar="DB",
+        help="serve the database in DB (relative to --root), and any below it, without logins; may be repeated",
+    )
+    args = p.parse_args()
+
+    server = MiniDBServer(
+        args.root,
+        auth={path: False for path in args.no_auth},
+        checkpoint_interval=args.checkpoint_interval,
+        storage_format=args.storage_format,
+        durability=args.durability,
+        copy_dir=args.copy_dir,
+    )
+    print(f"MiniDB server listening on {args.listen} (root {server.root})")
+    try:
+        asyncio.run(server.run(args.listen))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,380 @@ from __future__ import annotations
 
 import json
 import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional, Tuple, Union
+from itertools import chain, count
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
-from .errors import ConstraintViolation, SchemaError
+from .columnar import ColumnStore
+from .errors import ConstraintViolation, DatabaseLocked, LockTimeout, SchemaError
+from .indexes import OrderedIndex
+from .locks import RWLock
+from .pages import PageFile, apply_journal
 
 
 SUPPORTED_TYPES = {"INT", "STRING", "FLOAT"}
+COMPACT_MIN_DEAD = 1024
+STORAGE_FORMATS = {"json": ".rows.json", "paged": ".rows.pages"}
+TABLE_LAYOUTS = {"row", "columnar"}
+INDEX_KINDS = {"hash", "btree"}
+MAX_WHERE_PLANS = 256
+WAL_FILENAME = "minidb.wal"
+CHECKPOINT_FILENAME = "checkpoint.json"
+LOCK_FILENAME = "minidb.lock"
+# Side files written while staging a checkpoint; left behind only by a crash.
+_STAGED_SUFFIXES = (".tmp", ".journal")
+# Table versions are drawn from one process-wide sequence, so a dropped and recreated table
+# never repeats a version its predecessor had.
+_VERSIONS = count(1)
+DURABILITY_MODES = {"sync", "group", "async"}
+# Longest time the first of several concurrent committers waits for the others before
+# flushing; it never waits longer than a flush has recently taken.
+GROUP_COMMIT_DELAY = 0.002
 
 
-def _atomic_write_json(path: str, data: Any) -> None:
+def _fsync_dir(path: str) -> None:
+    # Makes a rename in the directory durable. Directories cannot be opened on Windows,
+    # where the rename is durable once it returns.
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _lock_directory(persistence_dir: str) -> Any:
+    # Only one Catalog at a time may have a database directory open, in this process or any
+    # other: two would append to the same WAL with their own lsn counters, one's checkpoint
+    # would truncate what the other logged, and recovery would delete the other's staged
+    # files. The OS drops the lock with the process, so a crash never leaves it behind.
+    os.makedirs(persistence_dir, exist_ok=True)
+    f = open(os.path.join(persistence_dir, LOCK_FILENAME), "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        raise DatabaseLocked(
+            f"Database is already open elsewhere: {persistence_dir} (share it through minidb.server)"
+        ) from None
+    return f
+
+
+def _stage_json(path: str, data: Any) -> str:
     tmp = path + ".tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+
+def _stage_json_rows(path: str, rows: Iterable[Dict[str, Any]]) -> str:
+    # A JSON array with one compact row per line: each row goes through the C encoder,
+    # which is several times faster than indenting the whole document.
+    tmp = path + ".tmp"
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[")
+        sep = "\n"
+        for row in rows:
+            f.write(sep)
+            f.write(dumps(row))
+            sep = ",\n"
+        f.write("\n]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+
+def _atomic_write_json(path: str, data: Any) -> None:
+    os.replace(_stage_json(path, data), path)
+    _fsync_dir(path)
+
+
+def _step(op: str, source: str, target: str) -> Dict[str, str]:
+    return {"op": op, "file": os.path.basename(source), "target": os.path.basename(target)}
+
+
+def _install(persistence_dir: str, steps: List[Dict[str, str]]) -> None:
+    # Moves staged table files into place as one unit. The manifest listing the steps is
+    # the commit point: once it is on disk, recovery finishes the install after a crash;
+    # before that, the staged files are strays and the old files stay in use. A single
+    # rename is atomic by itself and needs no manifest.
+    if not steps:
+        return
+    if len(steps) == 1 and steps[0]["op"] == "rename":
+        target = os.path.join(persistence_dir, steps[0]["target"])
+        os.replace(os.path.join(persistence_dir, steps[0]["file"]), target)
+        _fsync_dir(target)
+        return
+    manifest = os.path.join(persistence_dir, CHECKPOINT_FILENAME)
+    _atomic_write_json(manifest, {"steps": steps})
+    _redo_install(persistence_dir, steps)
+    os.remove(manifest)
+
+
+def _redo_install(persistence_dir: str, steps: List[Dict[str, str]]) -> None:
+    # Safe to repeat: a step whose staged file is gone has already been applied.
+    for step in steps:
+        source = os.path.join(persistence_dir, step["file"])
+        target = os.path.join(persistence_dir, step["target"])
+        if not os.path.exists(source):
+            continue
+        if step["op"] == "pages":
+            apply_journal(source, target)
+        else:
+            os.replace(source, target)
+    _fsync_dir(os.path.join(persistence_dir, CHECKPOINT_FILENAME))
+
+
+def _finish_install(persistence_dir: str) -> bool:
+    # Completes an install interrupted after its manifest was written; True if there was one.
+    manifest = os.path.join(persistence_dir, CHECKPOINT_FILENAME)
+    if not os.path.exists(manifest):
+        return False
+    with open(manifest, "r", encoding="utf-8") as f:
+        steps = json.load(f)["steps"]
+    _redo_install(persistence_dir, steps)
+    os.remove(manifest)
+    return True
+
+
+def _where_from_json(where: Any) -> Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]]:
+    if where is None:
+        return None
+    if where and isinstance(where[0], list):
+        return [tuple(w) for w in where]
+    return tuple(where)
+
+
+class WriteAheadLog:
+    # How appended records become durable depends on the mode:
+    #
+    # - sync: every append is fsynced on its own, under the log lock
+    # - group: appends only write; the committer then calls wait_durable() after releasing
+    #   its table locks. One waiter at a time runs the fsync for everything written so far;
+    #   when others are waiting too it first sleeps up to GROUP_COMMIT_DELAY (at most as
+    #   long as recent fsyncs took) so that committers queued behind it join the flush
+    # - async: appends only hand the records to the OS, which keeps them across a crash of
+    #   the process; a background thread fsyncs every flush_interval seconds, which bounds
+    #   what a power failure can lose
+    def __init__(self, path: str, durability: str = "async", flush_interval: float = 0.05):
+        if durability not in DURABILITY_MODES:
+            raise SchemaError(f"Unsupported durability mode: {durability}")
+        self.path = path
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.next_lsn = 1
+        self.pending = 0
+        self.synced_lsn = 0
+        self.syncs = 0
+        self.truncated_bytes = 0
+        self._sync_time = 0.0
+        self._fh = None
+        self._lock = threading.Lock()
+        # Lock order: _sync_lock, then _lock. _sync_lock keeps the file open during fsync.
+        self._sync_lock = threading.Lock()
+        self._cond = threading.Condition(threading.Lock())
+        self._syncing = False
+        self._waiters = 0
+        self._local = threading.local()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def append(self, record: Dict[str, Any]) -> int:
+        with self._lock:
+            lsn = self.next_lsn
+            self._write(json.dumps({**record, "lsn": lsn}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.next_lsn += 1
+            self.pending += 1
+        self._local.lsn = lsn
+        return lsn
+
+    def append_transaction(self, records: List[Dict[str, Any]]) -> List[int]:
+        # The records and a closing commit marker go out in one write and one flush. Replay
+        # ignores records of a transaction whose marker never reached the log.
+        with self._lock:
+            txn = self.next_lsn
+            lsns = list(range(txn, txn + len(records)))
+            lines = [
+                json.dumps({**record, "txn": txn, "lsn": lsn}, ensure_ascii=False, separators=(",", ":"))
+                for record, lsn in zip(records, lsns)
+            ]
+            lines.append(json.dumps({"op": "commit", "txn": txn, "lsn": txn + len(records)}, separators=(",", ":")))
+            self._write("\n".join(lines) + "\n")
+            self.next_lsn += len(lines)
+            self.pending += len(lines)
+        self._local.lsn = txn + len(records)
+        return lsns
+
+    def _write(self, data: str) -> None:
+        # Called with _lock held.
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fh = open(self.path, "a", encoding="utf-8")
+        self._fh.write(data)
+        self._fh.flush()
+        if self.durability == "async":
+            self._start_flusher()
+        elif self.durability == "sync":
+            os.fsync(self._fh.fileno())
+            self.syncs += 1
+
+    def wait_durable(self) -> None:
+        # In group mode, blocks until the records this thread appended are on disk.
+        if self.durability != "group":
+            return
+        lsn = getattr(self._local, "lsn", 0)
+        with self._cond:
+            if self.synced_lsn >= lsn:
+                return
+            self._waiters += 1
+            try:
+                while self._syncing and self.synced_lsn < lsn:
+                    self._cond.wait()
+                if self.synced_lsn >= lsn:
+                    return
+                self._syncing = True
+                others = self._waiters > 1
+            finally:
+                self._waiters -= 1
+        try:
+            if others:
+                time.sleep(min(GROUP_COMMIT_DELAY, self._sync_time))
+            self.sync()
+        finally:
+            with self._cond:
+                self._syncing = False
+                self._cond.notify_all()
+
+    def sync(self) -> None:
+        # Makes every record appended so far durable.
+        with self._sync_lock:
+            with self._lock:
+                target = self.next_lsn - 1
+                if self.synced_lsn >= target:
+                    return
+                fd = None
+                if self._fh is not None:
+                    self._fh.flush()
+                    fd = self._fh.fileno()
+            if fd is not None:
+                start = time.perf_counter()
+                os.fsync(fd)
+                # Moving average of the flush time, which bounds the group commit delay.
+                self._sync_time += (time.perf_counter() - start - self._sync_time) / 8
+                self.syncs += 1
+            with self._cond:
+                self.synced_lsn = max(self.synced_lsn, target)
+
+    def _start_flusher(self) -> None:
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, name="minidb-wal-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.sync()
+
+    def read(self) -> List[Dict[str, Any]]:
+        # Returns the records up to the first one a crash cut short (unparseable or without
+        # its newline) and truncates the log there. Otherwise records appended later would
+        # sit behind the torn one, where the next replay never reaches them.
+        records: List[Dict[str, Any]] = []
+        self.truncated_bytes = 0
+        if not os.path.exists(self.path):
+            return records
+        valid = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                valid += len(line)
+            size = f.seek(0, os.SEEK_END)
+        if size > valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+                f.flush()
+                os.fsync(f.fileno())
+            self.truncated_bytes = size - valid
+        if records:
+            self.next_lsn = max(self.next_lsn, int(records[-1]["lsn"]) + 1)
+        self.synced_lsn = self.next_lsn - 1
+        self.pending = len(records)
+        return records
+
+    def mark(self) -> Tuple[int, int]:
+        # The end of the log as (byte offset, records), for drop_prefix() once a checkpoint
+        # taken at this point is installed. Called while no statement can append.
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            return size, self.pending
+
+    def drop_prefix(self, offset: int, records: int) -> None:
+        # Called after a background checkpoint installed everything logged before `offset`.
+        # The records appended since are copied into a new log that replaces this one, so a
+        # crash at any point leaves either log, and replay skips what the tables already hold.
+        with self._sync_lock, self._lock:
+            self._close()
+            tmp = self.path + ".tmp"
+            with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+                src.seek(offset)
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp, self.path)
+            _fsync_dir(self.path)
+            self.pending -= records
+            with self._cond:
+                self.synced_lsn = self.next_lsn - 1
+
+    def truncate(self) -> None:
+        # Called after a checkpoint has made every logged change durable in the table files.
+        with self._sync_lock, self._lock:
+            self._close()
+            if os.path.exists(self.path):
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.pending = 0
+            with self._cond:
+                self.synced_lsn = self.next_lsn - 1
+
+    def close(self) -> None:
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            self._stop.set()
+            flusher.join()
+        self.sync()
+        with self._sync_lock, self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
 
 
 def _coerce_value(value: Any, dtype: str) -> Any:
@@ -46,6 +406,120 @@ def _coerce_value(value: Any, dtype: str) -> Any:
     raise SchemaError(f"Unsupported type: {dtype}")
 
 
+_PREDICATE_FACTORIES: Dict[Tuple[Tuple[str, bool], ...], Callable[..., Callable[[Dict[str, Any]], bool]]] = {}
+
+
+def _predicate_factory(shape: Tuple[Tuple[str, bool], ...]) -> Callable[..., Callable[[Dict[str, Any]], bool]]:
+    factory = _PREDICATE_FACTORIES.get(shape)
+    if factory is None:
+        args: List[str] = []
+        clauses: List[str] = []
+        for k, (op, right_is_null) in enumerate(shape):
+            args += [f"k{k}", f"c{k}"]
+            if op == "=":
+                clauses.append(f"row.get(k{k}) == c{k}")
+            elif right_is_null:
+                clauses.append("False")
+            else:
+                clauses.append(f"(v{k} := row.get(k{k})) is not None and v{k} {op} c{k}")
+        src = f"lambda {', '.join(args)}: lambda row: {' and '.join(clauses) or 'True'}"
+        factory = eval(src, {})
+        _PREDICATE_FACTORIES[shape] = factory
+    return factory
+
+
+_ROW_BUILDERS: Dict[Tuple[Any, ...], Callable[[Any], Dict[str, Any]]] = {}
+
+_TEXT_CONVERTERS = {"INT": "int({v})", "FLOAT": "float({v})", "STRING": "{v}"}
+
+
+def _row_builder(
+    schema: Tuple[Tuple[str, str], ...], fields: Tuple[Any, ...], text: bool
+) -> Callable[[Any], Dict[str, Any]]:
+    # fields[k] says where column k comes from: a position in a sequence record, a key of a
+    # mapping record, or None when the source does not have the column. Text records (CSV)
+    # read the empty string as NULL.
+    shape = (schema, fields, text)
+    build = _ROW_BUILDERS.get(shape)
+    if build is None:
+        items: List[str] = []
+        for (col, dtype), field in zip(schema, fields):
+            if field is None:
+                expr = "None"
+            else:
+                v = f"r[{field!r}]" if isinstance(field, int) else f"r.get({field!r})"
+                if text:
+                    expr = f"{_TEXT_CONVERTERS[dtype].format(v=v)} if {v} != '' else None"
+                else:
+                    expr = f"coerce({v}, {dtype!r})"
+            items.append(f"{col!r}: {expr}")
+        build = eval(f"lambda r: {{{', '.join(items)}}}", {"coerce": _coerce_value})
+        _ROW_BUILDERS[shape] = build
+    return build
+
+
+WhereShape = Tuple[Tuple[str, str, bool], ...]
+
+
+def _where_conds(
+    where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]],
+) -> List[Tuple[str, str, Any]]:
+    return [] if where is None else where if isinstance(where, list) else [where]
+
+
+def _where_shape(conds: List[Tuple[str, str, Any]]) -> WhereShape:
+    return tuple((col, op, val is None) for col, op, val in conds)
+
+
+class WherePlan:
+    # Everything about a WHERE that does not depend on its values, worked out once per shape
+    # (columns, operators and which values are NULL) and table: the checked columns, the
+    # predicate, and the access path where the values cannot change it. `probe` is the
+    # condition looked up in a unique index; otherwise `index` is the one condition that can
+    # use a HASH or BTREE index. With several such conditions the cheapest depends on the
+    # values, so both are None and the choice is made per execution (Table._index_candidates).
+    def __init__(self, table: Optional["Table"], schema: Dict[str, str], shape: WhereShape):
+        for col, op, _null in shape:
+            if col not in schema:
+                raise SchemaError(f"Unknown column: {col}")
+            if op not in ("=", "<", ">"):
+                raise SchemaError(f"Unsupported operator: {op}")
+        self.dtypes = [schema[col] for col, _op, _null in shape]
+        self.factory = _predicate_factory(tuple((op, null) for _col, op, null in shape))
+        self.probe: Optional[int] = None
+        self.index: Optional[int] = None
+        if table is None:
+            return
+        usable = []
+        for k, (col, op, null) in enumerate(shape):
+            if null:
+                continue
+            if op == "=" and col in table._indexes:
+                self.probe = k
+                return
+            if (op == "=" and col in table._hash_indexes) or col in table._ordered_indexes:
+                usable.append(k)
+        if len(usable) == 1:
+            self.index = usable[0]
+
+
+class CompiledWhere:
+    def __init__(
+        self,
+        schema: Dict[str, str],
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]],
+        plan: Optional[WherePlan] = None,
+    ):
+        raw = _where_conds(where)
+        if plan is None:
+            plan = WherePlan(None, schema, _where_shape(raw))
+        self.plan = plan
+        self.conds: List[Tuple[str, str, Any]] = [
+            (col, op, _coerce_value(val, dtype)) for (col, op, val), dtype in zip(raw, plan.dtypes)
+        ]
+        self.match: Callable[[Dict[str, Any]], bool] = plan.factory(*[x for col, _op, v in self.conds for x in (col, v)])
+
+
 @dataclass
 class Column:
     name: str
@@ -61,6 +535,10 @@ class Table:
         columns: List[Column],
         persistence_dir: str,
         existing_rows: Optional[List[Dict[str, Any]]] = None,
+        lsn: int = 0,
+        storage: str = "json",
+        layout: str = "row",
+        indexes: Optional[List[Dict[str, str]]] = None,
     ):
         self.name = name
         self.columns = columns
@@ -72,28 +550,214 @@ class Table:
         for c in columns:
             if c.dtype not in SUPPORTED_TYPES:
                 raise SchemaError(f"Unsupported type: {c.dtype}")
-        self._rows: List[Dict[str, Any]] = []
+        if layout not in TABLE_LAYOUTS:
+            raise SchemaError(f"Unsupported table layout: {layout}")
+        self.layout = layout
+        self._rows: Union[List[Optional[Dict[str, Any]]], ColumnStore] = self._new_store([])
+        self._dead = 0
+        self._pins = 0
+        # Moves on every change to the rows (see `version`). The rows file holds the table
+        # as of _persisted_version, the meta file holds _meta_written.
+        self._version = next(_VERSIONS)
+        self._persisted_version: Optional[int] = None
+        self._meta_written: Optional[Dict[str, Any]] = None
+        self._staged: Optional[Tuple[Optional[int], Dict[str, Any]]] = None
+        # For paged files, which keep row positions: the positions changed in place since
+        # the file was written (with the version of the change), and the version at which
+        # compaction or a layout change last renumbered the positions.
+        self._changed: Dict[int, int] = {}
+        self._renumbered = 0
+        self._history: Dict[int, List[Tuple[int, Optional[Dict[str, Any]]]]] = {}
+        self._snapshots: Dict[int, int] = {}
+        self._snap_mutex = threading.Lock()
+        self._loaded = True
+        self._loading = False
+        self._load_lock = threading.RLock()
+        self.lock = RWLock()
+        self._pending_log: List[Dict[str, Any]] = []
+        self.lsn = lsn
         self._indexes: Dict[str, Dict[Any, int]] = {}
+        self.index_defs: Dict[str, Dict[str, str]] = {}
+        self._hash_indexes: Dict[str, Dict[Any, Set[int]]] = {}
+        self._ordered_indexes: Dict[str, OrderedIndex] = {}
+        # WherePlan by WHERE shape; cleared when the indexes change.
+        self._where_plans: Dict[WhereShape, WherePlan] = {}
+        for d in indexes or []:
+            if d["column"] not in self.schema:
+                raise SchemaError(f"Unknown column: {d['column']}")
+            self.index_defs[d["name"]] = {"column": d["column"], "kind": d.get("kind", "hash")}
         self._persistence_dir = persistence_dir
-        self._data_path = os.path.join(persistence_dir, f"{name}.rows.json")
         self._meta_path = os.path.join(persistence_dir, f"{name}.meta.json")
+        self._set_storage(storage)
 
         if existing_rows is not None:
-            self._rows = existing_rows
+            self._rows = self._new_store(existing_rows)
+        self._rebuild_indexes()
+
+    def _new_store(self, rows: Any) -> Union[List[Optional[Dict[str, Any]]], ColumnStore]:
+        # None in `rows` is a deleted row (paged files keep their slots); it stays a tombstone.
+        rows = rows if isinstance(rows, list) else list(rows)
+        self._dead = rows.count(None)
+        if self.layout == "columnar":
+            store = ColumnStore([(c.name, c.dtype) for c in self.columns], (row or {} for row in rows))
+            if self._dead:
+                for i, row in enumerate(rows):
+                    if row is None:
+                        store.delete(i)
+            return store
+        return rows
+
+    def row_count(self) -> int:
+        self._ensure_loaded()
+        return len(self._rows) - self._dead
+
+    @property
+    def version(self) -> int:
+        # Increases with every INSERT, UPDATE, DELETE, rollback and bulk load, so a cache
+        # of query results can tell it is stale by comparing one number.
+        return self._version
+
+    def _live_rows(self) -> List[Dict[str, Any]]:
+        if isinstance(self._rows, ColumnStore) or self._dead:
+            return [row for row in self._rows if row is not None]
+        return self._rows
+
+    def _compact(self) -> None:
+        if isinstance(self._rows, ColumnStore):
+            self._rows.compact()
+        else:
+            self._rows = [row for row in self._rows if row is not None]
+        self._dead = 0
+        self._renumbered = next(_VERSIONS)
+        self._history.clear()
         self._rebuild_indexes()
 
+    def _maybe_compact(self) -> None:
+        if self._pins or self._snapshots:
+            return
+        if self._dead >= COMPACT_MIN_DEAD and self._dead * 2 > len(self._rows):
+            self._compact()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+            try:
+                self._rows = self._new_store(self._read_rows())
+                self._rebuild_indexes()
+                self._persisted_version = self._version
+                pending, self._pending_log = self._pending_log, []
+                for record in pending:
+                    self.apply_log_record(record)
+            finally:
+                self._loading = False
+            self._loaded = True
+
+    def defer_log_record(self, record: Dict[str, Any]) -> None:
+        if self._loaded:
+            self.apply_log_record(record)
+        else:
+            self._pending_log.append(record)
+
+    def set_layout(self, layout: str) -> None:
+        self._ensure_loaded()
+        if layout not in TABLE_LAYOUTS:
+            raise SchemaError(f"Unsupported table layout: {layout}")
+        if layout == self.layout:
+            return
+        self.layout = layout
+        self._rows = self._new_store(self._live_rows())
+        self._renumbered = next(_VERSIONS)
+        self._rebuild_indexes()
+
+    def _live_values(self, col: str) -> Iterable[Tuple[int, Any]]:
+        if isinstance(self._rows, ColumnStore):
+            return self._rows.live_values(col)
+        return ((i, row.get(col)) for i, row in enumerate(self._rows) if row is not None)
+
+    def _project(self, i: int, columns: List[str]) -> Dict[str, Any]:
+        if isinstance(self._rows, ColumnStore):
+            return self._rows.project(i, columns)
+        row = self._rows[i]
+        return {c: row.get(c) for c in columns}
+
+    def _set_storage(self, storage: str) -> None:
+        if storage not in STORAGE_FORMATS:
+            raise SchemaError(f"Unsupported storage format: {storage}")
+        self.storage = storage
+        self._data_path = os.path.join(self._persistence_dir, f"{self.name}{STORAGE_FORMATS[storage]}")
+        self._page_file: Optional[PageFile] = None
+        if storage == "paged":
+            self._page_file = PageFile(self._data_path, [(c.name, c.dtype) for c in self.columns])
+
+    def _read_rows(self) -> List[Dict[str, Any]]:
+        if self._page_file is not None:
+            return self._page_file.read()
+        if not os.path.exists(self._data_path):
+            return []
+        with open(self._data_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
     def _rebuild_indexes(self) -> None:
+        self._where_plans = {}
         self._indexes = {col: {} for col in self.unique_cols}
-        for i, row in enumerate(self._rows):
-            for col in self.unique_cols:
-                v = row.get(col)
+        for col in self.unique_cols:
+            index = self._indexes[col]
+            for i, v in self._live_values(col):
                 if v is None:
                     if col == self.primary_key:
                         raise ConstraintViolation("PRIMARY KEY cannot be NULL")
                     continue
-                if v in self._indexes[col]:
+                if v in index:
                     raise ConstraintViolation(f"Duplicate value for UNIQUE column {col}")
-                self._indexes[col][v] = i
+                index[v] = i
+        self._hash_indexes = {}
+        self._ordered_indexes = {}
+        for d in self.index_defs.values():
+            self._build_index(d["column"], d["kind"])
+
+    def _build_index(self, col: str, kind: str) -> None:
+        if kind == "btree":
+            self._ordered_indexes[col] = OrderedIndex((v, i) for i, v in self._live_values(col) if v is not None)
+            return
+        buckets: Dict[Any, Set[int]] = {}
+        for i, v in self._live_values(col):
+            if v is not None:
+                buckets.setdefault(v, set()).add(i)
+        self._hash_indexes[col] = buckets
+
+    def create_index(self, name: str, column: str, kind: str = "hash") -> None:
+        if column not in self.schema:
+            raise SchemaError(f"Unknown column: {column}")
+        if kind not in INDEX_KINDS:
+            raise SchemaError(f"Unsupported index kind: {kind}")
+        if name in self.index_defs:
+            raise SchemaError(f"Index already exists: {name}")
+        if any(d["column"] == column for d in self.index_defs.values()):
+            raise SchemaError(f"Column already indexed: {column}")
+        self._ensure_loaded()
+        self.index_defs[name] = {"column": column, "kind": kind}
+        self._build_index(column, kind)
+        self._where_plans = {}
+
+    def drop_index(self, name: str) -> None:
+        if name not in self.index_defs:
+            raise SchemaError(f"Index not found: {name}")
+        column = self.index_defs.pop(name)["column"]
+        self._hash_indexes.pop(column, None)
+        self._ordered_indexes.pop(column, None)
+        self._where_plans = {}
+
+    def ordered_index(self, column: str) -> Optional[OrderedIndex]:
+        self._ensure_loaded()
+        return self._ordered_indexes.get(column)
 
     def to_meta(self) -> Dict[str, Any]:
         return {
@@ -102,12 +766,15 @@ class Table:
                 {"name": c.name, "dtype": c.dtype, "primary": c.primary, "unique": c.unique}
                 for c in self.columns
             ],
+            "lsn": self.lsn,
+            "storage": self.storage,
+            "layout": self.layout,
+            "indexes": [{"name": n, **d} for n, d in self.index_defs.items()],
         }
 
     @classmethod
-    def load(cls, name: str, persistence_dir: str) -> "Table":
+    def load(cls, name: str, persistence_dir: str, lazy: bool = False) -> "Table":
         meta_path = os.path.join(persistence_dir, f"{name}.meta.json")
-        data_path = os.path.join(persistence_dir, f"{name}.rows.json")
         with open(meta_path, "r", encoding="utf-8") as f:
             meta = json.load(f)
         cols = [
@@ -119,16 +786,127 @@ class Table:
             )
             for c in meta["columns"]
         ]
-        rows: List[Dict[str, Any]] = []
-        if os.path.exists(data_path):
-            with open(data_path, "r", encoding="utf-8") as f:
-                rows = json.load(f)
-        return cls(name=name, columns=cols, persistence_dir=persistence_dir, existing_rows=rows)
+        t = cls(
+            name=name,
+            columns=cols,
+            persistence_dir=persistence_dir,
+            lsn=int(meta.get("lsn", 0)),
+            storage=meta.get("storage", "json"),
+            layout=meta.get("layout", "row"),
+            indexes=meta.get("indexes"),
+        )
+        t._loaded = False
+        t._meta_written = meta
+        if not lazy:
+            t._ensure_loaded()
+        return t
+
+    @property
+    def dirty(self) -> bool:
+        # True when the rows file is behind the table.
+        if not self._loaded:
+            return bool(self._pending_log) or not os.path.exists(self._data_path)
+        return self._version != self._persisted_version or not os.path.exists(self._data_path)
 
     def persist(self) -> None:
+        # Writes only what changed since the files were last written or read: the rows when
+        # the table is dirty, the meta file when its contents differ. Both are replaced
+        # together, so the rows on disk always match the lsn in the meta file.
+        _finish_install(self._persistence_dir)
+        _install(self._persistence_dir, self.stage())
+        self.commit_stage()
+
+    def checkpoint_view(self) -> Tuple["TableSnapshot", Dict[str, Any], Optional[List[int]]]:
+        # What a checkpoint writes for the table: its rows as of now, the meta that goes with
+        # them and, for paged files, the positions changed in place since the file was
+        # written (None to rewrite it whole). Taken with no writer running, e.g. under the
+        # catalog write lock; the caller closes the snapshot.
+        changed = None
+        persisted = self._persisted_version
+        if self._page_file is not None and persisted is not None and self._renumbered <= persisted:
+            self._changed = {i: v for i, v in self._changed.items() if v > persisted}
+            changed = list(self._changed)
+        return self.snapshot(), self.to_meta(), changed
+
+    def stage(
+        self, view: Optional[Tuple["TableSnapshot", Dict[str, Any], Optional[List[int]]]] = None
+    ) -> List[Dict[str, str]]:
+        # Writes the changed files next to the live ones and returns the steps that install
+        # them; commit_stage() records them as written once they are installed. Given a
+        # view (checkpoint_view()) the files hold the table as of the view, and the caller
+        # needs no lock while other statements change the table.
+        if view is None:
+            if not self.dirty:
+                return self._stage_meta(None, self.to_meta())
+            view = self.checkpoint_view()
+            try:
+                return self.stage(view)
+            finally:
+                view[0].close()
+        snapshot, meta, changed = view
+        steps: List[Dict[str, str]] = []
+        version: Optional[int] = None
+        if snapshot.version != self._persisted_version or not os.path.exists(self._data_path):
+            os.makedirs(self._persistence_dir, exist_ok=True)
+            version = snapshot.version
+            if self._page_file is not None:
+                journal = self._page_file.stage(snapshot.size, snapshot._row, changed)
+                if journal is not None:
+                    steps.append(_step("pages", journal, self._data_path))
+            else:
+                steps.append(_step("rename", _stage_json_rows(self._data_path, snapshot.iter_rows()), self._data_path))
+        return steps + self._stage_meta(version, meta)
+
+    def _stage_meta(self, version: Optional[int], meta: Dict[str, Any]) -> List[Dict[str, str]]:
+        steps: List[Dict[str, str]] = []
+        if meta != self._meta_written:
+            os.makedirs(self._persistence_dir, exist_ok=True)
+            steps.append(_step("rename", _stage_json(self._meta_path, meta), self._meta_path))
+        self._staged = (version, meta)
+        return steps
+
+    def commit_stage(self) -> None:
+        if self._staged is None:
+            return
+        (version, meta), self._staged = self._staged, None
+        if version is not None:
+            self._persisted_version = version
+            if self._page_file is not None:
+                self._page_file.commit_stage()
+        self._meta_written = meta
+
+    def persist_meta(self) -> None:
+        meta = self.to_meta()
+        if meta == self._meta_written:
+            return
         os.makedirs(self._persistence_dir, exist_ok=True)
-        _atomic_write_json(self._meta_path, self.to_meta())
-        _atomic_write_json(self._data_path, self._rows)
+        _atomic_write_json(self._meta_path, meta)
+        self._meta_written = meta
+
+    def convert_storage(self, storage: str) -> None:
+        self._ensure_loaded()
+        old_path = self._data_path
+        self._set_storage(storage)
+        if self._data_path == old_path:
+            return
+        self.persist()
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    def apply_log_record(self, record: Dict[str, Any]) -> None:
+        self._ensure_loaded()
+        op = record["op"]
+        if op == "insert":
+            self.insert(record["row"])
+        elif op == "insert_many":
+            self.insert_many(record["rows"])
+        elif op == "update":
+            self.update(record["updates"], _where_from_json(record.get("where")))
+        elif op == "delete":
+            self.delete(_where_from_json(record.get("where")))
+        else:
+            raise SchemaError(f"Unknown log operation: {op}")
+        self.lsn = int(record["lsn"])
 
     def _validate_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
         out: Dict[str, Any] = {}
@@ -137,9 +915,12 @@ class Table:
         if self.primary_key:
             if out.get(self.primary_key) is None:
                 raise ConstraintViolation("PRIMARY KEY cannot be NULL")
+        if self._page_file is not None:
+            self._page_file.check_row(out)
         return out
 
-    def insert(self, row: Dict[str, Any]) -> None:
+    def insert(self, row: Dict[str, Any], undo: Optional[List[Tuple[Any, ...]]] = None) -> None:
+        self._ensure_loaded()
         new_row = self._validate_row(row)
         for col in self.unique_cols:
             v = new_row.get(col)
@@ -147,47 +928,415 @@ class Table:
                 continue
             if v in self._indexes[col]:
                 raise ConstraintViolation(f"Duplicate value for UNIQUE column {col}")
+        idx = self._append(new_row)
+        if undo is not None:
+            undo.append(("insert", idx))
+
+    def insert_many(self, rows: Iterable[Dict[str, Any]], undo: Optional[List[Tuple[Any, ...]]] = None) -> int:
+        # All rows are validated and checked against UNIQUE columns (including each other)
+        # before any is stored, so a failing batch leaves the table unchanged.
+        self._ensure_loaded()
+        new_rows = [self._validate_row(row) for row in rows]
+        for col in self.unique_cols:
+            existing = self._indexes[col]
+            seen: Set[Any] = set()
+            for new_row in new_rows:
+                v = new_row.get(col)
+                if v is None:
+                    continue
+                if v in existing or v in seen:
+                    raise ConstraintViolation(f"Duplicate value for UNIQUE column {col}")
+                seen.add(v)
+        for new_row in new_rows:
+            idx = self._append(new_row)
+            if undo is not None:
+                undo.append(("insert", idx))
+        return len(new_rows)
+
+    def bulk_load(self, records: Iterable[Any], fields: Optional[List[str]] = None, text: bool = False) -> int:
+        # Records are mappings keyed by column name, or sequences whose positions are named
+        # by fields. Rows are appended unindexed and the indexes are rebuilt once at the end;
+        # a bad value or a constraint violation removes every row of the load again.
+        self._ensure_loaded()
+        if fields is None:
+            source: Tuple[Any, ...] = tuple(self.schema)
+        else:
+            for col in fields:
+                if col not in self.schema:
+                    raise SchemaError(f"Unknown column: {col}")
+            source = tuple(fields.index(col) if col in fields else None for col in self.schema)
+        build = _row_builder(tuple(self.schema.items()), source, text)
+        check = self._page_file.check_row if self._page_file is not None else None
+        start = len(self._rows)
+        append = self._rows.append
+        n = 0
+        try:
+            for record in records:
+                n += 1
+                row = build(record)
+                if check is not None:
+                    check(row)
+                append(row)
+            self._rebuild_indexes()
+            self._version = next(_VERSIONS)
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            self._truncate(start)
+            raise SchemaError(f"Invalid record {n}: {e}") from None
+        except Exception:
+            self._truncate(start)
+            raise
+        return n
+
+    def _truncate(self, n: int) -> None:
+        if isinstance(self._rows, ColumnStore):
+            self._rows.truncate(n)
+        else:
+            del self._rows[n:]
+        self._rebuild_indexes()
+
+    def _append(self, new_row: Dict[str, Any]) -> int:
         idx = len(self._rows)
         self._rows.append(new_row)
+        self._index_row(idx, new_row)
+        self._version = next(_VERSIONS)
+        return idx
+
+    def _index_row(self, i: int, row: Dict[str, Any]) -> None:
         for col in self.unique_cols:
-            v = new_row.get(col)
+            v = row.get(col)
             if v is None:
                 continue
-            self._indexes[col][v] = idx
-
-    def _match_single_where(self, row: Dict[str, Any], where: Tuple[str, str, Any]) -> bool:
-        col, op, val = where
-        if col not in self.schema:
-            raise SchemaError(f"Unknown column: {col}")
-        left = row.get(col)
-        right = _coerce_value(val, self.schema[col])
-        if op == "=":
-            return left == right
-        if op == ">":
-            return left is not None and right is not None and left > right
-        if op == "<":
-            return left is not None and right is not None and left < right
-        raise SchemaError(f"Unsupported operator: {op}")
-
-    def _match_where(
+            self._indexes[col][v] = i
+        for col, buckets in self._hash_indexes.items():
+            v = row.get(col)
+            if v is not None:
+                buckets.setdefault(v, set()).add(i)
+        for col, ordered in self._ordered_indexes.items():
+            v = row.get(col)
+            if v is not None:
+                ordered.add(v, i)
+
+    def _unindex_row(self, i: int, row: Dict[str, Any]) -> None:
+        for col in self.unique_cols:
+            v = row.get(col)
+            if v is not None and self._indexes[col].get(v) == i:
+                del self._indexes[col][v]
+        for col in self._hash_indexes:
+            self._unindex_hash(col, row.get(col), i)
+        for col, ordered in self._ordered_indexes.items():
+            if row.get(col) is not None:
+                ordered.remove(row.get(col), i)
+
+    def _tombstone(self, i: int) -> None:
+        if isinstance(self._rows, ColumnStore):
+            self._rows.delete(i)
+        else:
+            self._rows[i] = None
+        self._dead += 1
+
+    def pin(self) -> None:
+        # Pinned tables keep row positions stable (no compaction) for an open transaction.
+        self._pins += 1
+
+    def snapshot(self) -> "TableSnapshot":
+        # The caller holds the table lock while the snapshot is taken and its reads are set up.
+        return TableSnapshot(self)
+
+    def _open_snapshot(self, version: int) -> None:
+        with self._snap_mutex:
+            self._snapshots[version] = self._snapshots.get(version, 0) + 1
+
+    def _close_snapshot(self, version: int) -> None:
+        # Drops the saved versions that no open snapshot can see any more: an entry is only
+        # read by snapshots older than it, so everything up to the oldest snapshot goes.
+        with self._snap_mutex:
+            n = self._snapshots[version] - 1
+            if n:
+                self._snapshots[version] = n
+                return
+            del self._snapshots[version]
+            if not self._snapshots:
+                self._history.clear()
+                return
+            oldest = min(self._snapshots)
+            if oldest < version:
+                return
+            for i, versions in list(self._history.items()):
+                if versions[-1][0] <= oldest:
+                    del self._history[i]
+                elif versions[0][0] <= oldest:
+                    # Replaced rather than trimmed in place: readers may be walking the old list.
+                    self._history[i] = [e for e in versions if e[0] > oldest]
+
+    def _remember(self, i: int, old: Optional[Dict[str, Any]]) -> None:
+        # Called before row i changes in place. While snapshots are open the row they see
+        # (None for an absent row) is saved with the version that replaces it.
+        self._version = next(_VERSIONS)
+        if self._page_file is not None:
+            self._changed[i] = self._version
+        if self._snapshots:
+            with self._snap_mutex:
+                if self._snapshots:
+                    self._history.setdefault(i, []).append((self._version, old))
+
+    def _changed_since(self, version: int) -> Set[int]:
+        with self._snap_mutex:
+            return {i for i, versions in self._history.items() if versions[-1][0] > version}
+
+    def unpin(self) -> None:
+        self._pins -= 1
+        self._maybe_compact()
+
+    def rollback(self, undo: List[Tuple[Any, ...]]) -> None:
+        # Undo entries are ("insert", i), ("update", i, old_row) or ("delete", i, old_row),
+        # applied newest first.
+        rows = self._rows
+        for entry in reversed(undo):
+            op, i = entry[0], entry[1]
+            if op == "insert":
+                self._unindex_row(i, rows[i])
+                self._remember(i, rows[i])
+                if i == len(rows) - 1 and not self._snapshots:
+                    if isinstance(rows, ColumnStore):
+                        rows.truncate(i)
+                    else:
+                        rows.pop()
+                else:
+                    self._tombstone(i)
+            elif op == "update":
+                self._unindex_row(i, rows[i])
+                self._remember(i, rows[i])
+                rows[i] = entry[2]
+                self._index_row(i, entry[2])
+            else:
+                self._remember(i, None)
+                if isinstance(rows, ColumnStore):
+                    rows.undelete(i)
+                rows[i] = entry[2]
+                self._dead -= 1
+                self._index_row(i, entry[2])
+        undo.clear()
+
+    def _unindex_hash(self, col: str, v: Any, i: int) -> None:
+        if v is None:
+            return
+        bucket = self._hash_indexes[col].get(v)
+        if bucket is not None:
+            bucket.discard(i)
+            if not bucket:
+                del self._hash_indexes[col][v]
+
+    def _matching_positions(
         self,
-        row: Dict[str, Any],
         where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]],
-    ) -> bool:
-        if where is None:
-            return True
-        if isinstance(where, list):
-            for w in where:
-                if not self._match_single_where(row, w):
-                    return False
-            return True
-        return self._match_single_where(row, where)
+    ) -> List[int]:
+        return list(self._iter_positions(where))
+
+    def _iter_positions(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]],
+    ) -> Iterator[int]:
+        compiled = self.compile_where(where)
+        match = compiled.match
+        rows = self._rows
+        candidates = self._index_candidates(compiled)
+        if candidates is not None:
+            return (i for i in candidates if match(rows[i]))
+        if not isinstance(rows, ColumnStore):
+            if not compiled.conds:
+                return (i for i, row in enumerate(rows) if row is not None)
+            return (i for i, row in enumerate(rows) if row is not None and match(row))
+        if not compiled.conds:
+            return (i for i in range(len(rows)) if not rows.is_deleted(i))
+        positions: Optional[List[int]] = None
+        for col, op, v in compiled.conds:
+            positions = rows.match_positions(col, op, v, positions)
+        return iter(positions if positions is not None else ())
+
+    def _index_candidates(self, compiled: "CompiledWhere") -> Optional[List[int]]:
+        # Positions from the most selective usable index, in table order, or None when no
+        # index applies. Conditions other than the probed one still have to be matched.
+        plan = compiled.plan
+        if plan.probe is not None:
+            col, _op, v = compiled.conds[plan.probe]
+            pos = self._indexes[col].get(v)
+            return [] if pos is None else [pos]
+        if plan.index is not None:
+            col, op, v = compiled.conds[plan.index]
+            if op == "=" and col in self._hash_indexes:
+                return sorted(self._hash_indexes[col].get(v, ()))
+            low, high = (v, v) if op == "=" else (v, None) if op == ">" else (None, v)
+            return sorted(self._ordered_indexes[col].range(low, high, op == "=", op == "="))
+        best: Optional[Iterable[int]] = None
+        best_size = 0
+        for col, op, v in compiled.conds:
+            if v is None:
+                continue
+            if op == "=" and col in self._hash_indexes:
+                bucket: Iterable[int] = self._hash_indexes[col].get(v, ())
+                size = len(bucket)
+            elif col in self._ordered_indexes and op in ("=", "<", ">"):
+                ordered = self._ordered_indexes[col]
+                low, high = (v, v) if op == "=" else (v, None) if op == ">" else (None, v)
+                size = ordered.count_range(low, high, op == "=", op == "=")
+                if best is not None and size >= best_size:
+                    continue
+                bucket = ordered.range(low, high, op == "=", op == "=")
+            else:
+                continue
+            if best is None or size < best_size:
+                best, best_size = bucket, size
+        return None if best is None else sorted(best)
+
+    def scan(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]], "CompiledWhere"]] = None,
+    ) -> List[Dict[str, Any]]:
+        return list(self.iter_rows(where))
+
+    def iter_rows(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]], "CompiledWhere"]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        self._ensure_loaded()
+        rows = self._rows
+        return (rows[i] for i in self._iter_positions(where))
+
+    def index_probe(self, col: str) -> Optional[Callable[[Any], List[Dict[str, Any]]]]:
+        self._ensure_loaded()
+        rows = self._rows
+        if col in self._indexes:
+            unique = self._indexes[col]
+
+            def probe_unique(v: Any) -> List[Dict[str, Any]]:
+                pos = unique.get(v)
+                return [] if pos is None else [rows[pos]]
+
+            return probe_unique
+        positions = self._probe_positions(col)
+        if positions is None:
+            return None
+        return lambda v: [rows[p] for p in positions(v)]
+
+    def _probe_positions(self, col: str) -> Optional[Callable[[Any], List[int]]]:
+        if col in self._indexes:
+            unique = self._indexes[col]
+
+            def probe_unique(v: Any) -> List[int]:
+                pos = unique.get(v)
+                return [] if pos is None else [pos]
+
+            return probe_unique
+        if col in self._hash_indexes:
+            buckets = self._hash_indexes[col]
+            return lambda v: sorted(buckets.get(v, ()))
+        if col in self._ordered_indexes:
+            ordered = self._ordered_indexes[col]
+            return lambda v: sorted(ordered.range(v, v))
+        return None
+
+    def compile_where(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]], "CompiledWhere"]],
+    ) -> "CompiledWhere":
+        if isinstance(where, CompiledWhere):
+            return where
+        self._ensure_loaded()
+        conds = _where_conds(where)
+        shape = _where_shape(conds)
+        plan = self._where_plans.get(shape)
+        if plan is None:
+            plan = WherePlan(self, self.schema, shape)
+            if len(self._where_plans) >= MAX_WHERE_PLANS:
+                self._where_plans = {}
+            self._where_plans[shape] = plan
+        return CompiledWhere(self.schema, conds, plan)
 
     def select(
         self,
         columns: Optional[List[str]] = None,
         where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
     ) -> List[Dict[str, Any]]:
+        return list(self.iter_select(columns, where))
+
+    def iter_select(
+        self,
+        columns: Optional[List[str]] = None,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        self._ensure_loaded()
+        columns = self.resolve_columns(columns)
+        project = self._project
+        return (project(i, columns) for i in self._iter_positions(where))
+
+    def iter_records(
+        self,
+        columns: List[str],
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+    ) -> Tuple[Iterator[Any], List[Any]]:
+        self._ensure_loaded()
+        for c in columns:
+            if c not in self.schema:
+                raise SchemaError(f"Unknown column: {c}")
+        rows = self._rows
+        compiled = self.compile_where(where)
+        if isinstance(rows, ColumnStore):
+            positions = self._iter_positions(compiled)
+            return (rows.values(i, columns) for i in positions), list(range(len(columns)))
+        if not compiled.conds:
+            return filter(None, rows), list(columns)
+        return (rows[i] for i in self._iter_positions(compiled)), list(columns)
+
+    def iter_ordered(
+        self,
+        column: str,
+        descending: bool = False,
+        columns: Optional[List[str]] = None,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+    ) -> Optional[Iterator[Dict[str, Any]]]:
+        self._ensure_loaded()
+        columns = self.resolve_columns(columns)
+        compiled = self.compile_where(where)
+        bounds = self._ordered_bounds(column, compiled)
+        if bounds is None:
+            return None
+        low, high, low_inclusive, high_inclusive = bounds
+        ordered = self._ordered_indexes[column]
+        rows = self._rows
+        match = compiled.match
+        project = self._project
+        positions: Iterable[int] = ordered.positions(descending, low, high, low_inclusive, high_inclusive)
+        if low is None and high is None and len(ordered) < self.row_count():
+            # NULLs are not indexed; they sort before every value.
+            null_where = self.compile_where(compiled.conds + [(column, "=", None)])
+
+            def nulls() -> Iterator[int]:
+                yield from self._iter_positions(null_where)
+
+            positions = chain(positions, nulls()) if descending else chain(nulls(), positions)
+        return (project(i, columns) for i in positions if match(rows[i]))
+
+    def _ordered_bounds(self, column: str, compiled: "CompiledWhere") -> Optional[Tuple[Any, Any, bool, bool]]:
+        # The index range an ORDER BY on a btree column walks, or None when there is no such
+        # index or an equality on another indexed column is the better plan.
+        if column not in self._ordered_indexes:
+            return None
+        low = high = None
+        low_inclusive = high_inclusive = True
+        for col, op, v in compiled.conds:
+            if v is None:
+                continue
+            if col != column:
+                if op == "=" and (col in self._indexes or col in self._hash_indexes or col in self._ordered_indexes):
+                    return None
+                continue
+            if op in ("=", ">"):
+                low, low_inclusive = v, op == "="
+            if op in ("=", "<"):
+                high, high_inclusive = v, op == "="
+        return low, high, low_inclusive, high_inclusive
+
+    def resolve_columns(self, columns: Optional[List[str]]) -> List[str]:
         if columns is None:
             columns = list(self.schema.keys())
         for c in columns:
@@ -195,74 +1344,437 @@ class Table:
                 raise SchemaError(f"Unknown column: {c}")
         if columns == ["*"]:
             columns = list(self.schema.keys())
-
-        index_where: Optional[Tuple[str, str, Any]] = None
-        if isinstance(where, list):
-            for w in where:
-                if w[1] == "=" and w[0] in self._indexes:
-                    index_where = w
-                    break
-        else:
-            index_where = where
-
-        if index_where and index_where[1] == "=" and index_where[0] in self._indexes:
-            col, _, val = index_where
-            v = _coerce_value(val, self.schema[col])
-            if v in self._indexes[col]:
-                row = self._rows[self._indexes[col][v]]
-                if self._match_where(row, where):
-                    return [{c: row.get(c) for c in columns}]
-            return []
-
-        out: List[Dict[str, Any]] = []
-        for row in self._rows:
-            if self._match_where(row, where):
-                out.append({c: row.get(c) for c in columns})
-        return out
+        return columns
 
     def update(
         self,
         updates: Dict[str, Any],
         where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+        undo: Optional[List[Tuple[Any, ...]]] = None,
     ) -> int:
+        self._ensure_loaded()
         for col in updates:
             if col not in self.schema:
                 raise SchemaError(f"Unknown column: {col}")
 
-        count = 0
-        new_rows = list(self._rows)
-        for i, row in enumerate(self._rows):
-            if not self._match_where(row, where):
-                continue
-            candidate = dict(row)
+        changed: List[Tuple[int, Dict[str, Any], Dict[str, Any]]] = []
+        for i in self._matching_positions(where):
+            old = self._rows[i]
+            candidate = dict(old)
             for col, val in updates.items():
                 candidate[col] = _coerce_value(val, self.schema[col])
             if self.primary_key and candidate.get(self.primary_key) is None:
                 raise ConstraintViolation("PRIMARY KEY cannot be NULL")
-            new_rows[i] = candidate
-            count += 1
+            if self._page_file is not None:
+                self._page_file.check_row(candidate)
+            changed.append((i, old, candidate))
+
+        touched = [col for col in self.unique_cols if col in updates]
+        positions = {i for i, _old, _new in changed}
+        for col in touched:
+            index = self._indexes[col]
+            seen: Set[Any] = set()
+            for _i, _old, new in changed:
+                v = new.get(col)
+                if v is None:
+                    continue
+                if v in seen or (v in index and index[v] not in positions):
+                    raise ConstraintViolation(f"Duplicate value for UNIQUE column {col}")
+                seen.add(v)
+
+        for col in touched:
+            index = self._indexes[col]
+            for i, old, _new in changed:
+                v = old.get(col)
+                if v is not None and index.get(v) == i:
+                    del index[v]
+            for i, _old, new in changed:
+                v = new.get(col)
+                if v is not None:
+                    index[v] = i
+        for col in self._hash_indexes:
+            if col not in updates:
+                continue
+            buckets = self._hash_indexes[col]
+            for i, old, new in changed:
+                self._unindex_hash(col, old.get(col), i)
+                v = new.get(col)
+                if v is not None:
+                    buckets.setdefault(v, set()).add(i)
+        for col, ordered in self._ordered_indexes.items():
+            if col not in updates:
+                continue
+            for i, old, new in changed:
+                if old.get(col) is not None:
+                    ordered.remove(old.get(col), i)
+                if new.get(col) is not None:
+                    ordered.add(new.get(col), i)
+        for i, old, new in changed:
+            self._remember(i, old)
+            self._rows[i] = new
+        if undo is not None:
+            undo.extend(("update", i, old) for i, old, _new in changed)
+        return len(changed)
+
+    def delete(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+        undo: Optional[List[Tuple[Any, ...]]] = None,
+    ) -> int:
+        self._ensure_loaded()
+        positions = self._matching_positions(where)
+        for i in positions:
+            row = self._rows[i]
+            self._unindex_row(i, row)
+            self._remember(i, row)
+            self._tombstone(i)
+            if undo is not None:
+                undo.append(("delete", i, row))
+        self._maybe_compact()
+        return len(positions)
 
-        self._rows = new_rows
-        self._rebuild_indexes()
-        return count
-
-    def delete(self, where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None) -> int:
-        kept: List[Dict[str, Any]] = []
-        removed = 0
-        for row in self._rows:
-            if self._match_where(row, where):
-                removed += 1
-            else:
-                kept.append(row)
-        self._rows = kept
-        self._rebuild_indexes()
-        return removed
+
+class TableSnapshot:
+    # A read-only view of a table as of the moment it was taken. Writers save the previous
+    # version of every row they change while snapshots are open (Table._remember), and reads
+    # here resolve each position to the version current at `version`, so rows stream
+    # without the table lock. Index lookups and columnar filters run when a read is set up,
+    # which happens under the lock; only join probes take it again, briefly, per probe.
+    # Positions stay put because compaction waits for open snapshots, and rows appended
+    # later lie at or beyond `size`.
+    def __init__(self, table: Table):
+        table._ensure_loaded()
+        self.table = table
+        self.name = table.name
+        self.schema = table.schema
+        self.columns = table.columns
+        self.version = table._version
+        self.size = len(table._rows)
+        self._count = self.size - table._dead
+        self._rows = table._rows
+        self._columnar = isinstance(self._rows, ColumnStore)
+        self._history = table._history
+        self._closed = False
+        table._open_snapshot(self.version)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self.table._close_snapshot(self.version)
+
+    def row_count(self) -> int:
+        return self._count
+
+    def resolve_columns(self, columns: Optional[List[str]]) -> List[str]:
+        return self.table.resolve_columns(columns)
+
+    def ordered_index(self, column: str) -> Optional[OrderedIndex]:
+        # The live index: it matches the snapshot only while the read is set up.
+        return self.table.ordered_index(column)
+
+    def compile_where(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]], "CompiledWhere"]],
+    ) -> "CompiledWhere":
+        return self.table.compile_where(where)
+
+    def _row(self, i: int) -> Optional[Dict[str, Any]]:
+        # The row is read before its saved versions: a writer saves the old version before
+        # touching the row, so a change that raced with the read is always seen here.
+        rows = self._rows
+        if self._columnar:
+            row = None if rows.is_deleted(i) else rows[i]
+        else:
+            row = rows[i]
+        versions = self._history.get(i)
+        if versions is not None and versions[-1][0] > self.version:
+            for v, old in versions:
+                if v > self.version:
+                    return old
+        return row
+
+    def _positions(self, compiled: "CompiledWhere") -> Tuple[Iterable[int], bool]:
+        # Runs at setup, under the table lock. Returns the positions to read and whether
+        # they are exact matches already; otherwise each row is matched as it is read.
+        table = self.table
+        rows = self._rows
+        candidates = table._index_candidates(compiled)
+        if candidates is not None:
+            match = compiled.match
+            return [i for i in candidates if match(rows[i])], True
+        if self._columnar and compiled.conds:
+            positions: Optional[List[int]] = None
+            for col, op, v in compiled.conds:
+                positions = rows.match_positions(col, op, v, positions)
+            return positions or [], True
+        return range(self.size), not compiled.conds
+
+    def _visible(self, positions: Iterable[int], exact: bool, compiled: "CompiledWhere") -> Iterator[Dict[str, Any]]:
+        rows = map(self._row, positions)
+        if exact:
+            return filter(None, rows)
+        match = compiled.match
+        return (row for row in rows if row is not None and match(row))
+
+    def iter_rows(
+        self,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]], "CompiledWhere"]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        compiled = self.compile_where(where)
+        positions, exact = self._positions(compiled)
+        return self._visible(positions, exact, compiled)
+
+    def iter_select(
+        self,
+        columns: Optional[List[str]] = None,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        columns = self.resolve_columns(columns)
+        return ({c: row.get(c) for c in columns} for row in self.iter_rows(where))
+
+    def iter_records(
+        self,
+        columns: List[str],
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+    ) -> Tuple[Iterator[Any], List[Any]]:
+        for c in columns:
+            if c not in self.schema:
+                raise SchemaError(f"Unknown column: {c}")
+        compiled = self.compile_where(where)
+        positions, exact = self._positions(compiled)
+        if not self._columnar:
+            return self._visible(positions, exact, compiled), list(columns)
+        # Columnar positions are always exact; values are read without building rows unless
+        # the row changed after the snapshot.
+        rows = self._rows
+        current = rows.values
+        history = self._history
+        version = self.version
+
+        def values(i: int) -> Optional[Tuple[Any, ...]]:
+            out = None if rows.is_deleted(i) else current(i, columns)
+            versions = history.get(i)
+            if versions is not None and versions[-1][0] > version:
+                old = next(o for v, o in versions if v > version)
+                return None if old is None else tuple(old.get(c) for c in columns)
+            return out
+
+        return filter(None, map(values, positions)), list(range(len(columns)))
+
+    def iter_ordered(
+        self,
+        column: str,
+        descending: bool = False,
+        columns: Optional[List[str]] = None,
+        where: Optional[Union[Tuple[str, str, Any], List[Tuple[str, str, Any]]]] = None,
+    ) -> Optional[Iterator[Dict[str, Any]]]:
+        table = self.table
+        columns = self.resolve_columns(columns)
+        compiled = self.compile_where(where)
+        bounds = table._ordered_bounds(column, compiled)
+        if bounds is None:
+            return None
+        ordered = table._ordered_indexes[column]
+        positions: Iterable[int] = ordered.range(*bounds)
+        if descending:
+            positions = reversed(positions)
+        low, high = bounds[0], bounds[1]
+        if low is None and high is None and len(ordered) < self._count:
+            # NULLs are not indexed; they sort before every value.
+            null_where = self.compile_where(compiled.conds + [(column, "=", None)])
+            nulls, exact = self._positions(null_where)
+            null_rows = self._visible(nulls, exact, null_where)
+            rows = self._visible(positions, False, compiled)
+            rows = chain(rows, null_rows) if descending else chain(null_rows, rows)
+        else:
+            rows = self._visible(positions, False, compiled)
+        return ({c: row.get(c) for c in columns} for row in rows)
+
+    def index_probe(self, col: str) -> Optional[Callable[[Any], List[Dict[str, Any]]]]:
+        # Probes run while the join streams, so each one reads the live index under the
+        # table lock and adds the rows changed since the snapshot, whose old versions may
+        # hold the key.
+        table = self.table
+        positions = table._probe_positions(col)
+        if positions is None:
+            return None
+        lock = table.lock
+        version = self.version
+        size = self.size
+        row = self._row
+
+        def probe(v: Any) -> List[Dict[str, Any]]:
+            lock.acquire_read()
+            try:
+                found: Iterable[int] = positions(v)
+                if table._version > version:
+                    found = sorted(set(found) | table._changed_since(version))
+            finally:
+                lock.release_read()
+            out = []
+            for i in found:
+                if i < size:
+                    r = row(i)
+                    if r is not None and r.get(col) == v:
+                        out.append(r)
+            return out
+
+        return probe
 
 
 class Catalog:
-    def __init__(self, persistence_dir: str):
+    def __init__(
+        self,
+        persistence_dir: str,
+        checkpoint_interval: int = 1000,
+        storage_format: str = "json",
+        table_layout: str = "row",
+        lazy_load: bool = True,
+        durability: str = "async",
+        flush_interval: float = 0.05,
+    ):
+        if storage_format not in STORAGE_FORMATS:
+            raise SchemaError(f"Unsupported storage format: {storage_format}")
+        if table_layout not in TABLE_LAYOUTS:
+            raise SchemaError(f"Unsupported table layout: {table_layout}")
+        self.table_layout = table_layout
+        self.lazy_load = lazy_load
         self.persistence_dir = persistence_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.storage_format = storage_format
+        self.wal = WriteAheadLog(os.path.join(persistence_dir, WAL_FILENAME), durability, flush_interval)
+        self._dir_lock = _lock_directory(persistence_dir)
         self._tables: Dict[str, Table] = {}
+        self._unflushed: Set[str] = set()
+        self.open_transactions = 0
+        self.recovery: Dict[str, Any] = {}
+        # Statements hold the read side (plus table locks); schema changes and checkpoints
+        # take the write side. _mutex guards the bookkeeping shared by concurrent writers.
+        self.lock = RWLock()
+        self._mutex = threading.Lock()
+        self._checkpointer: Optional[threading.Thread] = None
+        # Bulk loads write table files under the read side only; this keeps two of them from
+        # installing at once (they share the staging paths).
+        self._bulk_install = threading.Lock()
+
+    def log(self, table: Table, record: Dict[str, Any]) -> None:
+        table.lsn = self.wal.append({"table": table.name, **record})
+        with self._mutex:
+            self._unflushed.add(table.name)
+
+    def checkpoint_due(self) -> bool:
+        # Table files must never contain uncommitted rows, so checkpoints wait for open
+        # transactions to finish.
+        return self.wal.pending >= self.checkpoint_interval and not self.open_transactions
+
+    def maybe_checkpoint(self) -> None:
+        # Called between statements. The caller only fixes what the checkpoint will write:
+        # a snapshot of every changed table and the end of the log, which needs the catalog
+        # to itself for a moment. Writing the files and dropping the logged records runs in
+        # a background thread (_write_checkpoint) while statements go on. While other
+        # statements or open result iterators hold the catalog, the checkpoint is left for a
+        # later statement, until the log reaches twice the interval and the caller waits.
+        if not self.checkpoint_due() or self.checkpoint_running():
+            return
+        try:
+            if not self.lock.acquire_write(blocking=self.wal.pending >= 2 * self.checkpoint_interval):
+                return
+        except RuntimeError:
+            # This thread still holds the read side through an open result iterator.
+            return
+        try:
+            if self.checkpoint_due() and not self.checkpoint_running():
+                self._start_checkpoint()
+        finally:
+            self.lock.release_write()
+
+    def checkpoint_running(self) -> bool:
+        return self._checkpointer is not None and self._checkpointer.is_alive()
+
+    def wait_checkpoint(self) -> None:
+        # Waits for a background checkpoint to finish. Everything else that writes table
+        # files (and DDL, which changes which tables there are) calls this first, holding
+        # the catalog write lock, or the read side for bulk loads; either keeps a new
+        # checkpoint from starting, and the background thread never takes the lock.
+        thread = self._checkpointer
+        if thread is not None:
+            thread.join()
+
+    def _start_checkpoint(self) -> None:
+        # Called with the catalog write lock held.
+        views = []
+        for name in sorted(self._unflushed):
+            t = self._tables.get(name)
+            if t is not None:
+                views.append((t, t.checkpoint_view()))
+        offset, records = self.wal.mark()
+        self._unflushed.clear()
+        self._checkpointer = threading.Thread(
+            target=self._write_checkpoint, args=(views, offset, records), name="minidb-checkpoint", daemon=True
+        )
+        self._checkpointer.start()
+
+    def _write_checkpoint(self, views: List[Tuple[Table, Any]], offset: int, records: int) -> None:
+        try:
+            if views:
+                _finish_install(self.persistence_dir)
+                steps: List[Dict[str, str]] = []
+                for t, view in views:
+                    steps.extend(t.stage(view))
+                _install(self.persistence_dir, steps)
+                for t, _view in views:
+                    t.commit_stage()
+            self.wal.drop_prefix(offset, records)
+        except BaseException:
+            # The log still holds every change, so the next checkpoint writes them again.
+            with self._mutex:
+                self._unflushed.update(t.name for t, _view in views)
+            raise
+        finally:
+            for _t, view in views:
+                view[0].close()
+
+    def begin(self) -> "Transaction":
+        self.lock.acquire_read()
+        with self._mutex:
+            self.open_transactions += 1
+        return Transaction(self)
+
+    def bulk_load(self, name: str, records: Iterable[Any], fields: Optional[List[str]] = None, text: bool = False) -> int:
+        # Bulk loads bypass the log: the table file is written once, which also folds in any
+        # logged changes to the table, and the rows are durable when this returns.
+        table = self.get_table(name)
+        n = table.bulk_load(records, fields, text)
+        with self._bulk_install:
+            # A checkpoint started before the load shares the table's staging files.
+            self.wait_checkpoint()
+            table.persist()
+        with self._mutex:
+            self._unflushed.discard(name)
+        return n
+
+    def checkpoint(self) -> None:
+        # Every table changed since the last checkpoint is staged and installed as one unit,
+        # so the files never mix tables from before and after a transaction.
+        self.wait_checkpoint()
+        tables = [self._tables[name] for name in sorted(self._unflushed) if name in self._tables]
+        if tables:
+            _finish_install(self.persistence_dir)
+            steps: List[Dict[str, str]] = []
+            for t in tables:
+                steps.extend(t.stage())
+            _install(self.persistence_dir, steps)
+            for t in tables:
+                t.commit_stage()
+        self._unflushed.clear()
+        self.wal.truncate()
+
+    def close(self, checkpoint: bool = True) -> None:
+        self.wait_checkpoint()
+        if checkpoint:
+            self.checkpoint()
+        self.wal.close()
+        self._dir_lock.close()
 
     def list_tables(self) -> List[str]:
         return sorted(self._tables.keys())
@@ -273,13 +1785,11 @@ class Catalog:
     def drop_table(self, name: str) -> None:
         if name not in self._tables:
             raise SchemaError(f"Table not found: {name}")
+        self.checkpoint()
         t = self._tables[name]
-        meta_path = os.path.join(self.persistence_dir, f"{t.name}.meta.json")
-        data_path = os.path.join(self.persistence_dir, f"{t.name}.rows.json")
-        if os.path.exists(meta_path):
-            os.remove(meta_path)
-        if os.path.exists(data_path):
-            os.remove(data_path)
+        for path in (t._meta_path, t._data_path):
+            if os.path.exists(path):
+                os.remove(path)
         del self._tables[name]
 
     def get_table(self, name: str) -> Table:
@@ -288,18 +1798,174 @@ class Catalog:
         return self._tables[name]
 
     def load_existing(self) -> None:
+        # Recovery: finish a checkpoint that crashed after its commit point, drop the files
+        # staged by one that did not get that far, cut a torn record off the end of the WAL,
+        # then bring the tables forward with the committed records in it. What it did is
+        # left in `recovery`.
         if not os.path.exists(self.persistence_dir):
             return
+        started = time.perf_counter()
+        redone = _finish_install(self.persistence_dir)
+        removed = []
+        for fn in sorted(os.listdir(self.persistence_dir)):
+            if fn.endswith(_STAGED_SUFFIXES):
+                os.remove(os.path.join(self.persistence_dir, fn))
+                removed.append(fn)
         for fn in os.listdir(self.persistence_dir):
             if fn.endswith(".meta.json"):
                 name = fn[: -len(".meta.json")]
                 if name not in self._tables:
-                    self._tables[name] = Table.load(name, self.persistence_dir)
+                    self._tables[name] = Table.load(name, self.persistence_dir, lazy=self.lazy_load)
+        for t in self._tables.values():
+            self.wal.next_lsn = max(self.wal.next_lsn, t.lsn + 1)
+        uncommitted: Dict[int, List[Dict[str, Any]]] = {}
+        replayed = 0
+        for record in self.wal.read():
+            txn = record.get("txn")
+            if record.get("op") == "commit":
+                for r in uncommitted.pop(txn, []):
+                    replayed += self._replay(r)
+            elif txn is not None:
+                uncommitted.setdefault(txn, []).append(record)
+            else:
+                replayed += self._replay(record)
+        self.recovery = {
+            "seconds": time.perf_counter() - started,
+            "checkpoint_redone": redone,
+            "removed_files": removed,
+            "replayed": replayed,
+            "discarded_uncommitted": sum(len(records) for records in uncommitted.values()),
+            "wal_truncated_bytes": self.wal.truncated_bytes,
+        }
+
+    def _replay(self, record: Dict[str, Any]) -> bool:
+        t = self._tables.get(record.get("table"))
+        if t is None or int(record["lsn"]) <= t.lsn:
+            return False
+        t.defer_log_record(record)
+        self._unflushed.add(t.name)
+        return True
+
+    def warm(self, names: Iterable[str], background: bool = True) -> Optional[threading.Thread]:
+        tables = [self._tables[n] for n in names if n in self._tables]
+
+        def _load() -> None:
+            for t in tables:
+                t._ensure_loaded()
+
+        if not background:
+            _load()
+            return None
+        thread = threading.Thread(target=_load, name="minidb-warm", daemon=True)
+        thread.start()
+        return thread
+
+    def _find_index(self, name: str) -> Optional[Table]:
+        for t in self._tables.values():
+            if name in t.index_defs:
+                return t
+        return None
+
+    def create_index(self, name: str, table: str, column: str, kind: str = "hash") -> None:
+        t = self.get_table(table)
+        if self._find_index(name) is not None:
+            raise SchemaError(f"Index already exists: {name}")
+        t.create_index(name, column, kind)
+        self.checkpoint()
+        t.persist_meta()
+
+    def drop_index(self, name: str) -> None:
+        t = self._find_index(name)
+        if t is None:
+            raise SchemaError(f"Index not found: {name}")
+        t.drop_index(name)
+        self.checkpoint()
+        t.persist_meta()
 
     def create_table(self, name: str, columns: List[Column]) -> Table:
         if name in self._tables:
             raise SchemaError(f"Table already exists: {name}")
-        t = Table(name=name, columns=columns, persistence_dir=self.persistence_dir)
+        t = Table(
+            name=name,
+            columns=columns,
+            persistence_dir=self.persistence_dir,
+            storage=self.storage_format,
+            layout=self.table_layout,
+        )
         self._tables[name] = t
         t.persist()
         return t
+
+    def convert_storage(self, storage_format: str) -> None:
+        if storage_format not in STORAGE_FORMATS:
+            raise SchemaError(f"Unsupported storage format: {storage_format}")
+        self.checkpoint()
+        for name in self.list_tables():
+            self._tables[name].convert_storage(storage_format)
+        self.storage_format = storage_format
+
+
+class Transaction:
+    # Strict two-phase locking: a transaction holds the catalog read lock from BEGIN and the
+    # write lock of every table it changes until it commits or rolls back, so no other
+    # statement sees its changes before commit or changes the rows its undo log restores.
+    # Locks belong to a thread, and so does the transaction. Changes are applied to the
+    # tables immediately and recorded in per-table undo logs; their log records are held
+    # back until commit writes them to the WAL in one batch.
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.records: List[Tuple[Table, Dict[str, Any]]] = []
+        self._undo: Dict[str, Tuple[Table, List[Tuple[Any, ...]]]] = {}
+        self._locks: Dict[str, Callable[[], None]] = {}
+        self.closed = False
+
+    def lock(self, table: Table, timeout: Optional[float] = None) -> None:
+        # Write-locks `table` until the transaction ends. Transactions take their locks in
+        # statement order, so two of them can wait on each other; the timeout breaks that.
+        if table.name in self._locks:
+            return
+        if not table.lock.acquire_write(timeout=timeout):
+            raise LockTimeout(f"Lock wait timed out on table {table.name}")
+        self._locks[table.name] = table.lock.release_write
+
+    def undo_log(self, table: Table) -> List[Tuple[Any, ...]]:
+        entry = self._undo.get(table.name)
+        if entry is None:
+            table.pin()
+            entry = self._undo[table.name] = (table, [])
+        return entry[1]
+
+    def log(self, table: Table, record: Dict[str, Any]) -> None:
+        self.records.append((table, record))
+
+    def commit(self) -> None:
+        if self.records:
+            try:
+                lsns = self.catalog.wal.append_transaction([{"table": t.name, **r} for t, r in self.records])
+            except BaseException:
+                # Not in the log, so it must not stay in the tables either.
+                self.rollback()
+                raise
+            with self.catalog._mutex:
+                for (table, _record), lsn in zip(self.records, lsns):
+                    table.lsn = lsn
+                    self.catalog._unflushed.add(table.name)
+        self._close()
+
+    def rollback(self) -> None:
+        for table, undo in self._undo.values():
+            table.rollback(undo)
+        self._close()
+
+    def _close(self) -> None:
+        self.closed = True
+        for table, _undo in self._undo.values():
+            table.unpin()
+        self._undo.clear()
+        self.records.clear()
+        for release in self._locks.values():
+            release()
+        self._locks.clear()
+        with self.catalog._mutex:
+            self.catalog.open_transactions -= 1
+        self.catalog.lock.release_read()
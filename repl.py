@@ -31,6 +31,13 @@ def main() -> None:
         if sql == "":
             continue
         try:
+            if sql[:7].upper() == "SELECT ":
+                n = 0
+                for row in db.execute_iter(sql, token):
+                    print(row)
+                    n += 1
+                print(f"({n} rows)")
+                continue
             res = db.execute(sql, token)
             print(res)
         except MiniDBError as e:
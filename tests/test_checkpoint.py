@@ -0,0 +1,69 @@
+import threading
+import time
+
+from minidb import MiniDB
+from minidb.storage import Table
+
+
+def _hold_checkpoint(monkeypatch):
+    # Blocks the background checkpoint thread inside its first stage() call until released.
+    started = threading.Event()
+    release = threading.Event()
+    stage = Table.stage
+
+    def held(self, view=None):
+        if threading.current_thread().name == "minidb-checkpoint" and not started.is_set():
+            started.set()
+            release.wait(10)
+        return stage(self, view)
+
+    monkeypatch.setattr(Table, "stage", held)
+    return started, release
+
+
+def test_background_checkpoint_writes_tables_and_truncates_log(tmp_path):
+    db = MiniDB(str(tmp_path), enable_auth=False, checkpoint_interval=10)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v STRING)")
+    for i in range(25):
+        db.execute(f"INSERT INTO t (id, v) VALUES ({i}, 'v{i}')")
+    db.catalog.wait_checkpoint()
+    assert db.catalog.wal.pending < 25
+    db.close(checkpoint=False)
+
+    db = MiniDB(str(tmp_path), enable_auth=False)
+    assert db.execute("SELECT COUNT(*) AS n FROM t") == [{"n": 25}]
+    db.close()
+
+
+def test_bulk_load_waits_for_checkpoint_in_flight(tmp_path, monkeypatch):
+    started, release = _hold_checkpoint(monkeypatch)
+    db = MiniDB(str(tmp_path), enable_auth=False, checkpoint_interval=10)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v STRING)")
+    for i in range(10):
+        db.execute(f"INSERT INTO t (id, v) VALUES ({i}, 'v{i}')")
+    assert started.wait(10)
+    assert db.catalog.checkpoint_running()
+
+    errors = []
+
+    def load():
+        try:
+            db.bulk_load("t", ({"id": i, "v": f"b{i}"} for i in range(10, 1010)))
+        except BaseException as e:
+            errors.append(e)
+
+    loader = threading.Thread(target=load)
+    loader.start()
+    time.sleep(0.2)
+    assert loader.is_alive()  # waiting for the checkpoint, not writing beside it
+    release.set()
+    loader.join(10)
+    assert not errors
+    db.catalog.wait_checkpoint()
+    assert db.row_count("t") == 1010
+    db.close(checkpoint=False)
+
+    db = MiniDB(str(tmp_path), enable_auth=False)
+    assert db.row_count("t") == 1010
+    assert db.execute("SELECT v FROM t WHERE id = 1009") == [{"v": "b1009"}]
+    db.close()
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from minidb import MiniDB
+from minidb.errors import SchemaError
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = MiniDB(str(tmp_path), enable_auth=False)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, u INT, s STRING)")
+    db.executemany("INSERT INTO t (id, u, s) VALUES (?, ?, ?)", [(i, i % 7, f"s{i % 3}") for i in range(200)])
+    yield db
+    db.close()
+
+
+def _expected(rows, conds):
+    ops = {"=": lambda a, b: a == b, "<": lambda a, b: a is not None and a < b, ">": lambda a, b: a is not None and a > b}
+    return sorted(r["id"] for r in rows if all(ops[op](r[col], v) for col, op, v in conds))
+
+
+def test_plans_follow_index_changes(db):
+    rows = db.execute("SELECT * FROM t")
+    statements = {
+        (("u", "=", None),): db.prepare("SELECT id FROM t WHERE u = ?"),
+        (("u", ">", None),): db.prepare("SELECT id FROM t WHERE u > ?"),
+        (("s", "=", None),): db.prepare("SELECT id FROM t WHERE s = ?"),
+        (("id", "<", None),): db.prepare("SELECT id FROM t WHERE id < ?"),
+    }
+    ddl = [
+        "CREATE INDEX t_u ON t (u)",
+        "DROP INDEX t_u",
+        "CREATE INDEX t_u ON t (u) USING BTREE",
+        "CREATE INDEX t_s ON t (s)",
+        "DROP INDEX t_u",
+        "DROP INDEX t_s",
+    ]
+    rng = random.Random(15)
+    for step in [None] + ddl:
+        if step is not None:
+            db.execute(step)
+        for shape, stmt in statements.items():
+            for _ in range(5):
+                col = shape[0][0]
+                v = f"s{rng.randrange(4)}" if col == "s" else rng.randrange(-2, 210)
+                got = sorted(r["id"] for r in stmt.execute((v,)))
+                assert got == _expected(rows, [(col, shape[0][1], v)]), (step, shape, v)
+
+
+def test_point_lookup_after_table_is_recreated(db):
+    by_id = db.prepare("SELECT s FROM t WHERE id = ?")
+    assert by_id.execute((5,)) == [{"s": "s2"}]
+    db.execute("DROP TABLE t")
+    db.execute("CREATE TABLE t (id INT, s STRING)")
+    db.execute("INSERT INTO t (id, s) VALUES (5, 'x')")
+    db.execute("INSERT INTO t (id, s) VALUES (5, 'y')")
+    assert sorted(r["s"] for r in by_id.execute((5,))) == ["x", "y"]
+    db.execute("DROP TABLE t")
+    db.execute("CREATE TABLE t (id INT, v INT)")
+    with pytest.raises(SchemaError):
+        by_id.execute((5,))
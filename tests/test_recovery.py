@@ -0,0 +1,137 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from minidb import MiniDB
+from minidb.storage import WAL_FILENAME
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _crash(path, body):
+    # Runs `body` against the database in a child process that then dies without closing it.
+    code = textwrap.dedent(
+        """
+        import os, sys
+        sys.path.insert(0, {root!r})
+        from minidb import MiniDB
+        import minidb.storage as storage
+        db = MiniDB({path!r}, enable_auth=False, durability="sync", checkpoint_interval=10**9)
+        """
+    ).format(root=ROOT, path=str(path))
+    code += textwrap.dedent(body) + "\nos._exit(0)\n"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+@pytest.fixture
+def path(tmp_path):
+    db = MiniDB(str(tmp_path), enable_auth=False)
+    db.execute("CREATE TABLE a (id INT PRIMARY KEY, v INT)")
+    db.execute("CREATE TABLE b (id INT PRIMARY KEY, v INT)")
+    db.execute("CREATE INDEX a_v ON a (v)")
+    db.close()
+    return tmp_path
+
+
+def test_logged_statements_are_replayed(path):
+    _crash(
+        path,
+        """
+        for i in range(50):
+            db.execute(f"INSERT INTO a (id, v) VALUES ({i}, {i % 5})")
+        db.execute("UPDATE a SET v = 9 WHERE id = 3")
+        db.execute("DELETE FROM a WHERE id = 4")
+        """,
+    )
+    db = MiniDB(str(path), enable_auth=False)
+    assert db.recovery["replayed"] == 52
+    assert db.row_count("a") == 49
+    assert db.execute("SELECT v FROM a WHERE id = 3") == [{"v": 9}]
+    assert sorted(r["id"] for r in db.execute("SELECT id FROM a WHERE v = 9")) == [3]
+    db.close()
+
+
+def test_torn_log_tail_is_cut(path):
+    _crash(path, 'db.execute("INSERT INTO a (id, v) VALUES (1, 1)")')
+    with open(os.path.join(path, WAL_FILENAME), "ab") as f:
+        f.write(b'{"table": "a", "op": "ins')
+    db = MiniDB(str(path), enable_auth=False)
+    assert db.recovery["wal_truncated_bytes"] > 0
+    assert db.execute("SELECT * FROM a") == [{"id": 1, "v": 1}]
+    db.execute("INSERT INTO a (id, v) VALUES (2, 2)")
+    db.close(checkpoint=False)
+    db = MiniDB(str(path), enable_auth=False)
+    assert db.row_count("a") == 2
+    db.close()
+
+
+def test_open_transaction_is_lost(path):
+    _crash(
+        path,
+        """
+        db.execute("INSERT INTO a (id, v) VALUES (1, 1)")
+        db.execute("BEGIN")
+        db.execute("INSERT INTO a (id, v) VALUES (2, 2)")
+        db.execute("DELETE FROM a WHERE id = 1")
+        """,
+    )
+    db = MiniDB(str(path), enable_auth=False)
+    assert db.recovery["replayed"] == 1
+    assert db.execute("SELECT * FROM a") == [{"id": 1, "v": 1}]
+    db.close()
+
+
+def test_transaction_without_commit_marker_is_discarded(path):
+    _crash(
+        path,
+        """
+        db.execute("BEGIN")
+        db.execute("INSERT INTO a (id, v) VALUES (1, 1)")
+        db.execute("INSERT INTO b (id, v) VALUES (1, 1)")
+        db.execute("COMMIT")
+        """,
+    )
+    wal = os.path.join(path, WAL_FILENAME)
+    with open(wal, "rb") as f:
+        lines = f.readlines()
+    assert b'"op":"commit"' in lines[-1]
+    with open(wal, "wb") as f:
+        f.writelines(lines[:-1])  # the crash came before the marker reached the disk
+    db = MiniDB(str(path), enable_auth=False)
+    assert db.recovery["discarded_uncommitted"] == 2
+    assert db.row_count("a") == 0
+    assert db.row_count("b") == 0
+    db.close()
+
+
+@pytest.mark.parametrize("storage_format", ["json", "paged"])
+def test_interrupted_checkpoint_is_finished(tmp_path, storage_format):
+    db = MiniDB(str(tmp_path), enable_auth=False, storage_format=storage_format)
+    db.execute("CREATE TABLE a (id INT PRIMARY KEY, v INT)")
+    db.execute("CREATE TABLE b (id INT PRIMARY KEY, v INT)")
+    db.close()
+    _crash(
+        tmp_path,
+        """
+        redo = storage._redo_install
+
+        def crash_midway(persistence_dir, steps):
+            redo(persistence_dir, steps[:1])
+            os._exit(0)
+
+        storage._redo_install = crash_midway
+        for i in range(20):
+            db.execute(f"INSERT INTO a (id, v) VALUES ({i}, {i})")
+            db.execute(f"INSERT INTO b (id, v) VALUES ({i}, {-i})")
+        db.checkpoint()
+        """,
+    )
+    db = MiniDB(str(tmp_path), enable_auth=False, storage_format=storage_format)
+    assert db.recovery["checkpoint_redone"]
+    assert db.row_count("a") == 20
+    assert db.row_count("b") == 20
+    assert db.execute("SELECT v FROM b WHERE id = 7") == [{"v": -7}]
+    db.close()
@@ -0,0 +1,69 @@
+import threading
+
+from minidb.registry import DatabaseRegistry
+
+
+def _fill(db, rows):
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, v STRING)")
+    db.bulk_load("t", ({"id": i, "v": "x"} for i in range(rows)))
+
+
+def test_handles_are_reused(tmp_path):
+    registry = DatabaseRegistry(enable_auth=False, checkpoint_interval=5)
+    with registry.open(str(tmp_path / "a")) as db:
+        _fill(db, 10)
+        first = db
+    for i in range(20):
+        # Background checkpoints rewrite the directory; that is no reason to reopen it.
+        with registry.open(str(tmp_path / "a")) as db:
+            db.execute(f"INSERT INTO t (id, v) VALUES ({100 + i}, 'y')")
+    with registry.open(str(tmp_path / "a")) as db:
+        assert db is first
+        assert db.row_count("t") == 30
+    assert registry.stats()["misses"] == 1
+    assert registry.stats()["invalidations"] == 0
+    registry.close()
+
+
+def test_threads_share_a_handle_at_once(tmp_path):
+    registry = DatabaseRegistry(enable_auth=False)
+    inside = threading.Barrier(2, timeout=5)
+
+    def request():
+        with registry.open(str(tmp_path)) as db:
+            inside.wait()  # both requests hold the database together
+            db.list_tables()
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not inside.broken
+    registry.close()
+
+
+def test_eviction_closes_least_recently_used_idle_handles(tmp_path):
+    registry = DatabaseRegistry(memory_budget=10_000, enable_auth=False)
+    with registry.open(str(tmp_path / "a")) as db:
+        _fill(db, 100)
+    assert registry.stats()["open"] == 1  # over budget (about 18 kB), but the latest is kept
+    with registry.open(str(tmp_path / "b")) as b:
+        _fill(b, 10)
+        assert registry.stats()["open"] == 1  # "a" went when "b" was opened
+    with registry.open(str(tmp_path / "a")) as db:
+        assert db.row_count("t") == 100
+    assert registry.stats()["misses"] == 3
+    registry.close()
+
+
+def test_invalidate_waits_for_users(tmp_path):
+    registry = DatabaseRegistry(enable_auth=False)
+    with registry.open(str(tmp_path)) as db:
+        _fill(db, 5)
+        registry.invalidate(str(tmp_path))
+        assert db.row_count("t") == 5
+    with registry.open(str(tmp_path)) as reopened:
+        assert reopened is not db
+        assert reopened.row_count("t") == 5
+    registry.close()
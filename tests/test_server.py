@@ -0,0 +1,73 @@
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from minidb import protocol
+from minidb.client import Client
+from minidb.errors import AuthError, MiniDBError
+from minidb.server import MiniDBServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    srv = MiniDBServer(str(tmp_path), auth={"open": False})
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(srv.start("127.0.0.1:0"), loop).result()
+    srv.address = srv.addresses[0][:2]
+    # The first admin is made in-process, as an operator would with repl.py.
+    srv.open_database("app").db.register_user("root", "pw", is_admin=1)
+    yield srv
+    asyncio.run_coroutine_threadsafe(srv.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_client_cannot_turn_auth_off(server):
+    with socket.create_connection(server.address) as s:
+        s.sendall(protocol.encode({"id": 1, "op": "open", "db": "app", "enable_auth": False}))
+        assert protocol.recv_message(s)["result"] == {"enable_auth": True}
+        s.sendall(protocol.encode({"id": 2, "op": "execute", "sql": "SELECT * FROM users"}))
+        assert protocol.recv_message(s)["error"][0] == "AuthError"
+
+
+def test_auth_setting_covers_directories_below(server):
+    with Client(server.address, "open/notes") as c:
+        assert not c.enable_auth
+        c.execute("CREATE TABLE notes (id INT PRIMARY KEY)")
+        assert c.list_tables() == ["notes"]
+    with Client(server.address, "app") as c:
+        assert c.enable_auth
+
+
+def test_only_an_admin_registers_admins(server):
+    with Client(server.address, "app") as c:
+        with pytest.raises(AuthError):
+            c.register_user("mallory", "pw", is_admin=1)
+        c.register_user("bob", "pw")
+        bob = c.login("bob", "pw")
+        with pytest.raises(AuthError):
+            c.register_user("mallory", "pw", is_admin=1, session_token=bob)
+        with pytest.raises(AuthError):
+            c.login("mallory", "pw")
+        root = c.login("root", "pw")
+        c.register_user("alice", "pw", is_admin=1, session_token=root)
+        alice = c.login("alice", "pw")
+        assert len(c.execute("SELECT * FROM users", alice)) == 3
+        assert c.execute("SELECT is_admin FROM users WHERE username = 'bob'", alice) == [{"is_admin": 0}]
+
+
+def test_maintenance_calls_need_a_session(server):
+    with Client(server.address, "app") as c:
+        for call in (c.checkpoint, c.table_versions, lambda: c.next_id("users")):
+            with pytest.raises(AuthError):
+                call()
+        token = c.login("root", "pw")
+        c.checkpoint(token)
+        assert "users" in c.table_versions(token)
+        assert c.next_id("users", token) == 2
+        with pytest.raises(MiniDBError, match="Unknown operation"):
+            c._call("next_int_id", table="users")
@@ -0,0 +1,94 @@
+import itertools
+import threading
+
+import pytest
+
+from minidb import MiniDB
+
+QUERIES = [
+    "SELECT id, v FROM t",
+    "SELECT id, v FROM t WHERE k = 1",
+    "SELECT id, v FROM t WHERE k > 0 ORDER BY k",
+    "SELECT id, v, name FROM t JOIN u ON k = kid",
+]
+
+
+@pytest.fixture(params=list(itertools.product(["row", "columnar"], ["", "USING HASH", "USING BTREE"])))
+def db(tmp_path, request):
+    layout, index = request.param
+    db = MiniDB(str(tmp_path), enable_auth=False, table_layout=layout)
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, k INT, v STRING)")
+    db.execute(f"CREATE INDEX t_k ON t (k) {index}")
+    db.execute("CREATE TABLE u (kid INT PRIMARY KEY, name STRING)")
+    db.executemany("INSERT INTO t (id, k, v) VALUES (?, ?, ?)", [(i, i % 3, "old") for i in range(300)])
+    db.executemany("INSERT INTO u (kid, name) VALUES (?, ?)", [(k, f"k{k}") for k in range(3)])
+    yield db
+    db.close()
+
+
+def _write(db):
+    # Runs in another thread while a query is half read; it must not wait for the query.
+    def writer():
+        db.execute("UPDATE t SET v = 'new' WHERE k = 1")
+        db.execute("UPDATE t SET k = 2 WHERE id < 50")
+        db.execute("DELETE FROM t WHERE id > 250")
+        db.execute("INSERT INTO t (id, k, v) VALUES (1000, 1, 'new')")
+        db.execute("BEGIN")
+        db.execute("UPDATE t SET v = 'rolled back' WHERE k = 0")
+        db.execute("DELETE FROM t WHERE k = 2")
+        db.execute("ROLLBACK")
+        db.execute("UPDATE u SET name = 'new' WHERE kid = 1")
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "a writer waited for a streaming query"
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_stream_reads_one_snapshot(db, sql):
+    before = db.execute(sql)
+    rows = db.execute_iter(sql)
+    head = list(itertools.islice(rows, 10))
+    _write(db)
+    assert head + list(rows) == before
+    assert db.execute(sql) != before
+
+
+def test_saved_versions_go_with_the_last_snapshot(db):
+    table = db.catalog.get_table("t")
+    first = db.execute_iter("SELECT id FROM t")
+    next(first)
+    db.execute("UPDATE t SET v = 'a'")
+    second = db.execute_iter("SELECT v FROM t")
+    next(second)
+    db.execute("UPDATE t SET v = 'b'")
+    assert len(table._history) == 300
+    first.close()
+    # Only the versions the second snapshot can still see are left.
+    assert all(len(versions) == 1 for versions in table._history.values())
+    assert {r["v"] for r in second} == {"a"}
+    assert not table._history
+    assert {r["v"] for r in db.execute("SELECT v FROM t")} == {"b"}
+
+
+def test_scans_see_whole_statements(db):
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        while not stop.is_set():
+            seen = {r["v"] for r in db.execute_iter("SELECT v FROM t")}
+            if len(seen) != 1:
+                errors.append(seen)
+
+    db.execute("UPDATE t SET v = '0'")
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for n in range(1, 30):
+        db.execute(f"UPDATE t SET v = '{n}'")
+    stop.set()
+    for t in threads:
+        t.join()
+    assert errors == []
@@ -0,0 +1,190 @@
+import itertools
+import random
+
+import pytest
+
+from minidb import MiniDB
+from minidb.errors import ConstraintViolation
+
+LAYOUTS = ["row", "columnar"]
+FORMATS = ["json", "paged"]
+INDEXES = ["", "USING HASH", "USING BTREE", None]  # None: no index on k
+
+
+def _open(path, layout, storage_format):
+    return MiniDB(str(path), enable_auth=False, table_layout=layout, storage_format=storage_format, checkpoint_interval=40)
+
+
+def _create(db, index):
+    db.execute("CREATE TABLE t (id INT PRIMARY KEY, u INT UNIQUE, k INT, s STRING)")
+    if index is not None:
+        db.execute(f"CREATE INDEX t_k ON t (k) {index}")
+
+
+def _ids(db, where):
+    return sorted(r["id"] for r in db.execute(f"SELECT id FROM t WHERE {where}"))
+
+
+@pytest.mark.parametrize("layout,storage_format,index", list(itertools.product(LAYOUTS, FORMATS, INDEXES)))
+def test_rollback_restores_rows_and_indexes(tmp_path, layout, storage_format, index):
+    db = _open(tmp_path, layout, storage_format)
+    _create(db, index)
+    for i in range(10):
+        db.execute(f"INSERT INTO t (id, u, k, s) VALUES ({i}, {i}, {i % 3}, 's{i}')")
+    before = db.execute("SELECT * FROM t")
+    db.execute("BEGIN")
+    db.execute("INSERT INTO t (id, u, k, s) VALUES (10, 10, 7, 'new')")
+    db.execute("UPDATE t SET k = 7, u = 20 WHERE id = 1")
+    db.execute("DELETE FROM t WHERE k = 2")
+    assert _ids(db, "k = 7") == [1, 10]
+    db.execute("ROLLBACK")
+    assert db.execute("SELECT * FROM t") == before
+    assert _ids(db, "k = 7") == []
+    assert _ids(db, "k = 2") == [2, 5, 8]
+    assert _ids(db, "k > 0") == [1, 2, 4, 5, 7, 8]
+    assert _ids(db, "u = 1") == [1]
+    assert _ids(db, "u = 20") == []
+    # The unique keys the transaction took and gave back are free again, and those it
+    # deleted are taken again.
+    db.execute("INSERT INTO t (id, u, k, s) VALUES (10, 20, 0, 'again')")
+    with pytest.raises(ConstraintViolation):
+        db.execute("INSERT INTO t (id, u, k, s) VALUES (11, 2, 0, 'dup')")
+    with pytest.raises(ConstraintViolation):
+        db.execute("INSERT INTO t (id, u, k, s) VALUES (5, 30, 0, 'dup')")
+    db.close()
+    db = _open(tmp_path, layout, storage_format)
+    assert len(db.execute("SELECT * FROM t")) == 11
+    assert _ids(db, "k = 2") == [2, 5, 8]
+    db.close()
+
+
+def test_commit_survives_reopen(tmp_path):
+    db = _open(tmp_path, "row", "json")
+    _create(db, "")
+    with db.transaction():
+        db.execute("INSERT INTO t (id, u, k, s) VALUES (1, 1, 1, 'a')")
+        db.execute("INSERT INTO t (id, u, k, s) VALUES (2, 2, 1, 'b')")
+        db.execute("DELETE FROM t WHERE id = 1")
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute("INSERT INTO t (id, u, k, s) VALUES (3, 3, 1, 'c')")
+            raise RuntimeError
+    db.close(checkpoint=False)
+    db = _open(tmp_path, "row", "json")
+    assert db.execute("SELECT id, s FROM t WHERE k = 1") == [{"id": 2, "s": "b"}]
+    db.close()
+
+
+class _Model:
+    # The table as a dict from id to row, with the same UNIQUE rules.
+    def __init__(self):
+        self.rows = {}
+
+    def check_unique(self, rows):
+        for col in ("id", "u"):
+            values = [r[col] for r in rows.values() if r[col] is not None]
+            if len(values) != len(set(values)):
+                raise ConstraintViolation(col)
+
+    def insert(self, row):
+        rows = dict(self.rows)
+        rows[row["id"]] = row
+        if row["id"] in self.rows:
+            raise ConstraintViolation("id")
+        self.check_unique(rows)
+        self.rows = rows
+
+    def update(self, match, changes):
+        rows = {i: ({**r, **changes} if match(r) else r) for i, r in self.rows.items()}
+        self.check_unique(rows)
+        self.rows = rows
+
+    def delete(self, match):
+        self.rows = {i: r for i, r in self.rows.items() if not match(r)}
+
+    def select(self, match):
+        return sorted(i for i, r in self.rows.items() if match(r))
+
+
+def _condition(rng):
+    col = rng.choice(["id", "k", "u"])
+    op = rng.choice(["=", "=", "<", ">"])
+    v = rng.randrange(-1, 25)
+    match = {
+        "=": lambda r: r[col] == v,
+        "<": lambda r: r[col] is not None and r[col] < v,
+        ">": lambda r: r[col] is not None and r[col] > v,
+    }[op]
+    return f"{col} {op} {v}", match
+
+
+def _run(path, layout, storage_format, index, seed):
+    rng = random.Random(seed)
+    db = _open(path, layout, storage_format)
+    _create(db, index)
+    committed, model = _Model(), _Model()
+    in_txn = False
+    for step in range(150):
+        roll = rng.random()
+        where, match = _condition(rng)
+        if roll < 0.35:
+            row = {"id": rng.randrange(25), "u": rng.choice([None, rng.randrange(25)]), "k": rng.randrange(6)}
+            u = "NULL" if row["u"] is None else row["u"]
+            expect_error = _fails(model.insert, row)
+            sql = f"INSERT INTO t (id, u, k, s) VALUES ({row['id']}, {u}, {row['k']}, 'x')"
+        elif roll < 0.5:
+            changes = rng.choice([{"k": rng.randrange(6)}, {"u": rng.randrange(25)}])
+            expect_error = _fails(model.update, match, changes)
+            col, value = next(iter(changes.items()))
+            sql = f"UPDATE t SET {col} = {value} WHERE {where}"
+        elif roll < 0.6:
+            expect_error = _fails(model.delete, match)
+            sql = f"DELETE FROM t WHERE {where}"
+        else:
+            expect_error = None
+            sql = None
+        if sql is not None:
+            if expect_error:
+                with pytest.raises(ConstraintViolation):
+                    db.execute(sql)
+            else:
+                db.execute(sql)
+        elif roll < 0.8:
+            assert _ids(db, where) == model.select(match), (seed, step, where)
+        elif roll < 0.88 and not in_txn:
+            db.execute("BEGIN")
+            in_txn = True
+        elif roll < 0.94 and in_txn:
+            if rng.random() < 0.5:
+                db.execute("COMMIT")
+                committed.rows = dict(model.rows)
+            else:
+                db.execute("ROLLBACK")
+                model.rows = dict(committed.rows)
+            in_txn = False
+        elif roll >= 0.97 and not in_txn:
+            db.close(checkpoint=rng.random() < 0.5)
+            db = _open(path, layout, storage_format)
+        if not in_txn:
+            committed.rows = dict(model.rows)
+    assert _ids(db, "id > -1") == model.select(lambda r: True)
+    db.close()
+    db = _open(path, layout, storage_format)
+    assert _ids(db, "id > -1") == committed.select(lambda r: True)
+    for k in range(6):
+        assert _ids(db, f"k = {k}") == committed.select(lambda r: r["k"] == k)
+    db.close()
+
+
+def _fails(change, *args):
+    try:
+        change(*args)
+    except ConstraintViolation:
+        return True
+    return False
+
+
+@pytest.mark.parametrize("layout,storage_format,index", list(itertools.product(LAYOUTS, FORMATS, INDEXES)))
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_model(tmp_path, layout, storage_format, index, seed):
+    _run(tmp_path, layout, storage_format, index, seed)
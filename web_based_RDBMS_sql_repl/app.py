@@ -4,14 +4,20 @@ import os
 import sys
 import json
 import re
-from typing import Any, Dict, List
+import threading
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 from flask import Flask, jsonify, render_template_string, request, session
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from minidb import MiniDB
+from minidb.client import Client
 from minidb.errors import MiniDBError, ParseError
+from minidb.pool import ClientPool
+from minidb.registry import DatabaseRegistry
 
 
 app = Flask(__name__)
@@ -21,6 +27,14 @@ _DEFAULT_DB_NAME = "default"
 _DB_ROOT_DIR = os.environ.get("SQLREPL_DBS_ROOT", "./web_based_RDBMS_sql_repl_databases")
 _DEFAULT_DB_DIR = os.environ.get("SQLREPL_DEFAULT_DIR", "./web_based_RDBMS_sql_repl_data")
 _AUTH_DB_DIR = os.environ.get("SQLREPL_AUTH_DIR", "./web_based_RDBMS_sql_repl_auth")
+_DB_CACHE_BYTES = int(os.environ.get("SQLREPL_DB_CACHE_BYTES", str(64 * 1024 * 1024)))
+# With MINIDB_SERVER set, databases live in one shared python -m minidb.server (started
+# from this directory) and are reached through a connection pool per database. The server
+# must serve the REPL databases without auth (see README).
+_SERVER = os.environ.get("MINIDB_SERVER")
+_POOL_SIZE = int(os.environ.get("MINIDB_POOL_SIZE", "4"))
+# Rows of one SELECT returned to the browser at most.
+_MAX_ROWS = int(os.environ.get("SQLREPL_MAX_ROWS", "10000"))
 
 
 def _normalize_db_name(name: str) -> str:
@@ -75,12 +89,52 @@ def _require_login_for_db(name: str) -> None:
         raise MiniDBError("Login required for non-default databases")
 
 
-def _get_db() -> MiniDB:
+_db_registry = DatabaseRegistry(memory_budget=_DB_CACHE_BYTES, enable_auth=False)
+_pools: Dict[str, ClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+@contextmanager
+def _open_db(db_dir: str) -> Iterator[Union[MiniDB, ClientPool]]:
+    if not _SERVER:
+        with _db_registry.open(db_dir) as db:
+            yield db
+        return
+    with _pools_lock:
+        pool = _pools.get(db_dir)
+        if pool is None:
+            pool = _pools[db_dir] = ClientPool(_SERVER, db_dir, size=_POOL_SIZE)
+    yield pool
+
+
+def _get_db():
     name = _current_db_name()
-    return MiniDB(_db_dir(name), enable_auth=False)
+    return _open_db(_db_dir(name))
+
+
+@contextmanager
+def _open_request_db(db_dir: str) -> Iterator[Union[MiniDB, Client]]:
+    # The statements of one request share a handle (in server mode, one pooled connection),
+    # since transactions belong to the thread or connection. A transaction the request left
+    # open is rolled back when it ends.
+    with _open_db(db_dir) as db:
+        if isinstance(db, ClientPool):
+            with db.connection() as client:
+                try:
+                    yield client
+                finally:
+                    client.rollback()
+            return
+        try:
+            yield db
+        finally:
+            db.rollback()
 
 
-_auth_db = MiniDB(_AUTH_DB_DIR, enable_auth=True)
+if _SERVER:
+    _auth_db: Union[MiniDB, ClientPool] = ClientPool(_SERVER, _AUTH_DB_DIR, size=_POOL_SIZE)
+else:
+    _auth_db = MiniDB(_AUTH_DB_DIR, enable_auth=True)
 
 
 INDEX_HTML = """
@@ -323,7 +377,7 @@ INDEX_HTML = """
               <div class="muted">Supports multiple statements separated by <code>;</code></div>
             </div>
             <textarea id="sql">-- MiniDB SQL Workshop (run step-by-step)
--- Supported: CREATE TABLE, INSERT, SELECT, SELECT JOIN, UPDATE, DELETE
+-- Supported: CREATE TABLE, CREATE INDEX, INSERT, SELECT, SELECT JOIN, UPDATE, DELETE
 -- Types: INT, STRING, FLOAT
 -- Constraints: PRIMARY, UNIQUE
 
@@ -348,18 +402,19 @@ INSERT INTO products (id, name, price) VALUES (12, 'Monitor', 150.00);
 -- Indexing demo dataset (more rows):
 -- MiniDB maintains an internal index for PRIMARY/UNIQUE columns.
 -- Here: employees.id (PRIMARY/UNIQUE) and employees.email (UNIQUE) are indexed.
-INSERT INTO employees (id, email, dept, salary) VALUES (1, 'e1@corp.com', 'ENG', 120.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (2, 'e2@corp.com', 'ENG', 121.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (3, 'e3@corp.com', 'ENG', 122.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (4, 'e4@corp.com', 'HR', 90.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (5, 'e5@corp.com', 'HR', 91.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (6, 'e6@corp.com', 'SALES', 80.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (7, 'e7@corp.com', 'SALES', 82.5);
-INSERT INTO employees (id, email, dept, salary) VALUES (8, 'e8@corp.com', 'OPS', 95.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (9, 'e9@corp.com', 'OPS', 96.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (10, 'e10@corp.com', 'ENG', 130.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (11, 'e11@corp.com', 'ENG', 131.0);
-INSERT INTO employees (id, email, dept, salary) VALUES (12, 'e12@corp.com', 'HR', 92.0);
+INSERT INTO employees (id, email, dept, salary) VALUES
+  (1, 'e1@corp.com', 'ENG', 120.0),
+  (2, 'e2@corp.com', 'ENG', 121.0),
+  (3, 'e3@corp.com', 'ENG', 122.0),
+  (4, 'e4@corp.com', 'HR', 90.0),
+  (5, 'e5@corp.com', 'HR', 91.0),
+  (6, 'e6@corp.com', 'SALES', 80.0),
+  (7, 'e7@corp.com', 'SALES', 82.5),
+  (8, 'e8@corp.com', 'OPS', 95.0),
+  (9, 'e9@corp.com', 'OPS', 96.0),
+  (10, 'e10@corp.com', 'ENG', 130.0),
+  (11, 'e11@corp.com', 'ENG', 131.0),
+  (12, 'e12@corp.com', 'HR', 92.0);
 
 -- Orders (total is precomputed here; MiniDB doesn't support expressions)
 INSERT INTO orders (id, customer_id, product_id, qty, total) VALUES (100, 1, 10, 2, 91.00);
@@ -403,6 +458,14 @@ SELECT * FROM employees WHERE id = 10;
 SELECT * FROM employees WHERE email = 'e7@corp.com';
 -- Non-indexed lookup (dept is NOT UNIQUE): this requires scanning matching rows.
 SELECT * FROM employees WHERE dept = 'ENG';
+-- Secondary (non-unique) index: the same lookup now reads only the matching rows.
+CREATE INDEX employees_dept ON employees (dept);
+SELECT * FROM employees WHERE dept = 'ENG';
+DROP INDEX employees_dept;
+-- Ordered (BTREE) index: serves range filters with < and >.
+CREATE INDEX employees_salary ON employees (salary) USING BTREE;
+SELECT * FROM employees WHERE salary > 100;
+DROP INDEX employees_salary;
 
 -- 10) CLEANUP (remove the seeded data + tables)
 -- You can either DELETE rows or DROP TABLE. Here we DROP TABLE.
@@ -492,6 +555,7 @@ SELECT * FROM employees;
           <div>
             <div><code>CREATE TABLE t (id INT PRIMARY UNIQUE, name STRING, price FLOAT);</code></div>
             <div><code>INSERT INTO t (id, name, price) VALUES (1, 'A', 9.99);</code></div>
+            <div><code>INSERT INTO t (id, name, price) VALUES (2, 'B', 1.5), (3, 'C', 2.0);</code></div>
             <div><code>SELECT * FROM t;</code></div>
             <div><code>SELECT * FROM t WHERE id = 1;</code></div>
             <div><code>UPDATE t SET price=10.5 WHERE id=1;</code></div>
@@ -559,7 +623,8 @@ SELECT * FROM employees;
           const cols = Object.keys(rows[0]);
           const head = cols.map(c => `<th>${escapeHtml(c)}</th>`).join('');
           const body = rows.map(row => `<tr>${cols.map(c => `<td>${escapeHtml(row[c])}</td>`).join('')}</tr>`).join('');
-          return `<table><tr>${head}</tr>${body}</table>`;
+          const more = r.truncated ? `<div class="ok">Showing the first ${rows.length} rows</div>` : '';
+          return `<table><tr>${head}</tr>${body}</table>${more}`;
         }
         return `<div class="ok">OK</div>`;
       }
@@ -779,44 +844,94 @@ def index():
     return render_template_string(INDEX_HTML)
 
 
+def _is_select(stmt: str) -> bool:
+    return stmt.lstrip()[:7].upper() == "SELECT "
+
+
+def _statement_result(stmt: str, db: Union[MiniDB, Client]) -> Dict[str, Any]:
+    if not _is_select(stmt):
+        return _result_payload(db.execute(stmt))
+    rows = db.execute_iter(stmt)
+    try:
+        page = list(islice(rows, _MAX_ROWS + 1))
+    finally:
+        rows.close()
+    result: Dict[str, Any] = {"kind": "rows", "rows": page[:_MAX_ROWS]}
+    if len(page) > _MAX_ROWS:
+        result["truncated"] = True
+    return result
+
+
+_ROLLED_BACK = {"kind": "message", "message": "Open transaction rolled back"}
+
+
+def _run_planned(planned: List[Tuple[Optional[str], Any]]) -> List[Dict[str, Any]]:
+    # The whole batch runs before the response is sent, so a slow or stalled browser holds
+    # no snapshot, lock, pooled connection or transaction; _MAX_ROWS bounds what that keeps
+    # in memory.
+    results: List[Dict[str, Any]] = []
+    with ExitStack() as stack:
+        db_dir: Optional[str] = None
+        db: Optional[Union[MiniDB, Client]] = None
+        for stmt, item in planned:
+            if stmt is not None and db is not None and item != db_dir:
+                # One database is open at a time; USE of another one ends the first.
+                if db.rollback():
+                    results.append(_ROLLED_BACK)
+                stack.close()
+                db_dir, db = None, None
+            if stmt is None:
+                results.append(item)
+                continue
+            try:
+                if db is None:
+                    db = stack.enter_context(_open_request_db(item))
+                    db_dir = item
+                results.append(_statement_result(stmt, db))
+            except Exception as e:
+                results.append({"kind": "error", "message": str(e)})
+        if db is not None and db.rollback():
+            results.append(_ROLLED_BACK)
+    return results
+
+
 @app.post("/api/execute")
 def api_execute():
     data = request.get_json(silent=True) or {}
     sql = str(data.get("sql") or "")
     sql = _strip_line_comments(sql)
     statements = _split_statements(sql)
-    results: List[Dict[str, Any]] = []
+    planned: List[Tuple[Optional[str], Any]] = []
 
+    # Database commands only change the session cookie; they are answered in order with
+    # the SQL results.
     for stmt in statements:
         try:
             maybe = _handle_sql_db_statement(stmt)
             if maybe is not None:
-                results.append(_result_payload(maybe))
+                planned.append((None, _result_payload(maybe)))
                 continue
-
-            db = _get_db()
-            res = db.execute(stmt)
-            results.append(_result_payload(res))
+            planned.append((stmt, _db_dir(_current_db_name())))
         except (MiniDBError, ParseError) as e:
-            results.append({"kind": "error", "message": str(e)})
+            planned.append((None, {"kind": "error", "message": str(e)}))
         except Exception as e:
-            results.append({"kind": "error", "message": str(e)})
+            planned.append((None, {"kind": "error", "message": str(e)}))
 
-    return jsonify({"results": results})
+    return jsonify({"results": _run_planned(planned)})
 
 
 @app.get("/api/state")
 def api_state():
-    db = _get_db()
     tables = []
-    for name in db.catalog.list_tables():
-        t = db.catalog.get_table(name)
-        try:
-            all_rows = t.select(["*"])
-        except Exception:
-            all_rows = []
-        sample = all_rows[:25]
-        tables.append({"name": name, "row_count": len(all_rows), "sample": sample})
+    with _get_db() as db:
+        for name in db.list_tables():
+            try:
+                sample = db.execute(f"SELECT * FROM {name} LIMIT 25")
+                row_count = db.row_count(name)
+            except Exception:
+                sample = []
+                row_count = 0
+            tables.append({"name": name, "row_count": row_count, "sample": sample})
     username = session.get("username") if isinstance(session.get("username"), str) else None
     return jsonify({"tables": tables, "current_db": _current_db_name(), "username": username})
 
@@ -860,7 +975,7 @@ def api_terminal():
         if op == "logout":
             token = session.get("session_token")
             try:
-                _auth_db.auth.logout(token if isinstance(token, str) else None)
+                _auth_db.logout(token if isinstance(token, str) else None)
             finally:
                 session.pop("session_token", None)
                 session.pop("username", None)
@@ -2,17 +2,42 @@ from __future__ import annotations
 
 import os
 from datetime import date
+from typing import Dict
 
 from flask import Flask, redirect, render_template_string, request, session, url_for
 
 from minidb import MiniDB
 from minidb.errors import MiniDBError
+from minidb.pool import ClientPool
 
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev")
 
-db = MiniDB(os.environ.get("MINIDB_PERSIST_DIR", "./minidb_data"), enable_auth=True)
+# With MINIDB_SERVER set (e.g. "127.0.0.1:7433"), every worker talks to one shared
+# python -m minidb.server through a connection pool instead of opening the files itself.
+_PERSIST_DIR = os.environ.get("MINIDB_PERSIST_DIR", "./minidb_data")
+_SERVER = os.environ.get("MINIDB_SERVER")
+if _SERVER:
+    db = ClientPool(_SERVER, _PERSIST_DIR, size=int(os.environ.get("MINIDB_POOL_SIZE", "8")))
+else:
+    db = MiniDB(_PERSIST_DIR, enable_auth=True)
+
+_BILL_BY_ID = db.prepare("SELECT * FROM bills WHERE id = ?")
+_ALL_BILLS = db.prepare("SELECT * FROM bills ORDER BY due_date, id")
+_ALL_PAYMENTS = db.prepare("SELECT * FROM payments ORDER BY payment_date DESC, id DESC")
+_PAID_BY_BILL = db.prepare("SELECT bill_id, SUM(amount) AS paid FROM payments GROUP BY bill_id")
+_PAID_FOR_BILL = db.prepare("SELECT SUM(amount) AS paid FROM payments WHERE bill_id = ?")
+_INSERT_BILL = db.prepare(
+    "INSERT INTO bills (id, description, amount, due_date, status) VALUES (?, ?, ?, ?, 'pending')"
+)
+_INSERT_PAYMENT = db.prepare("INSERT INTO payments (id, bill_id, amount, payment_date) VALUES (?, ?, ?, ?)")
+_UPDATE_BILL = db.prepare(
+    "UPDATE bills SET description = :description, amount = :amount, due_date = :due_date, status = :status WHERE id = :id"
+)
+_SET_BILL_STATUS = db.prepare("UPDATE bills SET status = ? WHERE id = ?")
+_DELETE_BILL_PAYMENTS = db.prepare("DELETE FROM payments WHERE bill_id = ?")
+_DELETE_BILL = db.prepare("DELETE FROM bills WHERE id = ?")
 
 
 BASE_TEMPLATE = """
@@ -219,22 +244,39 @@ def _render_page(*, title: str, body: str, username: str = "", show_logout: bool
     )
 
 
-def _init_schema() -> None:
-    try:
-        db.execute(
-            "CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING);",
-            session.get("token"),
-        )
-    except Exception:
-        pass
+# Each table with the indexes created along with it.
+_SCHEMA = {
+    "bills": (
+        "CREATE TABLE bills (id INT PRIMARY, user_id INT, description STRING, amount FLOAT, due_date STRING, status STRING);",
+        "CREATE INDEX bills_user_id ON bills (user_id);",
+    ),
+    "payments": (
+        "CREATE TABLE payments (id INT PRIMARY, user_id INT, bill_id INT, amount FLOAT, payment_date STRING);",
+        "CREATE INDEX payments_user_id ON payments (user_id);",
+        "CREATE INDEX payments_bill_id ON payments (bill_id);",
+    ),
+}
+_schema_ready = False
 
-    try:
-        db.execute(
-            "CREATE TABLE payments (id INT PRIMARY, user_id INT, bill_id INT, amount FLOAT, payment_date STRING);",
-            session.get("token"),
-        )
-    except Exception:
-        pass
+
+def _init_schema() -> None:
+    # DDL needs a session, so the tables are created on the first dashboard request rather
+    # than at startup. Only missing tables are created: DDL takes the database exclusively.
+    # Once both exist, later requests skip the check.
+    global _schema_ready
+    if _schema_ready:
+        return
+    existing = set(db.list_tables())
+    for name, statements in _SCHEMA.items():
+        if name in existing:
+            continue
+        for sql in statements:
+            try:
+                db.execute(sql, session.get("token"))
+            except MiniDBError:
+                # Another worker created it first.
+                pass
+    _schema_ready = set(_SCHEMA) <= set(db.list_tables())
 
 
 def _require_auth():
@@ -253,22 +295,16 @@ def _sum_payments_for_bill(token: str, bill_id: int) -> float:
     if not token:
         return 0.0
     try:
-        payments = db.execute(f"SELECT * FROM payments WHERE bill_id={bill_id};", token)
+        rows = _PAID_FOR_BILL.execute((bill_id,), token)
     except MiniDBError:
         return 0.0
-    total = 0.0
-    for p in payments:
-        try:
-            total += float(p.get("amount") or 0)
-        except Exception:
-            total += 0.0
-    return total
+    return float(rows[0].get("paid") or 0) if rows else 0.0
 
 
 def _recompute_bill_status(token: str, bill_id: int) -> None:
     if not token:
         return
-    bills = db.execute(f"SELECT * FROM bills WHERE id={bill_id};", token)
+    bills = _BILL_BY_ID.execute((bill_id,), token)
     if not bills:
         return
     bill = bills[0]
@@ -278,7 +314,7 @@ def _recompute_bill_status(token: str, bill_id: int) -> None:
         bill_amount = 0.0
     paid_total = _sum_payments_for_bill(token, int(bill.get("id") or bill_id))
     new_status = "paid" if paid_total >= bill_amount and bill_amount > 0 else "unpaid"
-    db.execute(f"UPDATE bills SET status='{new_status}' WHERE id={bill_id};", token)
+    _SET_BILL_STATUS.execute((new_status, bill_id), token)
 
 
 @app.get("/")
@@ -401,7 +437,7 @@ def dashboard():
         view = "bills"
 
     try:
-        bills = db.execute("SELECT * FROM bills;", session.get("token"))
+        bills = _ALL_BILLS.execute((), session.get("token"))
     except MiniDBError as e:
         bills = []
         err = str(e)
@@ -409,23 +445,19 @@ def dashboard():
         err = ""
 
     try:
-        payments = db.execute("SELECT * FROM payments;", session.get("token"))
+        payments = _ALL_PAYMENTS.execute((), session.get("token"))
     except MiniDBError:
         payments = []
 
     bill_desc_by_id = {int(b.get("id")): str(b.get("description") or "") for b in bills if b.get("id") is not None}
 
-    paid_total_by_bill_id: Dict[int, float] = {}
-    for p in payments:
-        try:
-            bid = int(p.get("bill_id"))
-        except Exception:
-            continue
-        try:
-            amt = float(p.get("amount") or 0)
-        except Exception:
-            amt = 0.0
-        paid_total_by_bill_id[bid] = paid_total_by_bill_id.get(bid, 0.0) + amt
+    try:
+        totals = _PAID_BY_BILL.execute((), session.get("token"))
+    except MiniDBError:
+        totals = []
+    paid_total_by_bill_id: Dict[int, float] = {
+        int(t["bill_id"]): float(t.get("paid") or 0) for t in totals if t.get("bill_id") is not None
+    }
 
     last_err = session.pop("last_error", "")
     if err == "" and last_err:
@@ -660,16 +692,11 @@ def add_bill():
         if due_month != "":
             due_date = f"{due_month}-01"
 
-    description_sql = description.replace("'", "''")
-    due_date_sql = due_date.replace("'", "''")
-    amount_sql = amount.replace(",", "").strip()
+    amount = amount.replace(",", "").strip()
 
-    bill_id = db._next_int_id("bills")
     try:
-        db.execute(
-            f"INSERT INTO bills (id, description, amount, due_date, status) VALUES ({bill_id}, '{description_sql}', {amount_sql}, '{due_date_sql}', 'pending');",
-            session.get("token"),
-        )
+        bill_id = db.next_id("bills", session.get("token"))
+        _INSERT_BILL.execute((bill_id, description, amount, due_date), session.get("token"))
     except MiniDBError as e:
         session["last_error"] = str(e)
     except Exception as e:
@@ -685,7 +712,7 @@ def pay_bill(bill_id: int):
 
     token = session.get("token")
     try:
-        owned = db.execute(f"SELECT * FROM bills WHERE id={bill_id};", token)
+        owned = _BILL_BY_ID.execute((bill_id,), token)
     except MiniDBError as e:
         session["last_error"] = str(e)
         return redirect(url_for("dashboard", view="bills"))
@@ -694,16 +721,19 @@ def pay_bill(bill_id: int):
         return redirect(url_for("dashboard", view="bills"))
 
     amt = request.form.get("amount", "").strip()
-    payment_id = db._next_int_id("payments")
     today = date.today().isoformat()
 
-    amt_sql = amt.replace(",", "").strip()
+    amt = amt.replace(",", "").strip()
 
-    db.execute(
-        f"INSERT INTO payments (id, bill_id, amount, payment_date) VALUES ({payment_id}, {bill_id}, {amt_sql}, '{today}');",
-        token,
-    )
-    _recompute_bill_status(token, bill_id)
+    try:
+        payment_id = db.next_id("payments", token)
+        with db.transaction(token):
+            _INSERT_PAYMENT.execute((payment_id, bill_id, amt, today), token)
+            _recompute_bill_status(token, bill_id)
+    except MiniDBError as e:
+        session["last_error"] = str(e)
+    except Exception as e:
+        session["last_error"] = str(e)
     return redirect(url_for("dashboard"))
 
 
@@ -721,19 +751,17 @@ def make_payment():
     except Exception:
         session["last_error"] = "Invalid bill id"
         return redirect(url_for("dashboard", view="payments"))
-    payment_id = db._next_int_id("payments")
     today = date.today().isoformat()
-    amt_sql = amt.replace(",", "").strip()
+    amt = amt.replace(",", "").strip()
     try:
-        owned = db.execute(f"SELECT * FROM bills WHERE id={bid};", token)
+        payment_id = db.next_id("payments", token)
+        owned = _BILL_BY_ID.execute((bid,), token)
         if not owned:
             session["last_error"] = "Bill not found"
             return redirect(url_for("dashboard", view="payments"))
-        db.execute(
-            f"INSERT INTO payments (id, bill_id, amount, payment_date) VALUES ({payment_id}, {bid}, {amt_sql}, '{today}');",
-            token,
-        )
-        _recompute_bill_status(token, bid)
+        with db.transaction(token):
+            _INSERT_PAYMENT.execute((payment_id, bid, amt, today), token)
+            _recompute_bill_status(token, bid)
     except MiniDBError as e:
         session["last_error"] = str(e)
     except Exception as e:
@@ -754,13 +782,11 @@ def update_bill(bill_id: int):
     if status not in {"paid", "unpaid", "pending"}:
         status = "pending"
 
-    description_sql = description.replace("'", "''")
-    due_date_sql = due_date.replace("'", "''")
-    amount_sql = amount.replace(",", "").strip()
+    amount = amount.replace(",", "").strip()
 
     try:
-        db.execute(
-            f"UPDATE bills SET description='{description_sql}', amount={amount_sql}, due_date='{due_date_sql}', status='{status}' WHERE id={bill_id};",
+        _UPDATE_BILL.execute(
+            {"description": description, "amount": amount, "due_date": due_date, "status": status, "id": bill_id},
             session.get("token"),
         )
     except MiniDBError as e:
@@ -776,8 +802,10 @@ def delete_bill(bill_id: int):
     if uid is None:
         return redirect(url_for("login"))
 
-    db.execute(f"DELETE FROM payments WHERE bill_id={bill_id};", session.get("token"))
-    db.execute(f"DELETE FROM bills WHERE id={bill_id};", session.get("token"))
+    token = session.get("token")
+    with db.transaction(token):
+        _DELETE_BILL_PAYMENTS.execute((bill_id,), token)
+        _DELETE_BILL.execute((bill_id,), token)
     return redirect(url_for("dashboard"))
 
 